@@ -0,0 +1,288 @@
+"""Benchmark do transporte local: WebSocket TCP vs socket Unix + memória compartilhada.
+
+Sobe o TARNetServer em um processo filho com o socket Unix local habilitado
+e envia, do processo principal, os mesmos frames por cada transporte:
+
+- tcp: frames binários pelo WebSocket em ws://127.0.0.1 (caminho padrão);
+- ring: frames gravados no anel em memória compartilhada (shared/ring.py),
+  com um aviso por frame no WebSocket sobre o socket Unix.
+
+Mede a CPU por frame do host (este processo) e do servidor (processo filho)
+e a latência do envio até o frame ser processado pelo servidor. Sem
+clientes: só o trecho host -> servidor muda entre os transportes.
+
+Uso:
+    python benchmarks/bench_local.py [--fps 60] [--frame-size 200000]
+        [--duration 5] [--output resultado.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import websockets
+
+# Permite importar server.py e o pacote compartilhado
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'server'))
+sys.path.insert(0, ROOT)
+
+from bench_relay import RESULTS_DIR, git_revision, percentile, process_usage  # noqa: E402
+from shared.protocol import (  # noqa: E402
+    FLAG_KEYFRAME, MSG_SCREEN_FRAME, host_id_to_bytes, pack_frame, unpack_header
+)
+from shared.ring import FrameRing  # noqa: E402
+
+
+def run_server(conn, socket_path):
+    """Processo filho: servidor real (TCP e socket Unix) atendendo pedidos pelo pipe"""
+    from server import TARNetServer
+
+    logging.disable(logging.INFO)
+
+    async def main():
+        server = TARNetServer(host='127.0.0.1', port=0, local_socket=socket_path)
+
+        # Atraso de cada frame (instante no servidor - timestamp do frame)
+        delays = []
+        handle_screen_frame = server.handle_screen_frame
+
+        async def measured(websocket, message):
+            await handle_screen_frame(websocket, message)
+            delays.append(time.time() - unpack_header(message).timestamp)
+
+        server.handle_screen_frame = measured
+
+        def usage():
+            result = process_usage()
+            result['frames'] = sum(host.frames_received for host in server.hosts.values())
+            result['delays'] = len(delays)
+            return result
+
+        def delays_since(start):
+            return delays[start:]
+
+        async with websockets.serve(server.handle_connection, '127.0.0.1', 0,
+                                    **server.serve_options()) as ws_server:
+            local = await server.serve_local()
+            conn.send(ws_server.sockets[0].getsockname()[1])
+            loop = asyncio.get_running_loop()
+            while True:
+                command = await loop.run_in_executor(None, conn.recv)
+                if command == 'usage':
+                    conn.send(usage())
+                elif isinstance(command, tuple) and command[0] == 'delays':
+                    conn.send(delays_since(command[1]))
+                else:
+                    break
+            local.close()
+
+    asyncio.run(main())
+
+
+class LocalHost:
+    """Host sintético que envia frames prontos pelo transporte escolhido"""
+
+    def __init__(self, transport, payloads, fps, ring_size):
+        self.transport = transport
+        self.payloads = payloads
+        self.fps = fps
+        self.ring_size = ring_size
+        self.host_id = str(uuid.uuid4())
+        self.host_id_bytes = host_id_to_bytes(self.host_id)
+        self.ring = None
+        self.frames_sent = 0
+        self.ring_full_waits = 0
+
+    async def connect(self, url, socket_path):
+        if self.transport == 'ring':
+            self.ring = FrameRing.create(self.ring_size)
+            self.websocket = await websockets.unix_connect(socket_path, max_size=None,
+                                                           compression=None)
+        else:
+            self.websocket = await websockets.connect(url, max_size=None, compression=None)
+        await self.websocket.send(json.dumps({
+            'type': 'register_host',
+            'host_id': self.host_id,
+            'ring': self.ring.name if self.ring else None
+        }))
+        registered = json.loads(await self.websocket.recv())
+        if self.ring and not registered.get('ring'):
+            raise SystemExit("O servidor não aceitou o anel em memória compartilhada")
+        # Descarta comandos do servidor (set_layers, viewer_demand...)
+        self._drain = asyncio.create_task(self._discard())
+
+    async def _discard(self):
+        try:
+            async for _ in self.websocket:
+                pass
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def send(self, payload):
+        timestamp = time.time()
+        if self.ring is None:
+            await self.websocket.send(pack_frame(MSG_SCREEN_FRAME, self.host_id_bytes,
+                                                 self.frames_sent, timestamp, payload,
+                                                 FLAG_KEYFRAME))
+            return
+        while not self.ring.write_frame(MSG_SCREEN_FRAME, self.host_id_bytes, self.frames_sent,
+                                        timestamp, payload, FLAG_KEYFRAME):
+            self.ring_full_waits += 1
+            await self.websocket.send(self.ring.doorbell())
+            await asyncio.sleep(0.001)
+        await self.websocket.send(self.ring.doorbell())
+
+    async def run(self, until):
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.fps
+        deadline = loop.time()
+        while loop.time() < until:
+            await self.send(self.payloads[self.frames_sent % len(self.payloads)])
+            self.frames_sent += 1
+            deadline += interval
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    async def close(self):
+        await self.websocket.close()
+        self._drain.cancel()
+        if self.ring is not None:
+            self.ring.close()
+
+
+async def measure(transport, url, socket_path, args, payloads, usage, delays_since):
+    """Envia frames por um transporte durante `duration` segundos e retorna os números"""
+    loop = asyncio.get_running_loop()
+    host = LocalHost(transport, payloads, args.fps, args.ring_size)
+    await host.connect(url, socket_path)
+
+    # Aquecimento fora da medição
+    await host.run(loop.time() + args.warmup)
+    await asyncio.sleep(0.2)
+    host.frames_sent = 0
+
+    server_before = await loop.run_in_executor(None, usage)
+    host_before = time.process_time()
+    started = loop.time()
+    await host.run(started + args.duration)
+    host_cpu = time.process_time() - host_before
+    # Espera os frames em trânsito serem processados
+    await asyncio.sleep(0.5)
+    server_after = await loop.run_in_executor(None, usage)
+    await host.close()
+
+    frames = host.frames_sent
+    received = server_after['frames'] - server_before['frames']
+    server_cpu = server_after['cpu'] - server_before['cpu']
+    delays = await loop.run_in_executor(None, delays_since, server_before['delays'])
+
+    def us_per_frame(cpu):
+        return round(cpu / frames * 1e6, 1) if frames else None
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'frames_sent': frames,
+        'frames_received': received,
+        'host_cpu_us_per_frame': us_per_frame(host_cpu),
+        'server_cpu_us_per_frame': us_per_frame(server_cpu),
+        'total_cpu_us_per_frame': us_per_frame(host_cpu + server_cpu),
+        'delay_p50_ms': ms(percentile(delays, 0.50)),
+        'delay_p99_ms': ms(percentile(delays, 0.99)),
+        'ring_full_waits': host.ring_full_waits if transport == 'ring' else None
+    }
+
+
+def print_results(results):
+    transports = list(results)
+    print(f"{'métrica':<26}" + ''.join(f" {name:>12}" for name in transports))
+    for key in results[transports[0]]:
+        print(f"{key:<26}" + ''.join(f" {str(results[name][key]):>12}" for name in transports))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket TCP vs socket Unix + memória compartilhada")
+    parser.add_argument('--fps', type=float, default=60.0)
+    parser.add_argument('--frame-size', type=int, default=200000, help="Bytes por frame")
+    parser.add_argument('--duration', type=float, default=5.0, help="Segundos medidos por transporte")
+    parser.add_argument('--warmup', type=float, default=1.0, help="Segundos antes da medição")
+    parser.add_argument('--ring-size', type=int, default=32 * 1024 * 1024, help="Bytes do anel")
+    parser.add_argument('--output', help="Arquivo JSON do resultado (padrão: benchmarks/results/)")
+    args = parser.parse_args()
+
+    # Alguns payloads diferentes para não repetir sempre o mesmo buffer
+    payloads = [os.urandom(args.frame_size) for _ in range(8)]
+    socket_path = os.path.join(tempfile.mkdtemp(prefix='tarnet-bench-'), 'server.sock')
+
+    parent, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=run_server, args=(child, socket_path), daemon=True)
+    server.start()
+    port = parent.recv()
+
+    def usage():
+        parent.send('usage')
+        return parent.recv()
+
+    def delays_since(start):
+        parent.send(('delays', start))
+        return parent.recv()
+
+    async def run_all():
+        url = f"ws://127.0.0.1:{port}"
+        return {
+            transport: await measure(transport, url, socket_path, args, payloads, usage,
+                                      delays_since)
+            for transport in ('tcp', 'ring')
+        }
+
+    try:
+        results = asyncio.run(run_all())
+    finally:
+        parent.send('stop')
+        server.join(timeout=5)
+
+    tcp, ring = results['tcp'], results['ring']
+    saved = None
+    if tcp['total_cpu_us_per_frame'] and ring['total_cpu_us_per_frame'] is not None:
+        saved = round(1 - ring['total_cpu_us_per_frame'] / tcp['total_cpu_us_per_frame'], 3)
+
+    report = {
+        'benchmark': 'local',
+        'timestamp': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'fps': args.fps,
+            'frame_bytes': args.frame_size,
+            'ring_bytes': args.ring_size,
+            'duration': args.duration
+        },
+        'results': results,
+        'cpu_per_frame_saved': saved
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"local-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print_results(results)
+    if saved is not None:
+        print(f"\nCPU por frame (host + servidor) economizada com o anel: {saved:.1%}")
+    print(f"Resultado salvo em {output}")
+
+
+if __name__ == '__main__':
+    main()
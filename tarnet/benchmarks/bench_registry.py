@@ -0,0 +1,102 @@
+"""Benchmark de entrada/saída de conexões no registro do servidor.
+
+Mede o custo de conectar e desconectar clientes e hosts com um número
+crescente de conexões já registradas. Com o índice websocket -> registros
+o custo por ciclo deve ficar estável (O(1)) independente do total.
+
+Uso:
+    python benchmarks/bench_registry.py [--sizes 100 1000 10000] [--cycles 2000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+
+# Permite importar server.py e o pacote compartilhado
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'server'))
+sys.path.insert(0, ROOT)
+
+from server import TARNetServer  # noqa: E402
+
+
+class FakeWebSocket:
+    """WebSocket simulado: aceita envios sem rede"""
+
+    remote_address = ('127.0.0.1', 0)
+
+    async def send(self, payload):
+        pass
+
+
+async def populate(server, hosts, clients_per_host):
+    """Registra hosts e clientes que ficam conectados durante a medição"""
+    host_ids = []
+    for _ in range(hosts):
+        host_id = str(uuid.uuid4())
+        await server.register_host(FakeWebSocket(), {'host_id': host_id})
+        host_ids.append(host_id)
+
+        for _ in range(clients_per_host):
+            await server.register_client(FakeWebSocket(), {
+                'client_id': str(uuid.uuid4()),
+                'target_host': host_id
+            })
+
+    # Deixa as tarefas de envio recém-criadas iniciarem fora da medição
+    await asyncio.sleep(0)
+    return host_ids
+
+
+async def churn(server, host_ids, cycles):
+    """Conecta e desconecta clientes e hosts; retorna µs por ciclo"""
+    started = time.perf_counter()
+    for i in range(cycles):
+        # Cliente entra e sai da sala de um host existente
+        websocket = FakeWebSocket()
+        await server.register_client(websocket, {
+            'client_id': str(uuid.uuid4()),
+            'target_host': host_ids[i % len(host_ids)]
+        })
+        await server.cleanup_connection(websocket)
+
+        # Host entra e sai
+        websocket = FakeWebSocket()
+        await server.register_host(websocket, {'host_id': str(uuid.uuid4())})
+        await server.cleanup_connection(websocket)
+
+    return (time.perf_counter() - started) / cycles * 1e6
+
+
+async def run(sizes, cycles, clients_per_host):
+    print(f"{'conexões':>10} {'µs/ciclo':>10}")
+    for size in sizes:
+        server = TARNetServer()
+        hosts = max(1, size // (clients_per_host + 1))
+        host_ids = await populate(server, hosts, clients_per_host)
+        total = len(server.hosts) + len(server.clients)
+
+        per_cycle = await churn(server, host_ids, cycles)
+        print(f"{total:>10} {per_cycle:>10.1f}")
+
+        for client_id in list(server.clients):
+            await server.remove_client(client_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de churn de conexões")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--cycles', type=int, default=2000)
+    parser.add_argument('--clients-per-host', type=int, default=9)
+    args = parser.parse_args()
+
+    # Os logs por conexão dominariam a medição
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.sizes, args.cycles, args.clients_per_host))
+
+
+if __name__ == '__main__':
+    main()
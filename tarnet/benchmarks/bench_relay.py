@@ -0,0 +1,342 @@
+"""Gerador de carga e benchmark do relay de frames do servidor.
+
+Sobe o TARNetServer em um processo filho (na mesma máquina, sem display,
+mss nem pyautogui) e conecta N hosts sintéticos que enviam frames
+aleatórios ou gravados no tamanho e FPS escolhidos, e M clientes por host.
+O servidor fica em outro processo para que CPU e memória medidas sejam só
+as dele, não as do gerador de carga.
+
+Mede:
+- vazão do relay (frames e MB/s entregues aos clientes);
+- latência p50/p99 do envio pelo host até a chegada no cliente;
+- memória do servidor por conexão;
+- CPU do servidor por MB repassado.
+
+O resultado é salvo em JSON para comparar execuções.
+
+Uso:
+    python benchmarks/bench_relay.py [--hosts 4] [--viewers 4] [--fps 10]
+        [--frame-size 50000] [--frames DIR] [--duration 10]
+        [--output resultado.json] [--compare anterior.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import websockets
+
+# Permite importar server.py e o pacote compartilhado
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'server'))
+sys.path.insert(0, ROOT)
+
+from shared.protocol import (  # noqa: E402
+    FLAG_KEYFRAME, MSG_SCREEN_FRAME, host_id_to_bytes, pack_frame, unpack_header
+)
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def process_usage():
+    """CPU (s) e memória residente (bytes) do processo atual"""
+    rss = None
+    try:
+        with open('/proc/self/statm') as statm:
+            rss = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            # Pico de memória: KB no Linux, bytes no macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            rss = peak if sys.platform == 'darwin' else peak * 1024
+        except ImportError:
+            pass
+    return {'cpu': time.process_time(), 'rss': rss}
+
+
+def run_server(conn):
+    """Processo filho: servidor real atendendo pedidos de medição pelo pipe"""
+    from server import TARNetServer
+
+    logging.disable(logging.INFO)
+
+    async def main():
+        server = TARNetServer(host='127.0.0.1', port=0)
+        # Mesmas opções do servidor em produção (sem deflate, limites de tamanho)
+        async with websockets.serve(server.handle_connection, '127.0.0.1', 0,
+                                    **server.serve_options()) as ws_server:
+            conn.send(ws_server.sockets[0].getsockname()[1])
+            loop = asyncio.get_running_loop()
+            while True:
+                command = await loop.run_in_executor(None, conn.recv)
+                if command == 'usage':
+                    conn.send(process_usage())
+                else:
+                    break
+
+    asyncio.run(main())
+
+
+class SyntheticHost:
+    """Host sem captura de tela: envia payloads prontos no ritmo pedido"""
+
+    def __init__(self, url, payloads, fps):
+        self.url = url
+        self.payloads = payloads
+        self.fps = fps
+        self.host_id = str(uuid.uuid4())
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+    async def connect(self):
+        self.websocket = await websockets.connect(self.url, max_size=None)
+        await self.websocket.send(json.dumps({'type': 'register_host', 'host_id': self.host_id}))
+        await self.websocket.recv()
+        # Descarta comandos do servidor (set_layers, request_keyframe...)
+        self._drain = asyncio.create_task(self._discard())
+
+    async def _discard(self):
+        try:
+            async for _ in self.websocket:
+                pass
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def run(self, until):
+        loop = asyncio.get_running_loop()
+        host_id_bytes = host_id_to_bytes(self.host_id)
+        interval = 1.0 / self.fps
+        deadline = loop.time()
+        while loop.time() < until:
+            payload = self.payloads[self.frames_sent % len(self.payloads)]
+            frame = pack_frame(MSG_SCREEN_FRAME, host_id_bytes, self.frames_sent,
+                               time.time(), payload, FLAG_KEYFRAME)
+            await self.websocket.send(frame)
+            self.frames_sent += 1
+            self.bytes_sent += len(frame)
+
+            deadline += interval
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    async def close(self):
+        await self.websocket.close()
+        self._drain.cancel()
+
+
+class SyntheticViewer:
+    """Cliente que só recebe frames e mede a latência pelo timestamp do cabeçalho"""
+
+    def __init__(self, url, host_id):
+        self.url = url
+        self.host_id = host_id
+        self.latencies = []
+        self.frames = 0
+        self.bytes = 0
+        self.measuring = False
+
+    async def connect(self):
+        self.websocket = await websockets.connect(self.url, max_size=None)
+        await self.websocket.send(json.dumps({
+            'type': 'register_client',
+            'client_id': str(uuid.uuid4()),
+            'target_host': self.host_id
+        }))
+        await self.websocket.recv()
+        self._task = asyncio.create_task(self._receive())
+
+    async def _receive(self):
+        try:
+            async for message in self.websocket:
+                if not self.measuring or not isinstance(message, bytes):
+                    continue
+                header = unpack_header(message)
+                self.latencies.append(time.time() - header.timestamp)
+                self.frames += 1
+                self.bytes += len(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def close(self):
+        await self.websocket.close()
+        self._task.cancel()
+
+
+def load_payloads(frames_dir, frame_size):
+    """Frames gravados (arquivos de um diretório) ou bytes aleatórios"""
+    if frames_dir:
+        names = sorted(os.listdir(frames_dir))
+        payloads = []
+        for name in names:
+            path = os.path.join(frames_dir, name)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    payloads.append(f.read())
+        if not payloads:
+            raise SystemExit(f"Nenhum frame encontrado em {frames_dir}")
+        return payloads
+    # Alguns payloads diferentes para não repetir sempre o mesmo buffer
+    return [os.urandom(frame_size) for _ in range(8)]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def run_load(url, args, payloads, usage):
+    """Conecta a carga, mede durante `duration` segundos e retorna os números"""
+    loop = asyncio.get_running_loop()
+    baseline = await loop.run_in_executor(None, usage)
+
+    hosts = [SyntheticHost(url, payloads, args.fps) for _ in range(args.hosts)]
+    for host in hosts:
+        await host.connect()
+    viewers = [SyntheticViewer(url, host.host_id) for host in hosts for _ in range(args.viewers)]
+    for viewer in viewers:
+        await viewer.connect()
+    connected = await loop.run_in_executor(None, usage)
+
+    # Aquecimento fora da medição
+    await asyncio.gather(*(host.run(loop.time() + args.warmup) for host in hosts))
+    for host in hosts:
+        host.frames_sent = host.bytes_sent = 0
+    for viewer in viewers:
+        viewer.measuring = True
+
+    before = await loop.run_in_executor(None, usage)
+    started = loop.time()
+    await asyncio.gather(*(host.run(started + args.duration) for host in hosts))
+    # Espera os frames em trânsito chegarem
+    await asyncio.sleep(0.5)
+    elapsed = loop.time() - started
+    after = await loop.run_in_executor(None, usage)
+
+    for viewer in viewers:
+        viewer.measuring = False
+        await viewer.close()
+    for host in hosts:
+        await host.close()
+
+    latencies = [latency for viewer in viewers for latency in viewer.latencies]
+    frames_sent = sum(host.frames_sent for host in hosts)
+    delivered = sum(viewer.frames for viewer in viewers)
+    delivered_mb = sum(viewer.bytes for viewer in viewers) / 1e6
+    connections = len(hosts) + len(viewers)
+    cpu = after['cpu'] - before['cpu']
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    memory = None
+    if baseline['rss'] is not None and connected['rss'] is not None:
+        memory = round((connected['rss'] - baseline['rss']) / connections)
+
+    return {
+        'frames_sent': frames_sent,
+        'frames_delivered': delivered,
+        'delivery_ratio': round(delivered / (frames_sent * args.viewers), 4) if frames_sent else None,
+        'relay_fps': round(delivered / elapsed, 1),
+        'relay_mb_per_s': round(delivered_mb / elapsed, 2),
+        'latency_p50_ms': ms(percentile(latencies, 0.50)),
+        'latency_p99_ms': ms(percentile(latencies, 0.99)),
+        'latency_max_ms': ms(max(latencies) if latencies else None),
+        'connections': connections,
+        'memory_per_connection_bytes': memory,
+        'server_rss_bytes': after['rss'],
+        'server_cpu_seconds': round(cpu, 3),
+        'server_cpu_seconds_per_mb': round(cpu / delivered_mb, 4) if delivered_mb else None
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, previous=None):
+    print(f"{'métrica':<30} {'valor':>14}" + (f" {'anterior':>14}" if previous else ''))
+    for key, value in results.items():
+        line = f"{key:<30} {str(value):>14}"
+        if previous:
+            line += f" {str(previous.get(key)):>14}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga do relay do servidor")
+    parser.add_argument('--hosts', type=int, default=4, help="Hosts sintéticos")
+    parser.add_argument('--viewers', type=int, default=4, help="Clientes por host")
+    parser.add_argument('--fps', type=float, default=10.0)
+    parser.add_argument('--frame-size', type=int, default=50000, help="Bytes por frame aleatório")
+    parser.add_argument('--frames', help="Diretório com frames gravados (um arquivo por frame)")
+    parser.add_argument('--duration', type=float, default=10.0, help="Segundos medidos")
+    parser.add_argument('--warmup', type=float, default=1.0, help="Segundos antes da medição")
+    parser.add_argument('--output', help="Arquivo JSON do resultado (padrão: benchmarks/results/)")
+    parser.add_argument('--compare', help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.frames, args.frame_size)
+
+    parent, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=run_server, args=(child,), daemon=True)
+    server.start()
+    port = parent.recv()
+
+    def usage():
+        parent.send('usage')
+        return parent.recv()
+
+    try:
+        results = asyncio.run(run_load(f"ws://127.0.0.1:{port}", args, payloads, usage))
+    finally:
+        parent.send('stop')
+        server.join(timeout=5)
+
+    report = {
+        'benchmark': 'relay',
+        'timestamp': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'hosts': args.hosts,
+            'viewers_per_host': args.viewers,
+            'fps': args.fps,
+            'frame_bytes': sum(map(len, payloads)) // len(payloads),
+            'recorded_frames': bool(args.frames),
+            'duration': args.duration
+        },
+        'results': results
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"relay-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+    print_results(results, previous)
+    print(f"\nResultado salvo em {output}")
+
+
+if __name__ == '__main__':
+    main()
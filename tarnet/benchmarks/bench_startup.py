@@ -0,0 +1,208 @@
+"""Benchmark de inicialização do Host Agent em cada modo (--mode).
+
+Para cada modo (stream, input, both) roda o host em um processo novo, com o
+interpretador frio, contra um TARNetServer neste processo, e mede:
+
+- custo de importação: `import host` e a criação do HostAgent, que é onde
+  os backends do modo (mss, PIL/NumPy/PyAV, pyautogui) são importados;
+- módulos carregados depois da criação do agente;
+- tempo até o registro chegar ao servidor e, nos modos que transmitem, até
+  o primeiro frame chegar, contados a partir do início do processo.
+
+Precisa do ambiente real do host (display para o mss e o pyautogui); um modo
+cujo backend não importa aparece com o erro no resultado.
+
+Uso:
+    python benchmarks/bench_startup.py [--modes stream input both] [--runs 3]
+        [--output resultado.json]
+"""
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_child(mode, url):
+    """Processo do host: mede importação e criação do agente e conecta ao servidor"""
+    started = time.perf_counter()
+    sys.path[:0] = [os.path.join(ROOT, 'host'), ROOT]
+    try:
+        import host
+        imported = time.perf_counter()
+        agent = host.HostAgent(mode=mode)
+        created = time.perf_counter()
+    except Exception as e:  # backend indisponível (sem display, sem o pacote)
+        print(json.dumps({'error': f"{type(e).__name__}: {e}"}), flush=True)
+        return
+
+    print(json.dumps({
+        'import_host_ms': round((imported - started) * 1000, 1),
+        'create_agent_ms': round((created - imported) * 1000, 1),
+        'modules_loaded': len(sys.modules)
+    }), flush=True)
+    host.asyncio.run(agent.run(url))
+
+
+# O processo do host roda antes de qualquer outra importação deste arquivo,
+# para medir a importação com o interpretador frio
+if __name__ == '__main__' and len(sys.argv) == 4 and sys.argv[1] == '--child':
+    run_child(sys.argv[2], sys.argv[3])
+    sys.exit()
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import logging  # noqa: E402
+import platform  # noqa: E402
+import statistics  # noqa: E402
+import subprocess  # noqa: E402
+import tempfile  # noqa: E402
+from datetime import datetime  # noqa: E402
+
+import websockets  # noqa: E402
+
+# Permite importar server.py e o pacote compartilhado
+sys.path.insert(0, os.path.join(ROOT, 'server'))
+sys.path.insert(0, ROOT)
+
+from bench_relay import RESULTS_DIR, git_revision  # noqa: E402
+from shared.protocol import HOST_MODES  # noqa: E402
+
+
+class StartupServer:
+    """TARNetServer que anota quando cada host se registra e envia o primeiro frame"""
+
+    def __init__(self):
+        from server import TARNetServer
+
+        self.server = TARNetServer(host='127.0.0.1', port=0)
+        self.registered = asyncio.Event()
+        self.first_frame = asyncio.Event()
+        self.registered_at = None
+        self.first_frame_at = None
+
+        register_host = self.server.register_host
+        handle_screen_frame = self.server.handle_screen_frame
+
+        async def registered(websocket, data):
+            if self.registered_at is None:
+                self.registered_at = time.perf_counter()
+                self.registered.set()
+            return await register_host(websocket, data)
+
+        async def frame(websocket, message):
+            if self.first_frame_at is None:
+                self.first_frame_at = time.perf_counter()
+                self.first_frame.set()
+            await handle_screen_frame(websocket, message)
+
+        self.server.register_host = registered
+        self.server.handle_screen_frame = frame
+
+    def reset(self):
+        self.registered.clear()
+        self.first_frame.clear()
+        self.registered_at = None
+        self.first_frame_at = None
+
+
+async def measure_mode(mode, url, startup, timeout):
+    """Uma execução do host no modo: importação, registro e primeiro frame"""
+    startup.reset()
+    with tempfile.TemporaryDirectory() as state_dir:
+        env = dict(os.environ, TARNET_HOST_STATE=os.path.join(state_dir, 'host.json'))
+        spawned = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), '--child', mode, url,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env
+        )
+        try:
+            line = await asyncio.wait_for(process.stdout.readline(), timeout)
+            result = json.loads(line or b'{"error": "processo terminou sem resultado"}')
+            if 'error' in result:
+                return result
+
+            await asyncio.wait_for(startup.registered.wait(), timeout)
+            result['registered_ms'] = round((startup.registered_at - spawned) * 1000, 1)
+            if mode != 'input':
+                await asyncio.wait_for(startup.first_frame.wait(), timeout)
+                result['first_frame_ms'] = round((startup.first_frame_at - spawned) * 1000, 1)
+            return result
+        except asyncio.TimeoutError:
+            return {'error': f"sem resposta em {timeout} s"}
+        finally:
+            if process.returncode is None:
+                process.terminate()
+            await process.wait()
+
+
+def summarize(runs):
+    """Mediana de cada métrica entre as execuções (ou o erro, se alguma falhou)"""
+    errors = [run['error'] for run in runs if 'error' in run]
+    if errors:
+        return {'error': errors[0]}
+    return {key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]}
+
+
+async def run_all(args):
+    startup = StartupServer()
+    async with websockets.serve(startup.server.handle_connection, '127.0.0.1', 0,
+                                **startup.server.serve_options()) as ws_server:
+        url = f"ws://127.0.0.1:{ws_server.sockets[0].getsockname()[1]}"
+        results = {}
+        for mode in args.modes:
+            runs = []
+            for _ in range(args.runs):
+                runs.append(await measure_mode(mode, url, startup, args.timeout))
+                # A sala do host encerrado fica no período de tolerância
+                for host_id in list(startup.server.hosts):
+                    await startup.server.remove_host(host_id)
+            results[mode] = summarize(runs)
+        return results
+
+
+def print_results(results):
+    keys = []
+    for result in results.values():
+        keys += [key for key in result if key not in keys]
+    print(f"{'métrica':<18}" + ''.join(f" {mode:>12}" for mode in results))
+    for key in keys:
+        print(f"{key:<18}" + ''.join(f" {str(result.get(key, '-')):>12}"
+                                     for result in results.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inicialização do Host Agent em cada modo")
+    parser.add_argument('--modes', nargs='+', choices=HOST_MODES, default=['stream', 'input', 'both'])
+    parser.add_argument('--runs', type=int, default=3, help="Execuções por modo (mediana)")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Segundos de espera por etapa")
+    parser.add_argument('--output', help="Arquivo JSON do resultado (padrão: benchmarks/results/)")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    results = asyncio.run(run_all(args))
+
+    report = {
+        'benchmark': 'startup',
+        'timestamp': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'modes': args.modes, 'runs': args.runs},
+        'results': results
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"startup-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print_results(results)
+    print(f"\nResultado salvo em {output}")
+
+
+if __name__ == '__main__':
+    main()
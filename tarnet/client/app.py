@@ -1,14 +1,85 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
 import uuid
 import os
+import sys
+
+# Permite importar o pacote compartilhado (tarnet/shared) ao rodar "python app.py"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.logs import RateLimitedLog, setup_logging
+from shared.metrics import Histogram, MetricsRegistry, is_count
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SESSION_SECRET', 'tarnet-dev-secret-key')
 
+# Falhas repetidas a cada requisição (ex.: servidor fora) viram um registro a cada 10 s
+event_log = RateLimitedLog(logging.getLogger(__name__), interval=10.0)
+
 # Configuração para permitir conexões externas no Replit
 app.config['HOST'] = '0.0.0.0'
 app.config['PORT'] = 5000
 
+# Métricas enviadas pelos navegadores (decodificação, pintura, latência)
+CLIENT_STAGES = ('decode', 'paint', 'latency')
+metrics = MetricsRegistry()
+client_stage_seconds = metrics.histogram(
+    'tarnet_client_stage_seconds',
+    'Duração no navegador: decodificação, pintura e captura até exibição (latency)',
+    ('host_id', 'stage')
+)
+client_frames_rendered = metrics.counter(
+    'tarnet_client_frames_rendered_total', 'Frames exibidos pelos clientes', ('host_id',)
+)
+client_reports = metrics.counter(
+    'tarnet_client_metric_reports_total', 'Relatórios de métricas recebidos dos clientes'
+).labels()
+metrics_lock = threading.Lock()
+# Buckets esperados nos relatórios (valida sem criar rótulos)
+stage_template = Histogram()
+
+# Snapshot do diretório de hosts do servidor (GET /hosts na porta do WebSocket),
+# revalidado com If-None-Match no máximo a cada HOSTS_CACHE_TTL segundos
+TARNET_SERVER_HTTP = os.environ.get('TARNET_SERVER_HTTP', 'http://localhost:8000')
+HOSTS_CACHE_TTL = 1.0
+hosts_cache = {'etag': None, 'body': None, 'checked_at': 0.0}
+hosts_lock = threading.Lock()
+
+def fetch_hosts_snapshot():
+    """Retorna (ETag, corpo) do diretório, usando o cache enquanto não mudar"""
+    with hosts_lock:
+        now = time.monotonic()
+        if hosts_cache['body'] is not None and now - hosts_cache['checked_at'] < HOSTS_CACHE_TTL:
+            return hosts_cache['etag'], hosts_cache['body']
+        
+        req = urllib.request.Request(f"{TARNET_SERVER_HTTP}/hosts")
+        if hosts_cache['etag']:
+            req.add_header('If-None-Match', hosts_cache['etag'])
+        try:
+            with urllib.request.urlopen(req, timeout=2) as response:
+                hosts_cache['etag'] = response.headers.get('ETag')
+                hosts_cache['body'] = response.read()
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+        hosts_cache['checked_at'] = now
+        return hosts_cache['etag'], hosts_cache['body']
+
+def known_host_ids():
+    """IDs dos hosts no diretório do servidor (lidos de novo só quando o ETag muda)"""
+    etag, body = fetch_hosts_snapshot()
+    with hosts_lock:
+        if hosts_cache.get('ids_body') is not body:
+            hosts = json.loads(body).get('hosts', [])
+            hosts_cache['ids'] = {host.get('host_id') for host in hosts}
+            hosts_cache['ids_body'] = body
+        return hosts_cache['ids']
+
 @app.route('/')
 def index():
     """Página principal do cliente web"""
@@ -22,11 +93,68 @@ def control_host(host_id):
 
 @app.route('/api/hosts')
 def get_hosts():
-    """API para obter lista de hosts (placeholder - será implementado via WebSocket)"""
-    return jsonify({
-        'hosts': [],
-        'message': 'Use WebSocket para obter hosts em tempo real'
-    })
+    """Lista de hosts do servidor, com ETag (304 se o cliente já tem a versão atual)"""
+    try:
+        etag, body = fetch_hosts_snapshot()
+    except (urllib.error.URLError, OSError) as e:
+        event_log.warning('hosts_unavailable', "Servidor indisponível", url=TARNET_SERVER_HTTP, error=e)
+        return jsonify({'hosts': [], 'error': f'Servidor indisponível: {e}'}), 502
+    
+    if etag and request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers={'ETag': etag})
+    
+    response = Response(body, mimetype='application/json')
+    if etag:
+        response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/metrics', methods=['POST'])
+def report_metrics():
+    """Recebe os histogramas acumulados por um cliente desde o último envio.
+    
+    O relatório inteiro é validado antes de alterar qualquer métrica, e só
+    hosts presentes no diretório do servidor viram rótulos.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Relatório inválido'}), 400
+    try:
+        host_id = str(uuid.UUID(data.get('host_id', '')))
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'host_id inválido'}), 400
+    
+    frames_rendered = data.get('frames_rendered', 0)
+    stages = data.get('stages', {})
+    if not is_count(frames_rendered):
+        return jsonify({'error': 'frames_rendered deve ser um inteiro não negativo'}), 400
+    if not isinstance(stages, dict) or not set(stages) <= set(CLIENT_STAGES):
+        return jsonify({'error': f'stages aceita só {", ".join(CLIENT_STAGES)}'}), 400
+    if not all(stage_template.accepts(snapshot) for snapshot in stages.values()):
+        return jsonify({'error': 'Histograma inválido'}), 400
+    
+    try:
+        known = known_host_ids()
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        event_log.warning('hosts_unavailable', "Servidor indisponível", url=TARNET_SERVER_HTTP, error=e)
+        return jsonify({'error': 'Diretório de hosts indisponível'}), 503
+    if host_id not in known:
+        return jsonify({'error': 'Host desconhecido'}), 400
+    
+    with metrics_lock:
+        for stage, snapshot in stages.items():
+            client_stage_seconds.labels(host_id, stage).merge(snapshot)
+        client_frames_rendered.labels(host_id).inc(frames_rendered)
+        client_reports.inc()
+    
+    return '', 204
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métricas dos clientes no formato do Prometheus"""
+    with metrics_lock:
+        body = metrics.render()
+    return Response(body, mimetype='text/plain; version=0.0.4')
 
 @app.route('/health')
 def health():
@@ -43,6 +171,8 @@ if __name__ == '__main__':
     print(f"Acesse: http://localhost:{app.config['PORT']}")
     print()
     
+    setup_logging()
+    
     # Executa o servidor Flask
     app.run(
         host=app.config['HOST'],
@@ -60,7 +60,7 @@ class TARNetApp {
     }
     
     // WebSocket
-    connect(onMessage = null, onOpen = null, onClose = null) {
+    connect(onMessage = null, onOpen = null, onClose = null, onBinary = null) {
         if (this.isConnecting || (this.websocket && this.websocket.readyState === WebSocket.OPEN)) {
             return Promise.resolve();
         }
@@ -70,6 +70,8 @@ class TARNetApp {
         return new Promise((resolve, reject) => {
             try {
                 this.websocket = new WebSocket(this.config.serverUrl);
+                // Frames de tela chegam como mensagens binárias
+                this.websocket.binaryType = 'arraybuffer';
                 
                 this.websocket.onopen = (event) => {
                     console.log('Conectado ao servidor TARNet');
@@ -82,6 +84,11 @@ class TARNetApp {
                 };
                 
                 this.websocket.onmessage = (event) => {
+                    if (event.data instanceof ArrayBuffer) {
+                        if (onBinary) onBinary(event.data);
+                        return;
+                    }
+                    
                     try {
                         const data = JSON.parse(event.data);
                         if (onMessage) onMessage(data);
@@ -99,7 +106,7 @@ class TARNetApp {
                     
                     // Tentativa de reconexão
                     if (this.reconnectAttempts < this.config.maxReconnectAttempts) {
-                        this.scheduleReconnect(onMessage, onOpen, onClose);
+                        this.scheduleReconnect(onMessage, onOpen, onClose, onBinary);
                     }
                 };
                 
@@ -118,7 +125,7 @@ class TARNetApp {
         });
     }
     
-    scheduleReconnect(onMessage, onOpen, onClose) {
+    scheduleReconnect(onMessage, onOpen, onClose, onBinary) {
         this.reconnectAttempts++;
         const delay = Math.min(this.config.reconnectInterval * this.reconnectAttempts, 30000);
         
@@ -126,7 +133,7 @@ class TARNetApp {
             `Tentando reconectar... (${this.reconnectAttempts}/${this.config.maxReconnectAttempts})`);
         
         setTimeout(() => {
-            this.connect(onMessage, onOpen, onClose);
+            this.connect(onMessage, onOpen, onClose, onBinary);
         }, delay);
     }
     
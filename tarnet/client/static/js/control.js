@@ -6,14 +6,38 @@ class RemoteControl extends TARNetApp {
         this.hostId = hostId;
         this.clientId = clientId;
         
-        // Canvas e contexto
+        // Canvas (o desenho fica com o FrameRenderer, no worker ou na página)
         this.canvas = document.getElementById('remote-screen');
-        this.ctx = this.canvas.getContext('2d');
+        this.workerUrl = window.TARNet.renderWorkerUrl || '/static/js/render-worker.js';
+        this.worker = null;
+        this.renderer = null;
+        // Resolução do último frame exibido (o canvas pode estar no worker)
+        this.frameWidth = 0;
+        this.frameHeight = 0;
+        // Última estatística do renderer (fps e backlog) e descartados desde o último frame_ack
+        this.renderStats = null;
+        this.renderDropped = 0;
         
         // Estado
         this.isFullscreen = false;
         this.isRegistered = false;
         this.quality = 75;
+        // Camada de simulcast assinada (full, half ou thumb)
+        this.layer = this.getInitialLayer();
+        // Stream exibido (índice da camada ou ID de visão atribuído pelo servidor)
+        // e visão assinada ({stream, monitor, region} ou null)
+        this.stream = TARNetProtocol.LAYERS.indexOf(this.layer);
+        this.view = null;
+        this.monitors = [];
+        this.selectionStart = null;
+        this.lastAckTime = 0;
+        this.lastKeyframeRequest = 0;
+        // Eventos de entrada acumulados até o próximo quadro de animação
+        this.pendingInput = [];
+        this.inputFlushScheduled = false;
+        
+        // Tempos de decodificação, pintura e captura até exibição (enviados ao app.py)
+        this.metrics = new ClientMetrics(hostId, clientId);
         
         // Estatísticas
         this.stats = {
@@ -28,8 +52,11 @@ class RemoteControl extends TARNetApp {
     
     init() {
         this.setupCanvas();
+        this.setupRenderer();
         this.setupEventListeners();
         this.setupQualityControl();
+        this.setupLayerControl();
+        this.setupViewControl();
         this.connectToServer();
         
         console.log(`Controle remoto iniciado - Host: ${this.hostId}, Cliente: ${this.clientId}`);
@@ -40,7 +67,8 @@ class RemoteControl extends TARNetApp {
             await this.connect(
                 this.handleMessage.bind(this),
                 this.onConnected.bind(this),
-                this.onDisconnected.bind(this)
+                this.onDisconnected.bind(this),
+                this.handleBinaryMessage.bind(this)
             );
         } catch (error) {
             console.error('Erro ao conectar:', error);
@@ -62,7 +90,8 @@ class RemoteControl extends TARNetApp {
         const success = this.send({
             type: 'register_client',
             client_id: this.clientId,
-            target_host: this.hostId
+            target_host: this.hostId,
+            layer: this.layer
         });
         
         if (!success) {
@@ -70,17 +99,138 @@ class RemoteControl extends TARNetApp {
         }
     }
     
+    getInitialLayer() {
+        // ?layer=half na URL, senão escolhe pelo tamanho da janela
+        const requested = new URLSearchParams(window.location.search).get('layer');
+        if (TARNetProtocol.LAYERS.includes(requested)) return requested;
+        return window.innerWidth < 800 ? 'half' : 'full';
+    }
+    
+    setLayer(layer) {
+        if (!TARNetProtocol.LAYERS.includes(layer)) return;
+        if (layer === this.layer && !this.view) return;
+        
+        // Frames da camada anterior ainda na fila são ignorados; o servidor
+        // envia o último keyframe da nova camada
+        this.layer = layer;
+        this.stream = TARNetProtocol.LAYERS.indexOf(layer);
+        this.view = null;
+        this.resetRenderer();
+        const monitorSelect = document.getElementById('monitorSelect');
+        if (monitorSelect) monitorSelect.value = '';
+        if (this.isRegistered) {
+            this.send({
+                type: 'set_layer',
+                client_id: this.clientId,
+                layer: layer
+            });
+        }
+    }
+    
+    setView(monitor, region) {
+        // Monitor (1-based) ou retângulo [x, y, w, h] dele em pixels nativos;
+        // a troca só vale quando o servidor confirmar com view_changed
+        if (!this.isRegistered) return;
+        this.send({
+            type: 'set_view',
+            client_id: this.clientId,
+            monitor: monitor,
+            region: region
+        });
+    }
+    
+    onViewChanged(data) {
+        this.view = { stream: data.stream, monitor: data.monitor, region: data.region };
+        this.stream = data.stream;
+        this.resetRenderer();
+        
+        const monitorSelect = document.getElementById('monitorSelect');
+        if (monitorSelect) monitorSelect.value = String(data.monitor);
+        console.log(`Visão ativa: monitor ${data.monitor}` +
+                    (data.region ? `, região ${data.region.join(',')}` : ''));
+    }
+    
+    currentArea() {
+        // Retângulo da tela exibido no canvas: {monitor, x, y, width, height}
+        const monitorIndex = this.view ? this.view.monitor : 1;
+        const monitor = this.monitors[monitorIndex - 1];
+        if (!monitor) return null;
+        const region = this.view && this.view.region;
+        if (region) {
+            return { monitor: monitorIndex, x: region[0], y: region[1], width: region[2], height: region[3] };
+        }
+        return { monitor: monitorIndex, x: 0, y: 0, width: monitor.width, height: monitor.height };
+    }
+    
+    selectRegion(start, end) {
+        // Converte o retângulo arrastado no canvas para pixels nativos do monitor
+        const area = this.currentArea();
+        if (!area || !this.frameWidth || !this.frameHeight) return;
+        const scaleX = area.width / this.frameWidth;
+        const scaleY = area.height / this.frameHeight;
+        const left = Math.min(start.x, end.x);
+        const top = Math.min(start.y, end.y);
+        const width = Math.round(Math.abs(end.x - start.x) * scaleX);
+        const height = Math.round(Math.abs(end.y - start.y) * scaleY);
+        if (width < 16 || height < 16) return;
+        
+        this.setView(area.monitor, [
+            area.x + Math.round(left * scaleX),
+            area.y + Math.round(top * scaleY),
+            width,
+            height
+        ]);
+    }
+    
+    updateMonitorSelect() {
+        const monitorSelect = document.getElementById('monitorSelect');
+        if (!monitorSelect) return;
+        monitorSelect.length = 1; // mantém a opção das camadas de simulcast
+        this.monitors.forEach((monitor, index) => {
+            const option = document.createElement('option');
+            option.value = String(index + 1);
+            option.textContent = `Monitor ${index + 1} (${monitor.width}x${monitor.height})`;
+            monitorSelect.appendChild(option);
+        });
+        monitorSelect.value = this.view ? String(this.view.monitor) : '';
+    }
+    
     handleMessage(data) {
         switch (data.type) {
             case 'client_registered':
                 console.log('Cliente registrado com sucesso');
                 this.isRegistered = true;
+                this.monitors = data.monitors || [];
+                this.updateMonitorSelect();
+                // Após reconexão o servidor começa na camada; a visão é pedida de novo
+                if (this.view) {
+                    const { monitor, region } = this.view;
+                    this.view = null;
+                    this.stream = TARNetProtocol.LAYERS.indexOf(this.layer);
+                    this.setView(monitor, region);
+                }
                 this.updateConnectionStatus('connected', `Controlando host ${this.formatHostId(data.target_host)}`);
                 this.showNotification('Conectado ao host com sucesso', 'success');
                 break;
                 
-            case 'screen_frame':
-                this.handleScreenFrame(data);
+            case 'layer_changed':
+                console.log(`Camada ativa: ${data.layer}`);
+                break;
+                
+            case 'view_changed':
+                this.onViewChanged(data);
+                break;
+                
+            case 'host_reconnecting':
+                // O servidor mantém a sala enquanto o host tenta voltar
+                this.showNotification('Conexão do host caiu, aguardando reconexão...', 'warning');
+                this.updateConnectionStatus('connecting', 'Host reconectando...');
+                break;
+                
+            case 'host_resumed':
+                // O host pede um keyframe ao voltar; nada a fazer além do status
+                this.showNotification('Host reconectado', 'success');
+                this.updateConnectionStatus('connected', `Controlando host ${this.formatHostId(data.host_id)}`);
                 break;
                 
             case 'host_disconnected':
@@ -101,26 +251,126 @@ class RemoteControl extends TARNetApp {
         }
     }
     
-    handleScreenFrame(data) {
-        if (data.host_id !== this.hostId) return;
+    setupRenderer() {
+        // Decodificação e desenho em um Web Worker com OffscreenCanvas, para a
+        // página não travar nem acumular atraso; sem suporte, na própria página
+        const onMessage = (message) => this.onRendererMessage(message);
+        if (window.Worker && this.canvas.transferControlToOffscreen) {
+            try {
+                const offscreen = this.canvas.transferControlToOffscreen();
+                this.worker = new Worker(this.workerUrl);
+                this.worker.onmessage = (event) => onMessage(event.data);
+                this.worker.postMessage({ type: 'init', canvas: offscreen }, [offscreen]);
+                return;
+            } catch (error) {
+                console.warn('Worker de exibição indisponível:', error);
+                this.worker = null;
+            }
+        }
+        this.renderer = new FrameRenderer(this.canvas, onMessage);
+    }
+    
+    resetRenderer() {
+        if (this.worker) {
+            this.worker.postMessage({ type: 'reset' });
+        } else if (this.renderer) {
+            this.renderer.reset();
+        }
+    }
+    
+    onRendererMessage(message) {
+        switch (message.type) {
+            case 'rendered':
+                this.frameWidth = message.width;
+                this.frameHeight = message.height;
+                if (message.decode !== undefined) this.metrics.observe('decode', message.decode);
+                this.metrics.observe('paint', message.paint);
+                this.onFrameRendered(message);
+                this.hideLoadingOverlay();
+                break;
+                
+            case 'keyframe':
+                this.requestKeyframe();
+                break;
+                
+            case 'fallback':
+                this.fallbackFromVideo(message.reason);
+                break;
+                
+            case 'stats': {
+                this.renderStats = message;
+                this.renderDropped += message.dropped;
+                this.stats.fps = message.fps;
+                const fpsElement = document.getElementById('fps-counter');
+                if (fpsElement) fpsElement.textContent = message.fps;
+                break;
+            }
+        }
+    }
+    
+    handleBinaryMessage(buffer) {
+        const frame = TARNetProtocol.parseFrame(buffer);
+        if (!frame) {
+            console.error('Frame binário inválido');
+            return;
+        }
+        
+        if (frame.hostId !== this.hostId) return;
+        if (frame.layer !== this.stream) return;
+        
+        // O buffer é transferido ao worker, sem cópia
+        if (this.worker) {
+            this.worker.postMessage({ type: 'frame', buffer }, [buffer]);
+        } else {
+            this.renderer.push(buffer);
+        }
+    }
+    
+    fallbackFromVideo(reason) {
+        // A camada thumb é sempre JPEG; as demais podem estar em H.264/VP8
+        this.resetRenderer();
+        if (this.layer === 'thumb' && !this.view) return;
+        this.showNotification(`${reason}: exibindo a camada em JPEG (thumb)`, 'warning');
+        this.setLayer('thumb');
+        const layerSelect = document.getElementById('layerSelect');
+        if (layerSelect) layerSelect.value = 'thumb';
+    }
+    
+    onFrameRendered(frame) {
+        this.updateStats();
         
-        const img = new Image();
-        img.onload = () => {
-            // Atualiza canvas
-            this.canvas.width = img.width;
-            this.canvas.height = img.height;
-            this.ctx.drawImage(img, 0, 0);
-            
-            // Atualiza estatísticas
-            this.updateStats();
-            this.hideLoadingOverlay();
-        };
+        // Captura no host até a exibição (inclui a diferença entre os relógios)
+        this.metrics.observe('latency', Math.max(0, Date.now() / 1000 - frame.timestamp));
+        this.metrics.framesRendered++;
         
-        img.onerror = () => {
-            console.error('Erro ao carregar frame');
-        };
+        // Informa periodicamente o último frame exibido (controle de taxa do host)
+        const now = Date.now();
+        if (now - this.lastAckTime >= 500) {
+            this.lastAckTime = now;
+            // Junto, o ritmo real de exibição e os frames acumulados
+            const stats = this.renderStats;
+            this.send({
+                type: 'frame_ack',
+                client_id: this.clientId,
+                sequence: frame.sequence,
+                render_fps: stats ? stats.fps : null,
+                backlog: stats ? stats.backlog : null,
+                dropped: this.renderDropped
+            });
+            this.renderDropped = 0;
+        }
+    }
+    
+    requestKeyframe() {
+        // Evita inundar o host com pedidos enquanto o keyframe não chega
+        const now = Date.now();
+        if (now - this.lastKeyframeRequest < 1000) return;
+        this.lastKeyframeRequest = now;
         
-        img.src = `data:image/jpeg;base64,${data.data}`;
+        this.sendControlCommand({
+            type: 'request_keyframe',
+            layer: this.stream
+        });
     }
     
     setupCanvas() {
@@ -164,15 +414,43 @@ class RemoteControl extends TARNetApp {
         }
     }
     
+    setupLayerControl() {
+        const layerSelect = document.getElementById('layerSelect');
+        if (layerSelect) {
+            layerSelect.value = this.layer;
+            layerSelect.addEventListener('change', (e) => this.setLayer(e.target.value));
+        }
+    }
+    
+    setupViewControl() {
+        // Monitor inteiro na resolução nativa, ou "" para voltar às camadas
+        const monitorSelect = document.getElementById('monitorSelect');
+        if (monitorSelect) {
+            monitorSelect.addEventListener('change', (e) => {
+                if (e.target.value) {
+                    this.setView(parseInt(e.target.value), null);
+                } else {
+                    this.setLayer(this.layer);
+                }
+            });
+        }
+    }
+    
     // Event handlers
     handleMouseDown(e) {
         const coords = this.getCanvasCoordinates(e);
+        
+        // Shift + arrastar seleciona uma região para ver na resolução nativa
+        if (e.shiftKey) {
+            this.selectionStart = coords;
+            e.preventDefault();
+            return;
+        }
         const button = this.getMouseButton(e.button);
         
-        this.sendControlCommand({
+        this.queueInput({
             type: 'mouse_click',
-            x: coords.x,
-            y: coords.y,
+            ...coords,
             button: button
         });
         
@@ -180,28 +458,25 @@ class RemoteControl extends TARNetApp {
     }
     
     handleMouseUp(e) {
-        // Mouse up poderia ser implementado se necessário
+        if (this.selectionStart) {
+            this.selectRegion(this.selectionStart, this.getCanvasCoordinates(e));
+            this.selectionStart = null;
+        }
         e.preventDefault();
     }
     
     handleMouseMove(e) {
-        const coords = this.getCanvasCoordinates(e);
-        
-        // Throttle mouse move para não sobrecarregar
-        if (!this.lastMouseMove || Date.now() - this.lastMouseMove > 50) {
-            this.sendControlCommand({
-                type: 'mouse_move',
-                x: coords.x,
-                y: coords.y
-            });
-            this.lastMouseMove = Date.now();
-        }
+        if (this.selectionStart) return;
+        this.queueInput({
+            type: 'mouse_move',
+            ...this.getCanvasCoordinates(e)
+        });
     }
     
     handleWheel(e) {
         const direction = e.deltaY > 0 ? 'down' : 'up';
         
-        this.sendControlCommand({
+        this.queueInput({
             type: 'mouse_scroll',
             direction: direction,
             delta: Math.abs(e.deltaY)
@@ -213,7 +488,7 @@ class RemoteControl extends TARNetApp {
     handleKeyDown(e) {
         const key = this.mapKey(e);
         if (key) {
-            this.sendControlCommand({
+            this.queueInput({
                 type: 'key_press',
                 key: key
             });
@@ -237,13 +512,19 @@ class RemoteControl extends TARNetApp {
     // Utilidades
     getCanvasCoordinates(e) {
         const rect = this.canvas.getBoundingClientRect();
-        const scaleX = this.canvas.width / rect.width;
-        const scaleY = this.canvas.height / rect.height;
+        const scaleX = this.frameWidth / rect.width;
+        const scaleY = this.frameHeight / rect.height;
         
-        return {
+        // width/height (e a visão, se houver) permitem ao host mapear para a
+        // resolução real da tela, qualquer que seja a camada exibida
+        const coords = {
             x: Math.round((e.clientX - rect.left) * scaleX),
-            y: Math.round((e.clientY - rect.top) * scaleY)
+            y: Math.round((e.clientY - rect.top) * scaleY),
+            width: this.frameWidth,
+            height: this.frameHeight
         };
+        if (this.view) coords.view = this.view.stream;
+        return coords;
     }
     
     getMouseButton(button) {
@@ -291,20 +572,56 @@ class RemoteControl extends TARNetApp {
         });
     }
     
+    queueInput(command) {
+        if (!this.isRegistered) return;
+        
+        // Movimentos e rolagens seguidos se fundem; cliques e teclas mantêm a
+        // ordem em relação a eles
+        const last = this.pendingInput[this.pendingInput.length - 1];
+        if (last && last.type === command.type) {
+            if (command.type === 'mouse_move') {
+                this.pendingInput[this.pendingInput.length - 1] = command;
+                return;
+            }
+            if (command.type === 'mouse_scroll' && last.direction === command.direction) {
+                last.delta += command.delta;
+                return;
+            }
+        }
+        this.pendingInput.push(command);
+        
+        if (!this.inputFlushScheduled) {
+            this.inputFlushScheduled = true;
+            requestAnimationFrame(() => this.flushInput());
+        }
+    }
+    
+    flushInput() {
+        // Um único control_batch por quadro de animação
+        this.inputFlushScheduled = false;
+        const commands = this.pendingInput;
+        this.pendingInput = [];
+        if (commands.length === 0 || !this.isRegistered) return;
+        
+        this.send({
+            type: 'control_batch',
+            client_id: this.clientId,
+            target_host: this.hostId,
+            commands: commands
+        });
+    }
+    
     updateStats() {
         const now = Date.now();
         const timeDiff = now - this.stats.lastFrameTime;
         
         this.stats.frameCount++;
-        this.stats.fps = Math.round(1000 / timeDiff);
         this.stats.latency = timeDiff;
         this.stats.lastFrameTime = now;
         
-        // Atualiza UI
-        const fpsElement = document.getElementById('fps-counter');
+        // Atualiza UI (o FPS vem das estatísticas do renderer, uma vez por segundo)
         const latencyElement = document.getElementById('latency-counter');
         
-        if (fpsElement) fpsElement.textContent = this.stats.fps;
         if (latencyElement) latencyElement.textContent = this.formatLatency(this.stats.latency);
     }
     
@@ -366,7 +683,7 @@ function disconnect() {
 
 function sendKey(key) {
     if (window.remoteControl) {
-        window.remoteControl.sendControlCommand({
+        window.remoteControl.queueInput({
             type: 'key_press',
             key: key
         });
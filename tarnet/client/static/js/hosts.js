@@ -4,7 +4,10 @@ class HostsManager extends TARNetApp {
     constructor() {
         super();
         this.hosts = [];
-        this.refreshInterval = null;
+        // Diretório recebido do servidor: snapshot e depois só deltas
+        this.hostsById = new Map();
+        this.thumbnails = {};
+        this.version = null;
         this.connectToServer();
     }
     
@@ -22,20 +25,13 @@ class HostsManager extends TARNetApp {
     }
     
     onConnected() {
-        console.log('Conectado - iniciando busca por hosts');
+        console.log('Conectado - inscrevendo no diretório de hosts');
         this.requestHosts();
-        
-        // Atualiza lista de hosts a cada 5 segundos
-        this.refreshInterval = setInterval(() => {
-            this.requestHosts();
-        }, 5000);
     }
     
     onDisconnected() {
-        if (this.refreshInterval) {
-            clearInterval(this.refreshInterval);
-            this.refreshInterval = null;
-        }
+        this.version = null;
+        this.hostsById.clear();
         this.hosts = [];
         this.renderHosts();
     }
@@ -48,6 +44,22 @@ class HostsManager extends TARNetApp {
                 this.updateStats(data.server_stats);
                 break;
                 
+            case 'hosts_snapshot':
+                this.version = data.version;
+                this.hostsById = new Map(data.hosts.map(host => [host.host_id, host]));
+                this.thumbnails = data.thumbnails || {};
+                this.applyDirectory();
+                break;
+                
+            case 'hosts_delta':
+                this.applyDelta(data);
+                break;
+                
+            case 'host_thumbnails':
+                Object.assign(this.thumbnails, data.thumbnails);
+                this.applyDirectory();
+                break;
+                
             case 'error':
                 console.error('Erro do servidor:', data.message);
                 this.showNotification(`Erro: ${data.message}`, 'error');
@@ -58,9 +70,40 @@ class HostsManager extends TARNetApp {
         }
     }
     
+    applyDelta(delta) {
+        // Um delta perdido (versão fora de sequência) exige um novo snapshot
+        if (this.version === null || delta.version !== this.version + 1) {
+            this.requestHosts();
+            return;
+        }
+        this.version = delta.version;
+        
+        for (const host of [...delta.added, ...delta.changed]) {
+            this.hostsById.set(host.host_id, host);
+        }
+        for (const hostId of delta.removed) {
+            this.hostsById.delete(hostId);
+            delete this.thumbnails[hostId];
+        }
+        this.applyDirectory();
+    }
+    
+    applyDirectory() {
+        this.hosts = Array.from(this.hostsById.values(), host => ({
+            ...host,
+            thumbnail: this.thumbnails[host.host_id]
+        }));
+        this.renderHosts();
+        
+        const clients = this.hosts.reduce((sum, host) => sum + (host.clients_connected || 0), 0);
+        this.updateStats({ total_hosts: this.hosts.length, total_clients: clients });
+    }
+    
     requestHosts() {
+        // Snapshot agora e, depois, só as mudanças (sem consultas periódicas)
         const success = this.send({
-            type: 'get_hosts'
+            type: 'subscribe_hosts',
+            thumbnails: true  // miniaturas do último keyframe de cada host
         });
         
         if (!success) {
@@ -92,7 +135,8 @@ class HostsManager extends TARNetApp {
     }
     
     renderHostCard(host) {
-        const isOnline = host.last_frame && this.isRecentFrame(host.last_frame);
+        const isOnline = host.online !== undefined ? host.online :
+            host.last_frame && this.isRecentFrame(host.last_frame);
         const statusClass = isOnline ? 'online' : 'offline';
         const statusText = isOnline ? 'Online' : 'Offline';
         
@@ -100,9 +144,14 @@ class HostsManager extends TARNetApp {
         const lastFrame = host.last_frame ? 
             new Date(host.last_frame).toLocaleString() : 'Nunca';
         
+        const preview = host.thumbnail ?
+            `<img class="card-img-top host-thumbnail" src="data:image/jpeg;base64,${host.thumbnail}" alt="Tela do host">` :
+            `<div class="card-img-top host-thumbnail empty"><i class="fas fa-desktop fa-2x text-muted"></i></div>`;
+        
         return `
             <div class="col-md-6 col-lg-4 mb-3">
                 <div class="card host-card fade-in" onclick="connectToHost('${host.host_id}')">
+                    ${preview}
                     <div class="card-body">
                         <div class="d-flex justify-content-between align-items-start mb-2">
                             <h6 class="card-title mb-0">
@@ -0,0 +1,56 @@
+// TARNet Cliente Web - Métricas de decodificação e exibição
+//
+// Histogramas com os mesmos buckets de tarnet/shared/metrics.py. Os valores
+// acumulados são enviados periodicamente ao app.py (/api/metrics), que os
+// expõe em /metrics, e zerados em seguida.
+
+class ClientMetrics {
+    constructor(hostId, clientId, interval = 10000) {
+        this.hostId = hostId;
+        this.clientId = clientId;
+        this.bounds = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0];
+        this.histograms = {};
+        this.framesRendered = 0;
+
+        setInterval(() => this.flush(), interval);
+    }
+
+    observe(stage, seconds) {
+        let histogram = this.histograms[stage];
+        if (!histogram) {
+            histogram = this.histograms[stage] = {
+                bounds: this.bounds,
+                counts: new Array(this.bounds.length + 1).fill(0),
+                sum: 0,
+                count: 0
+            };
+        }
+
+        // Primeiro bucket com limite >= valor (o último é +Inf)
+        let i = 0;
+        while (i < this.bounds.length && seconds > this.bounds[i]) i++;
+        histogram.counts[i]++;
+        histogram.sum += seconds;
+        histogram.count++;
+    }
+
+    flush() {
+        if (this.framesRendered === 0 && Object.keys(this.histograms).length === 0) return;
+
+        const report = {
+            host_id: this.hostId,
+            client_id: this.clientId,
+            frames_rendered: this.framesRendered,
+            stages: this.histograms
+        };
+        this.histograms = {};
+        this.framesRendered = 0;
+
+        fetch('/api/metrics', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(report),
+            keepalive: true
+        }).catch(() => {});
+    }
+}
@@ -0,0 +1,84 @@
+// TARNet Cliente Web - Formato binário dos frames
+//
+// Espelha tarnet/shared/protocol.py: cabeçalho fixo seguido dos bytes
+// da imagem codificada (JPEG), dos tiles alterados ou de um frame de vídeo.
+
+const TARNetProtocol = {
+    MAGIC: 0x544E, // 'TN'
+    VERSION: 1,
+    HEADER_SIZE: 34,
+    
+    // Tipos de mensagem binária
+    MSG_SCREEN_FRAME: 1,
+    MSG_TILE_FRAME: 2,
+    MSG_VIDEO_FRAME: 3,
+    
+    // Flags
+    FLAG_KEYFRAME: 0x01,
+    
+    // Camadas de simulcast (o índice é o valor no cabeçalho)
+    LAYERS: ['full', 'half', 'thumb'],
+    
+    // Codecs de MSG_VIDEO_FRAME (índice no payload) e configuração do WebCodecs
+    VIDEO_CODECS: ['', 'avc1.42E028', 'vp8'],
+    
+    hostIdFromBytes(bytes) {
+        const hex = Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+        return `${hex.substring(0, 8)}-${hex.substring(8, 12)}-${hex.substring(12, 16)}-` +
+               `${hex.substring(16, 20)}-${hex.substring(20)}`;
+    },
+    
+    parseFrame(buffer) {
+        if (buffer.byteLength < this.HEADER_SIZE) return null;
+        
+        const view = new DataView(buffer);
+        if (view.getUint16(0) !== this.MAGIC || view.getUint8(2) !== this.VERSION) {
+            return null;
+        }
+        
+        return {
+            type: view.getUint8(3),
+            flags: view.getUint8(4),
+            layer: view.getUint8(5),
+            hostId: this.hostIdFromBytes(new Uint8Array(buffer, 6, 16)),
+            sequence: view.getUint32(22),
+            timestamp: view.getFloat64(26),
+            payload: new Uint8Array(buffer, this.HEADER_SIZE)
+        };
+    },
+    
+    parseTiles(payload) {
+        // Largura, altura e quantidade de tiles; depois x, y, w, h, tamanho + JPEG
+        const view = new DataView(payload.buffer, payload.byteOffset, payload.byteLength);
+        const width = view.getUint16(0);
+        const height = view.getUint16(2);
+        const count = view.getUint16(4);
+        
+        const tiles = [];
+        let offset = 6;
+        for (let i = 0; i < count; i++) {
+            const size = view.getUint32(offset + 8);
+            tiles.push({
+                x: view.getUint16(offset),
+                y: view.getUint16(offset + 2),
+                width: view.getUint16(offset + 4),
+                height: view.getUint16(offset + 6),
+                data: payload.subarray(offset + 12, offset + 12 + size)
+            });
+            offset += 12 + size;
+        }
+        
+        return { width, height, tiles };
+    },
+    
+    parseVideo(payload) {
+        // Codec, largura e altura; depois o frame codificado (H.264 Annex B ou VP8)
+        const view = new DataView(payload.buffer, payload.byteOffset, payload.byteLength);
+        return {
+            codec: this.VIDEO_CODECS[view.getUint8(0)],
+            width: view.getUint16(1),
+            height: view.getUint16(3),
+            data: payload.subarray(5)
+        };
+    }
+};
@@ -0,0 +1,26 @@
+// TARNet Cliente Web - Worker de decodificação e exibição
+//
+// Recebe o OffscreenCanvas transferido pela página e os frames binários
+// (ArrayBuffer transferido, sem cópia) e devolve os eventos do FrameRenderer.
+
+importScripts('protocol.js', 'renderer.js');
+
+let renderer = null;
+
+self.onmessage = (event) => {
+    const message = event.data;
+    
+    switch (message.type) {
+        case 'init':
+            renderer = new FrameRenderer(message.canvas, (data) => self.postMessage(data));
+            break;
+        
+        case 'frame':
+            if (renderer) renderer.push(message.buffer);
+            break;
+        
+        case 'reset':
+            if (renderer) renderer.reset();
+            break;
+    }
+};
@@ -0,0 +1,350 @@
+// TARNet Cliente Web - Decodificação e exibição dos frames
+//
+// Roda em um Web Worker (render-worker.js) desenhando em um OffscreenCanvas,
+// ou na thread principal quando o navegador não suporta OffscreenCanvas.
+// Os frames são decodificados assim que chegam, mas só o mais recente pronto
+// é exibido a cada quadro de animação: keyframes JPEG tornam obsoletos os
+// frames anteriores (que nem chegam a ser decodificados se ainda estiverem
+// na fila) e, no vídeo, só o último VideoFrame decodificado é desenhado.
+//
+// Eventos para quem controla o renderer, via emit({type, ...}):
+//   rendered  frame exibido (sequence, timestamp, decode, paint, width, height)
+//   keyframe  perdeu a referência: pedir keyframe ao host
+//   fallback  vídeo não suportado (reason): trocar para a camada thumb
+//   stats     a cada segundo: fps, backlog e dropped
+
+class FrameRenderer {
+    constructor(canvas, emit) {
+        this.canvas = canvas;
+        this.ctx = canvas.getContext('2d');
+        this.emit = emit;
+        
+        // Frames em decodificação ou prontos, na ordem de chegada
+        this.pending = [];
+        // Acima disso a exibição desistiu de acompanhar: descarta tudo e pede keyframe
+        this.maxBacklog = 8;
+        this.hasKeyframe = false;
+        this.scheduled = false;
+        
+        // Decodificador WebCodecs dos frames de vídeo (criado no primeiro keyframe)
+        this.videoDecoder = null;
+        this.videoConfig = null;
+        this.videoPending = new Map(); // sequência -> frame aguardando decodificação
+        this.videoFrame = null;        // último VideoFrame decodificado, ainda não exibido
+        this.waitingVideoKeyframe = false;
+        
+        // Exibidos e descartados na janela atual de estatísticas
+        this.renderedCount = 0;
+        this.droppedCount = 0;
+        this.statsStart = performance.now();
+    }
+    
+    push(buffer) {
+        const frame = TARNetProtocol.parseFrame(buffer);
+        if (!frame) return;
+        frame.receivedAt = performance.now();
+        
+        if (frame.type === TARNetProtocol.MSG_VIDEO_FRAME) {
+            this.pushVideoFrame(frame);
+            return;
+        }
+        
+        let entry;
+        if (frame.type === TARNetProtocol.MSG_SCREEN_FRAME) {
+            // Frame completo: os anteriores ainda não exibidos ficam obsoletos
+            this.dropPending();
+            entry = { frame, keyframe: true, result: null, ready: false, dropped: false };
+            entry.decoding = this.decodeImage(frame.payload);
+        } else if (frame.type === TARNetProtocol.MSG_TILE_FRAME) {
+            if (this.pending.length >= this.maxBacklog) {
+                // Deltas dependem de todos os anteriores: recomeça de um keyframe
+                this.dropPending();
+                this.hasKeyframe = false;
+            }
+            if (!this.hasKeyframe && !this.pending.some(entry => entry.keyframe)) {
+                // Sem referência os tiles nem são decodificados
+                this.droppedCount++;
+                this.emit({ type: 'keyframe' });
+                return;
+            }
+            const { width, height, tiles } = TARNetProtocol.parseTiles(frame.payload);
+            entry = { frame, keyframe: false, width, height, tiles, result: null, ready: false, dropped: false };
+            entry.decoding = Promise.all(tiles.map(tile => this.decodeImage(tile.data)));
+        } else {
+            return;
+        }
+        
+        this.pending.push(entry);
+        entry.decoding.then((result) => {
+            if (entry.dropped) {
+                this.closeResult(result);
+                return;
+            }
+            entry.result = result;
+            entry.ready = true;
+            entry.decode = (performance.now() - frame.receivedAt) / 1000;
+            this.schedule();
+        }).catch(() => {
+            console.error('Erro ao decodificar frame');
+            entry.failed = true;
+            entry.ready = true;
+            this.schedule();
+        });
+    }
+    
+    decodeImage(bytes) {
+        // Decodifica direto dos bytes JPEG, sem data URI base64
+        return createImageBitmap(new Blob([bytes], { type: 'image/jpeg' }));
+    }
+    
+    closeResult(result) {
+        if (Array.isArray(result)) {
+            result.forEach(bitmap => bitmap.close());
+        } else if (result) {
+            result.close();
+        }
+    }
+    
+    dropPending() {
+        // Os que ainda estão decodificando liberam o bitmap ao terminar
+        for (const entry of this.pending) {
+            entry.dropped = true;
+            this.closeResult(entry.result);
+            this.droppedCount++;
+        }
+        this.pending = [];
+    }
+    
+    schedule() {
+        if (this.scheduled) return;
+        this.scheduled = true;
+        // requestAnimationFrame existe na thread principal e em workers dedicados
+        // (Chrome, Firefox); sem ele, um intervalo equivalente a 60 Hz
+        if (typeof requestAnimationFrame === 'function') {
+            requestAnimationFrame(() => this.render());
+        } else {
+            setTimeout(() => this.render(), 16);
+        }
+    }
+    
+    render() {
+        this.scheduled = false;
+        
+        // Só os frames prontos no início da fila, para manter a ordem dos deltas
+        let ready = 0;
+        while (ready < this.pending.length && this.pending[ready].ready) ready++;
+        const batch = this.pending.splice(0, ready);
+        
+        // A partir do último keyframe pronto; os anteriores não seriam vistos
+        let start = 0;
+        batch.forEach((entry, i) => { if (entry.keyframe && !entry.failed) start = i; });
+        for (const entry of batch.slice(0, start)) {
+            this.closeResult(entry.result);
+            this.droppedCount++;
+        }
+        
+        let last = null;
+        const paintStart = performance.now();
+        for (const entry of batch.slice(start)) {
+            if (this.paintEntry(entry)) last = entry;
+        }
+        
+        if (this.videoFrame) {
+            last = this.paintVideoFrame() || last;
+        }
+        
+        if (last) {
+            this.renderedCount++;
+            this.emit({
+                type: 'rendered',
+                sequence: last.frame.sequence,
+                timestamp: last.frame.timestamp,
+                decode: last.decode,
+                paint: (performance.now() - paintStart) / 1000,
+                width: this.canvas.width,
+                height: this.canvas.height
+            });
+        }
+        this.reportStats();
+    }
+    
+    paintEntry(entry) {
+        if (entry.failed) {
+            this.hasKeyframe = false;
+            this.emit({ type: 'keyframe' });
+            return false;
+        }
+        
+        if (entry.keyframe) {
+            const bitmap = entry.result;
+            if (this.canvas.width !== bitmap.width || this.canvas.height !== bitmap.height) {
+                this.canvas.width = bitmap.width;
+                this.canvas.height = bitmap.height;
+            }
+            this.ctx.drawImage(bitmap, 0, 0);
+            bitmap.close();
+            this.hasKeyframe = true;
+            return true;
+        }
+        
+        // Tiles só valem sobre um keyframe com a mesma resolução
+        const bitmaps = entry.result;
+        if (!this.hasKeyframe || this.canvas.width !== entry.width || this.canvas.height !== entry.height) {
+            this.closeResult(bitmaps);
+            this.emit({ type: 'keyframe' });
+            return false;
+        }
+        bitmaps.forEach((bitmap, i) => {
+            this.ctx.drawImage(bitmap, entry.tiles[i].x, entry.tiles[i].y);
+            bitmap.close();
+        });
+        return true;
+    }
+    
+    pushVideoFrame(frame) {
+        if (typeof VideoDecoder === 'undefined') {
+            this.emit({ type: 'fallback', reason: 'Navegador sem WebCodecs' });
+            return;
+        }
+        
+        const { codec, width, height, data } = TARNetProtocol.parseVideo(frame.payload);
+        const isKeyframe = (frame.flags & TARNetProtocol.FLAG_KEYFRAME) !== 0;
+        const config = `${codec}:${width}x${height}`;
+        
+        // Decodificador atrasado: descarta deltas até o próximo keyframe
+        if (this.videoDecoder && !isKeyframe &&
+                (this.waitingVideoKeyframe || this.videoDecoder.decodeQueueSize >= this.maxBacklog)) {
+            if (!this.waitingVideoKeyframe) {
+                this.waitingVideoKeyframe = true;
+                this.emit({ type: 'keyframe' });
+            }
+            this.droppedCount++;
+            return;
+        }
+        
+        // A decodificação só pode começar (ou recomeçar) em um keyframe
+        if (config !== this.videoConfig) {
+            if (!isKeyframe) {
+                this.emit({ type: 'keyframe' });
+                return;
+            }
+            this.configureVideoDecoder(codec, width, height, config);
+            if (!this.videoDecoder) return;
+        }
+        if (isKeyframe) this.waitingVideoKeyframe = false;
+        
+        this.videoPending.set(frame.sequence, frame);
+        this.videoDecoder.decode(new EncodedVideoChunk({
+            type: isKeyframe ? 'key' : 'delta',
+            timestamp: frame.sequence,
+            data: data
+        }));
+    }
+    
+    configureVideoDecoder(codec, width, height, config) {
+        this.resetVideoDecoder();
+        this.videoDecoder = new VideoDecoder({
+            output: (videoFrame) => this.onVideoFrame(videoFrame),
+            error: (error) => {
+                console.error('Erro ao decodificar vídeo:', error);
+                if (error.name === 'NotSupportedError') {
+                    this.emit({ type: 'fallback', reason: `Codec ${codec} não suportado` });
+                    return;
+                }
+                this.resetVideoDecoder();
+                this.emit({ type: 'keyframe' });
+            }
+        });
+        
+        try {
+            this.videoDecoder.configure({
+                codec: codec,
+                codedWidth: width,
+                codedHeight: height,
+                optimizeForLatency: true
+            });
+            this.videoConfig = config;
+        } catch (error) {
+            this.emit({ type: 'fallback', reason: `Codec ${codec} não suportado` });
+        }
+    }
+    
+    onVideoFrame(videoFrame) {
+        // A saída segue a ordem de decodificação: descarta pendentes anteriores
+        let frame = null;
+        for (const [sequence, pending] of this.videoPending) {
+            this.videoPending.delete(sequence);
+            if (sequence === videoFrame.timestamp) {
+                frame = pending;
+                break;
+            }
+        }
+        
+        // Só o mais recente é desenhado no próximo quadro
+        if (this.videoFrame) {
+            this.videoFrame.close();
+            this.droppedCount++;
+        }
+        this.videoFrame = videoFrame;
+        this.videoFrameInfo = frame;
+        if (frame) frame.decode = (performance.now() - frame.receivedAt) / 1000;
+        this.schedule();
+    }
+    
+    paintVideoFrame() {
+        const videoFrame = this.videoFrame;
+        this.videoFrame = null;
+        if (this.canvas.width !== videoFrame.displayWidth || this.canvas.height !== videoFrame.displayHeight) {
+            this.canvas.width = videoFrame.displayWidth;
+            this.canvas.height = videoFrame.displayHeight;
+        }
+        this.ctx.drawImage(videoFrame, 0, 0);
+        videoFrame.close();
+        this.hasKeyframe = true;
+        
+        const frame = this.videoFrameInfo;
+        return frame ? { frame, decode: frame.decode } : null;
+    }
+    
+    resetVideoDecoder() {
+        if (this.videoDecoder && this.videoDecoder.state !== 'closed') {
+            this.videoDecoder.close();
+        }
+        this.videoDecoder = null;
+        this.videoConfig = null;
+        this.videoPending.clear();
+        this.waitingVideoKeyframe = false;
+        if (this.videoFrame) {
+            this.videoFrame.close();
+            this.videoFrame = null;
+        }
+    }
+    
+    reset() {
+        // Troca de camada ou visão: nada do stream anterior deve ser exibido
+        this.dropPending();
+        this.resetVideoDecoder();
+        this.hasKeyframe = false;
+    }
+    
+    backlog() {
+        const videoQueue = this.videoDecoder ? this.videoDecoder.decodeQueueSize : 0;
+        return this.pending.length + videoQueue + (this.videoFrame ? 1 : 0);
+    }
+    
+    reportStats() {
+        const now = performance.now();
+        const elapsed = now - this.statsStart;
+        if (elapsed < 1000) return;
+        
+        this.emit({
+            type: 'stats',
+            fps: Math.round(this.renderedCount * 10000 / elapsed) / 10,
+            backlog: this.backlog(),
+            dropped: this.droppedCount
+        });
+        this.renderedCount = 0;
+        this.droppedCount = 0;
+        this.statsStart = now;
+    }
+}
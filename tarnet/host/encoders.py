@@ -0,0 +1,186 @@
+"""Codificadores de frames do Host Agent.
+
+Todos seguem a interface do TileEncoder: `encode(bgra, size, quality)`
+retorna (tipo, flags, payload) ou None se não há nada a enviar,
+`request_keyframe()` força um frame independente, `set_output_size()`
+muda a resolução de saída e `resize_time` acumula o redimensionamento do
+último encode().
+
+encode() roda na thread de codificação, enquanto request_keyframe() e
+set_output_size() são chamados do loop asyncio: eles só gravam um pedido
+(um atributo) que o próximo encode() aplica no início, sem mexer no estado
+que uma codificação em andamento está usando.
+
+- "jpeg": frame inteiro em JPEG a cada captura;
+- "tiles": só os tiles alterados em JPEG (TileEncoder);
+- "h264" / "vp8": codec de vídeo com predição entre frames (libx264 ou
+  libvpx via PyAV, só CPU, ajustado para baixa latência: sem B-frames e sem
+  frames de atraso). Requer `pip install av`.
+"""
+import time
+from fractions import Fraction
+
+import numpy as np
+
+from shared.protocol import (
+    FLAG_KEYFRAME, MSG_SCREEN_FRAME, MSG_VIDEO_FRAME, VIDEO_CODECS, pack_video
+)
+from preprocess import JpegWriter, fit_size, prepare_rgb
+from tiles import TileEncoder
+
+try:
+    import av
+except ImportError:  # PyAV é opcional; sem ele só há os codificadores JPEG
+    av = None
+
+ENCODERS = ("jpeg", "tiles", "h264", "vp8")
+
+# Codec do PyAV e opções de baixa latência de cada formato de vídeo
+VIDEO_SETTINGS = {
+    "h264": ("libx264", {"preset": "ultrafast", "tune": "zerolatency", "profile": "baseline"}),
+    "vp8": ("libvpx", {"deadline": "realtime", "cpu-used": "8", "lag-in-frames": "0"}),
+}
+
+
+class JpegEncoder:
+    """Frame inteiro em JPEG a cada captura (sem dependência entre frames)"""
+
+    def __init__(self, output_size=(1280, 720)):
+        self.output_size = output_size
+        self.requested_size = output_size  # aplicado no próximo encode()
+        self.resize_time = 0.0
+        self._jpeg = JpegWriter()
+
+    def set_output_size(self, output_size):
+        self.requested_size = output_size
+
+    def request_keyframe(self):
+        """Todo frame já é independente"""
+
+    def encode(self, bgra, size, quality):
+        self.resize_time = 0.0
+        self.output_size = self.requested_size
+        # Mantém a proporção e não amplia telas menores que a saída
+        output_size = fit_size(size, self.output_size)
+        started = time.perf_counter()
+        img = prepare_rgb(bgra, size, output_size)
+        if output_size != size:
+            self.resize_time = time.perf_counter() - started
+
+        return MSG_SCREEN_FRAME, FLAG_KEYFRAME, self._jpeg.encode(img, quality)
+
+
+class VideoEncoder:
+    """Codec de vídeo (H.264 ou VP8) com keyframes periódicos ou sob demanda"""
+
+    def __init__(self, codec="h264", output_size=(1280, 720), keyframe_interval=5.0, fps=10):
+        if av is None:
+            raise RuntimeError("PyAV não instalado (pip install av)")
+        self.codec = codec
+        self.codec_id = VIDEO_CODECS.index(codec)
+        self.output_size = output_size
+        self.requested_size = output_size  # aplicado no próximo encode()
+        self.keyframe_interval = keyframe_interval
+        self.fps = fps
+
+        self.context = None  # aberto no primeiro frame (depende da resolução)
+        self.source = None   # frame BGRA reaproveitado entre capturas
+        self.frame_size = None
+        self.crf = None
+        self.started = time.time()
+        self.last_keyframe = 0.0
+        self.keyframe_requested = True
+        self.resize_time = 0.0
+
+    def set_output_size(self, output_size):
+        """Pede outra resolução de saída; o codec é reaberto no próximo frame"""
+        self.requested_size = output_size
+
+    def request_keyframe(self):
+        self.keyframe_requested = True
+
+    @staticmethod
+    def quality_to_crf(quality):
+        """Converte a qualidade JPEG (10-95) na escala de CRF (menor = melhor)"""
+        return max(10, min(51, round(48 - 0.35 * quality)))
+
+    def _open(self, frame_size, crf):
+        name, options = VIDEO_SETTINGS[self.codec]
+        context = av.CodecContext.create(name, "w")
+        context.width, context.height = frame_size
+        context.pix_fmt = "yuv420p"
+        context.time_base = Fraction(1, 1000)  # pts em milissegundos
+        context.framerate = Fraction(round(self.fps))
+        context.gop_size = max(1, round(self.keyframe_interval * self.fps))
+        context.max_b_frames = 0
+        if self.codec == "vp8":
+            # libvpx só aceita CRF junto com um teto de bitrate
+            context.bit_rate = 8_000_000
+        context.options = {**options, "crf": str(crf)}
+
+        self.context = context
+        self.frame_size = frame_size
+        self.crf = crf
+        self.keyframe_requested = True
+
+    def _source_frame(self, bgra, size):
+        """Copia a captura para o frame BGRA reaproveitado (realoca se o tamanho mudar)"""
+        width, height = size
+        source = self.source
+        if source is None or (source.width, source.height) != size:
+            source = self.source = av.VideoFrame(width, height, "bgra")
+        if source.planes[0].line_size != width * 4:
+            # Linhas com preenchimento: o buffer não pode ser copiado de uma vez
+            pixels = np.frombuffer(bgra, dtype=np.uint8).reshape(height, width, 4)
+            return av.VideoFrame.from_ndarray(pixels, format="bgra")
+        source.planes[0].update(bgra)
+        return source
+
+    def encode(self, bgra, size, quality):
+        self.resize_time = 0.0
+        requested = self.requested_size
+        if requested != self.output_size:
+            self.output_size = requested
+            self.context = None
+
+        # Mantém a proporção e não amplia telas menores que a saída
+        frame_size = fit_size(size, self.output_size, even=True)
+        crf = self.quality_to_crf(quality)
+        # Reabrir o codec custa um keyframe: só para mudanças grandes de qualidade
+        if self.context is None or frame_size != self.frame_size or abs(crf - self.crf) >= 4:
+            self._open(frame_size, crf)
+
+        # Redução e conversão para YUV em um único passo do swscale
+        started = time.perf_counter()
+        frame = self._source_frame(bgra, size).reformat(
+            width=frame_size[0], height=frame_size[1], format="yuv420p",
+            interpolation="AREA"
+        )
+        if frame_size != size:
+            self.resize_time = time.perf_counter() - started
+
+        now = time.time()
+        if self.keyframe_requested or now - self.last_keyframe >= self.keyframe_interval:
+            frame.pict_type = av.video.frame.PictureType.I
+            self.keyframe_requested = False
+            self.last_keyframe = now
+        frame.pts = int((now - self.started) * 1000)
+
+        packets = self.context.encode(frame)
+        if not packets:
+            return None
+
+        keyframe = any(packet.is_keyframe for packet in packets)
+        payload = pack_video(self.codec_id, *frame_size, b"".join(bytes(packet) for packet in packets))
+        return MSG_VIDEO_FRAME, FLAG_KEYFRAME if keyframe else 0, payload
+
+
+def create_encoder(name, output_size, keyframe_interval=5.0, fps=10):
+    """Cria o codificador pelo nome (ENCODERS); RuntimeError se indisponível"""
+    if name == "jpeg":
+        return JpegEncoder(output_size)
+    if name == "tiles":
+        return TileEncoder(output_size=output_size, keyframe_interval=keyframe_interval)
+    if name in VIDEO_SETTINGS:
+        return VideoEncoder(name, output_size, keyframe_interval, fps)
+    raise RuntimeError(f"Codificador desconhecido: {name}")
@@ -1,143 +1,585 @@
+import argparse
 import asyncio
 import websockets
 import json
-import base64
-import io
-import uuid
+import logging
+import os
+import random
+import sys
 import time
-from mss import mss
-from PIL import Image
-import pyautogui
+
+# Permite importar o pacote compartilhado (tarnet/shared) ao rodar "python host.py"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.protocol import (
+    HEADER_SIZE, HOST_MODES, LAYER_FULL, LAYER_THUMB, LAYERS, VIEW_BASE, coalesce_moves,
+    host_id_to_bytes, pack_frame
+)
+from shared.logs import RateLimitedLog, fields, setup_logging
+from shared.metrics import Histogram
+from injector import InputInjector
+from pipeline import CapturePipeline
+from ratecontrol import RateController
+from identity import load_identity, save_identity, state_path
+
+# Camadas de simulcast (mesma ordem de LAYERS): escala sobre a resolução
+# de saída e ajuste na qualidade JPEG
+LAYER_SETTINGS = (
+    (1.0, 0),     # full
+    (0.5, 0),     # half
+    (0.25, -15),  # thumb
+)
+
+# Comandos executados pela thread de injeção de entrada
+INPUT_COMMANDS = ("mouse_move", "mouse_click", "key_press")
+
+logger = logging.getLogger(__name__)
+# Eventos por comando de entrada ou por frame: no máximo um registro por
+# segundo de cada tipo, com a contagem dos suprimidos
+event_log = RateLimitedLog(logger, interval=1.0)
 
 class HostAgent:
-    def __init__(self):
-        self.host_id = str(uuid.uuid4())
-        self.websocket = None
+    def __init__(self, codec="tiles", identity_path=None, local_socket=None, mode="both"):
+        # Modo (HOST_MODES): "stream" transmite sem aceitar controle (quiosques
+        # sem display para o pyautogui), "input" só executa comandos
+        if mode not in HOST_MODES:
+            raise ValueError(f"Modo inválido: {mode}")
+        self.mode = mode
+        self.streams = mode != "input"
+        self.accepts_input = mode != "stream"
+        
+        # Backends importados só quando o modo os usa: o pyautogui é lento para
+        # carregar e exige display; mss, PIL, NumPy e PyAV só servem para transmitir
+        self.mss = None
+        self.pyautogui = None
+        if self.streams:
+            from mss import mss
+            self.mss = mss
+        if self.accepts_input:
+            import pyautogui
+            pyautogui.FAILSAFE = True
+            pyautogui.PAUSE = 0.01
+            self.pyautogui = pyautogui
+        
+        # ID estável entre reinícios e token para retomar a sala no servidor
+        self.identity_path = identity_path or state_path()
+        self.host_id, self.resume_token = load_identity(self.identity_path)
+        self.host_id_bytes = host_id_to_bytes(self.host_id)
+        self.websocket = None  # None enquanto desconectado
         self.running = False
-        self.screen_capture = mss()
+        self.screen_capture = None  # criado na thread de captura (mss não é thread-safe)
+        self.monitors = []  # monitores do mss (índice 0 é a área de todos), para mapear o mouse
+        self.pipeline = None
+        
+        # Reconexão com espera aleatória entre 0 e min(reconnect_max,
+        # reconnect_base * 2^tentativa), para os hosts não voltarem todos juntos
+        self.reconnect_base = 0.25
+        self.reconnect_max = 30.0
+        self.reconnected_at = None  # instante da reconexão até o primeiro frame enviado
+        
+        # Servidor na mesma máquina (socket Unix): os frames vão por um anel em
+        # memória compartilhada, criado uma vez e mantido entre reconexões, e o
+        # WebSocket leva só os avisos. ring_active quando o servidor aceitou o anel.
+        self.local_socket = local_socket
+        self.ring = None
+        self.ring_active = False
+        self.ring_size = 32 * 1024 * 1024
         
         # Configurações de captura
         self.capture_interval = 0.1  # 10 FPS
         self.compression_quality = 50  # Qualidade da compressão JPEG
+        self.frame_sequence = 0  # Número de sequência do próximo frame
+        self.base_resolution = (1280, 720)  # Resolução de saída em escala 1.0
+        self.output_resolution = self.base_resolution
+        
+        # Camadas com clientes; o servidor atualiza com set_layers
+        self.active_layers = [LAYER_FULL]
+        # Visões assinadas (stream -> monitor, região): capturadas e codificadas
+        # na resolução nativa, fora do controle adaptativo de resolução
+        self.views = {}
         
-        print(f"Host Agent inicializado com ID: {self.host_id}")
+        # Sem clientes (viewer_demand): "thumbnail" envia só a miniatura a cada
+        # idle_interval (lista de hosts do servidor); "pause" para a captura
+        self.has_viewers = True  # servidores antigos não enviam viewer_demand
+        self.idle_mode = "thumbnail"
+        self.idle_interval = 2.0
+        
+        # Codificador das camadas full e half: "tiles" (só os tiles alterados,
+        # com keyframes periódicos), "jpeg" (frame inteiro) ou "h264"/"vp8"
+        # (vídeo via PyAV). A camada thumb é sempre em tiles: o servidor gera
+        # as miniaturas a partir dela e serve de alternativa para navegadores
+        # sem WebCodecs. Um codificador por stream (camada ou visão), cada um
+        # com seu estado.
+        self.codec = codec
+        self.keyframe_interval = 5.0
+        self.encoders = {}
+        if self.streams:
+            self.encoders = {layer: self.create_layer_encoder(layer) for layer in range(len(LAYERS))}
+        
+        # Controle adaptativo: ajusta FPS, qualidade e resolução conforme o link
+        self.adaptive_rate = True
+        self.rate_controller = RateController(
+            fps=round(1 / self.capture_interval),
+            quality=self.compression_quality
+        )
+        
+        # Mouse e teclado são injetados em uma thread própria (pyautogui bloqueia)
+        self.injector = InputInjector(self.execute_input)
+        
+        # Duração de cada estágio, enviada ao servidor a cada metrics_interval
+        self.metrics_interval = 5.0
+        self.resize_time = 0.0  # redimensionamento acumulado da captura atual
+        self.stage_metrics = {
+            'capture': Histogram(),
+            'resize': Histogram(),
+            'encode': Histogram(),
+            'send': Histogram(),
+            'input': self.injector.latency
+        }
+        
+        logger.info("Host Agent inicializado", extra=fields(host_id=self.host_id, mode=self.mode))
     
     async def connect_to_server(self, server_url="ws://localhost:8000"):
         """Conecta ao servidor WebSocket"""
         try:
-            self.websocket = await websockets.connect(server_url)
-            print(f"Conectado ao servidor: {server_url}")
+            if self.local_socket:
+                if self.ring is None and self.streams:
+                    from shared.ring import FrameRing
+                    self.ring = FrameRing.create(self.ring_size)
+                self.websocket = await websockets.unix_connect(self.local_socket)
+                logger.info(f"Conectado ao servidor local: {self.local_socket}")
+            else:
+                self.websocket = await websockets.connect(server_url)
+                logger.info(f"Conectado ao servidor: {server_url}")
             
             # Registrar o host no servidor
             await self.register_host()
             
             return True
         except Exception as e:
-            print(f"Erro ao conectar com o servidor: {e}")
+            logger.error(f"Erro ao conectar com o servidor: {e}")
+            if self.websocket:
+                await self.websocket.close()
+                self.websocket = None
             return False
     
     async def register_host(self):
         """Registra o host no servidor com ID único"""
+        # Monitores disponíveis para os clientes escolherem visões; sem o mss
+        # (modo "input") só a tela principal, para mapear o mouse
+        if self.mss is not None:
+            with self.mss() as screen_capture:
+                self.monitors = screen_capture.monitors
+        else:
+            width, height = self.pyautogui.size()
+            screen = {"left": 0, "top": 0, "width": width, "height": height}
+            self.monitors = [screen, screen]
+        
         registration_data = {
             "type": "register_host",
             "host_id": self.host_id,
+            "mode": self.mode,
+            "resume_token": self.resume_token,
+            "ring": self.ring.name if self.ring else None,
+            "monitors": [
+                {key: monitor[key] for key in ("left", "top", "width", "height")}
+                for monitor in self.monitors[1:]
+            ],
             "timestamp": time.time()
         }
         
         await self.websocket.send(json.dumps(registration_data))
-        print(f"Host registrado no servidor com ID: {self.host_id}")
+        logger.info("Host registrado no servidor", extra=fields(host_id=self.host_id))
+    
+    def view_area(self, monitor, region):
+        """Retângulo (left, top, largura, altura) de um monitor ou região dele na tela"""
+        bounds = self.monitors[monitor]
+        if region is None:
+            return bounds["left"], bounds["top"], bounds["width"], bounds["height"]
+        x, y, width, height = region
+        return bounds["left"] + x, bounds["top"] + y, width, height
     
-    def capture_screen(self):
-        """Captura a tela e converte para base64"""
+    def grab_screen(self):
+        """Captura a tela principal e as visões; retorna [(streams, captura)] (thread de captura)"""
         try:
-            # Captura a tela principal
-            monitor = self.screen_capture.monitors[1]  # Monitor principal
-            screenshot = self.screen_capture.grab(monitor)
+            if self.screen_capture is None:
+                self.screen_capture = self.mss()
+                self.monitors = self.screen_capture.monitors
             
-            # Converte para PIL Image
-            img = Image.frombytes("RGB", screenshot.size, screenshot.bgra, "raw", "BGRX")
+            # Só os retângulos assinados são capturados; visões iguais entre si
+            # ou ao monitor principal compartilham a mesma captura
+            areas = {}
+            layers = self.active_layers if self.has_viewers else [LAYER_THUMB]
+            if layers:
+                areas[self.view_area(1, None)] = list(layers)
+            if self.has_viewers:
+                for stream, (monitor, region) in self.views.items():
+                    areas.setdefault(self.view_area(monitor, region), []).append(stream)
             
-            # Redimensiona para otimizar (opcional)
-            img = img.resize((1280, 720), Image.Resampling.LANCZOS)
-            
-            # Comprime e converte para base64
-            buffer = io.BytesIO()
-            img.save(buffer, format="JPEG", quality=self.compression_quality)
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            
-            return img_str
+            started = time.perf_counter()
+            captures = [
+                (streams, self.screen_capture.grab(
+                    {"left": left, "top": top, "width": width, "height": height}
+                ))
+                for (left, top, width, height), streams in areas.items()
+            ]
+            self.stage_metrics['capture'].observe(time.perf_counter() - started)
+            return captures or None
         
         except Exception as e:
-            print(f"Erro ao capturar tela: {e}")
+            event_log.error("capture", "Erro ao capturar tela", error=e)
+            return None
+    
+    def layer_size(self, layer):
+        """Resolução de uma camada a partir da resolução de saída atual"""
+        scale = LAYER_SETTINGS[layer][0]
+        return (int(self.output_resolution[0] * scale), int(self.output_resolution[1] * scale))
+    
+    def layer_quality(self, layer):
+        if layer >= VIEW_BASE:
+            return self.compression_quality  # visões não têm ajuste por camada
+        return max(10, self.compression_quality + LAYER_SETTINGS[layer][1])
+    
+    def encode_screen(self, captures):
+        """Codifica as capturas em cada stream ativo; retorna [(stream, tipo, flags, payload)] ou None"""
+        started = time.perf_counter()
+        self.resize_time = 0.0
+        try:
+            frames = []
+            for streams, screenshot in captures:
+                for stream in streams:
+                    encoded = self.encode_layer(screenshot, stream)
+                    if encoded is not None:
+                        frames.append((stream, *encoded))
+            return frames or None
+        
+        except Exception as e:
+            event_log.error("encode", "Erro ao codificar tela", error=e)
+            return None
+        
+        finally:
+            elapsed = time.perf_counter() - started
+            self.rate_controller.record_encode(elapsed)
+            self.stage_metrics['encode'].observe(elapsed)
+            self.stage_metrics['resize'].observe(self.resize_time)
+    
+    def create_layer_encoder(self, layer):
+        """Codificador de uma camada"""
+        codec = "tiles" if layer == LAYER_THUMB else self.codec
+        return self.create_stream_encoder(codec, self.layer_size(layer))
+    
+    def create_stream_encoder(self, codec, output_size):
+        """Cria um codificador; sem PyAV volta para tiles"""
+        # NumPy, PIL e (se houver) PyAV só carregam quando o host transmite
+        from encoders import create_encoder
+        try:
+            return create_encoder(codec, output_size, self.keyframe_interval,
+                                  round(1 / self.capture_interval))
+        except RuntimeError as e:
+            logger.warning(f"Codificador {codec} indisponível ({e}); usando tiles")
+            self.codec = "tiles"
+            return create_encoder("tiles", output_size, self.keyframe_interval)
+    
+    def encode_layer(self, screenshot, layer):
+        """Codifica uma camada ou visão; retorna (tipo, flags, payload) ou None se nada mudou"""
+        # Visão removida entre a captura e a codificação
+        encoder = self.encoders.get(layer)
+        if encoder is None:
             return None
+        # screenshot.raw é o buffer BGRA do mss; screenshot.bgra faria uma cópia
+        encoded = encoder.encode(screenshot.raw, screenshot.size, self.layer_quality(layer))
+        self.resize_time += encoder.resize_time
+        return encoded
     
-    async def send_screen_frame(self):
-        """Envia frame da tela para o servidor"""
-        screen_data = self.capture_screen()
+    async def send_screen_frame(self, encoded, timestamp):
+        """Envia as camadas codificadas de uma captura para o servidor"""
+        # Todas as camadas da mesma captura usam o mesmo número de sequência
+        # Desconectado: o frame é descartado (a reconexão pede keyframes)
+        websocket = self.websocket
+        if websocket is None:
+            return
         
-        if screen_data:
-            frame_data = {
-                "type": "screen_frame",
-                "host_id": self.host_id,
-                "data": screen_data,
-                "timestamp": time.time()
-            }
+        started = time.perf_counter()
+        sent = 0
+        for layer, msg_type, flags, payload in encoded:
+            if self.ring_active:
+                written = await self.write_ring_frame(websocket, msg_type, flags, layer,
+                                                      payload, timestamp)
+                if written is False:
+                    return
+                if written:
+                    sent += written
+                    continue
+                # Grande demais para o anel: segue pelo WebSocket, depois do aviso
+                # dos frames anteriores (o servidor lê o anel só até o aviso)
+            
+            frame = pack_frame(
+                msg_type,
+                self.host_id_bytes,
+                self.frame_sequence,
+                timestamp,
+                payload,
+                flags,
+                layer
+            )
             
             try:
-                await self.websocket.send(json.dumps(frame_data))
+                await websocket.send(frame)
+            except websockets.exceptions.ConnectionClosed:
+                return
             except Exception as e:
-                print(f"Erro ao enviar frame: {e}")
+                event_log.error("send", "Erro ao enviar frame", error=e)
+                return
+            sent += len(frame)
+        if self.ring_active:
+            try:
+                await websocket.send(self.ring.doorbell())
+            except websockets.exceptions.ConnectionClosed:
+                return
+        self.frame_sequence += 1
+        self.stage_metrics['send'].observe(time.perf_counter() - started)
+        
+        if self.reconnected_at is not None:
+            elapsed = (time.perf_counter() - self.reconnected_at) * 1000
+            self.reconnected_at = None
+            logger.info("Primeiro frame enviado após conectar", extra=fields(ms=round(elapsed)))
+        
+        # Ocioso: as miniaturas não dizem nada sobre a capacidade do link
+        if not self.has_viewers:
+            return
+        
+        # Bytes ainda no buffer do socket (e no anel, não lidos pelo servidor)
+        # indicam quanto o uplink está escoando
+        buffered = websocket.transport.get_write_buffer_size()
+        if self.ring_active:
+            buffered += self.ring.pending()
+        self.rate_controller.record_send(sent, buffered)
+        if self.adaptive_rate and self.rate_controller.update():
+            self.apply_rate_settings()
+    
+    async def write_ring_frame(self, websocket, msg_type, flags, layer, payload, timestamp):
+        """Grava um frame no anel; retorna os bytes, None se não cabe no anel ou
+        False se a conexão caiu enquanto esperava espaço"""
+        while True:
+            written = self.ring.write_frame(msg_type, self.host_id_bytes, self.frame_sequence,
+                                            timestamp, payload, flags, layer)
+            if written:
+                return HEADER_SIZE + len(payload)
+            # Grande demais ou anel cheio: avisa o que já está no anel
+            try:
+                await websocket.send(self.ring.doorbell())
+            except websockets.exceptions.ConnectionClosed:
+                return False
+            if written is None:
+                return None
+            # Espera o servidor ler
+            await asyncio.sleep(0.001)
+            if self.websocket is not websocket:
+                return False
+    
+    def apply_rate_settings(self):
+        """Aplica FPS, qualidade e resolução decididos pelo controle adaptativo"""
+        controller = self.rate_controller
+        base_width, base_height = self.base_resolution
+        
+        self.capture_interval = controller.interval
+        self.compression_quality = controller.quality
+        self.output_resolution = (
+            int(base_width * controller.scale),
+            int(base_height * controller.scale)
+        )
+        for layer in range(len(LAYERS)):
+            self.encoders[layer].set_output_size(self.layer_size(layer))
+        
+        logger.info("Taxa ajustada", extra=fields(
+            fps=controller.fps,
+            quality=controller.quality,
+            resolution=f"{self.output_resolution[0]}x{self.output_resolution[1]}"
+        ))
+    
+    def to_screen(self, command_data):
+        """Converte coordenadas da imagem exibida no cliente para a tela real"""
+        x = command_data.get("x", 0)
+        y = command_data.get("y", 0)
+        if not self.monitors:
+            return x, y
+        
+        # A imagem é o monitor principal (camadas) ou a visão informada
+        monitor, region = self.views.get(command_data.get("view"), (1, None))
+        left, top, area_width, area_height = self.view_area(monitor, region)
+        # O cliente informa o tamanho da imagem que exibe (depende da camada)
+        width = command_data.get("width")
+        height = command_data.get("height")
+        if width and height:
+            x = round(x * area_width / width)
+            y = round(y * area_height / height)
+        return left + x, top + y
+    
+    def set_layers(self, layers, views=()):
+        """Atualiza as camadas e visões codificadas conforme os clientes conectados"""
+        if not self.streams:
+            return
+        # Visões: monitor (1-based, como no mss) e região [x, y, w, h] opcional
+        new_views = {}
+        for view in views:
+            monitor, region = view.get("monitor", 1), view.get("region")
+            if 1 <= monitor < len(self.monitors) and VIEW_BASE <= view.get("id", -1):
+                new_views[view["id"]] = (monitor, tuple(region) if region else None)
+        
+        # Sem clientes mantém a camada principal (cache e miniaturas do servidor)
+        layers = [layer for layer in layers if 0 <= layer < len(LAYERS)]
+        if not layers and not new_views:
+            layers = [LAYER_FULL]
+        
+        # Cada visão tem um codificador na resolução nativa do retângulo; o
+        # dicionário é trocado de uma vez porque a thread de codificação o lê
+        encoders = {
+            stream: encoder for stream, encoder in self.encoders.items()
+            if stream < VIEW_BASE or self.views.get(stream) == new_views.get(stream)
+        }
+        for stream, (monitor, region) in new_views.items():
+            if stream not in encoders:
+                encoders[stream] = self.create_stream_encoder(
+                    self.codec, self.view_area(monitor, region)[2:]
+                )
+        for layer in layers:
+            if layer not in self.active_layers:
+                encoders[layer].request_keyframe()
+        
+        self.encoders = encoders
+        self.views = new_views
+        self.active_layers = layers
+        logger.info("Camadas ativas", extra=fields(
+            layers=",".join(LAYERS[layer] for layer in layers) or "nenhuma",
+            views=len(new_views)
+        ))
+    
+    def get_capture_interval(self):
+        """Intervalo entre capturas (maior quando ninguém está assistindo)"""
+        return self.capture_interval if self.has_viewers else self.idle_interval
+    
+    def set_viewer_demand(self, viewers):
+        """Pausa ou retoma a transmissão quando a sala fica vazia ou ganha clientes"""
+        has_viewers = viewers > 0
+        if has_viewers == self.has_viewers or not self.streams:
+            return
+        self.has_viewers = has_viewers
+        
+        if has_viewers:
+            # Frames anteriores à pausa já não servem de referência
+            for stream in [*self.active_layers, *self.views]:
+                self.encoders[stream].request_keyframe()
+            if self.pipeline:
+                self.pipeline.resume()  # captura já, sem esperar o intervalo ocioso
+            logger.info("Clientes conectados: transmissão retomada", extra=fields(viewers=viewers))
+        else:
+            self.encoders[LAYER_THUMB].request_keyframe()
+            if self.pipeline and self.idle_mode == "pause":
+                self.pipeline.pause()
+            logger.info("Nenhum cliente: transmissão ociosa", extra=fields(mode=self.idle_mode))
     
     def execute_mouse_move(self, x, y):
         """Move o mouse para a posição especificada"""
         try:
-            pyautogui.moveTo(x, y)
-            print(f"Mouse movido para: ({x}, {y})")
+            self.pyautogui.moveTo(x, y)
+            event_log.debug("mouse_move", "Mouse movido", x=x, y=y)
         except Exception as e:
-            print(f"Erro ao mover mouse: {e}")
+            event_log.error("mouse_move_error", "Erro ao mover mouse", error=e)
     
     def execute_mouse_click(self, x, y, button="left"):
         """Executa clique do mouse na posição especificada"""
         try:
-            pyautogui.click(x, y, button=button)
-            print(f"Clique {button} executado em: ({x}, {y})")
+            self.pyautogui.click(x, y, button=button)
+            event_log.info("mouse_click", "Clique executado", button=button, x=x, y=y)
         except Exception as e:
-            print(f"Erro ao executar clique: {e}")
+            event_log.error("mouse_click_error", "Erro ao executar clique", error=e)
     
     def execute_key_press(self, key):
         """Executa pressionamento de tecla"""
         try:
-            pyautogui.press(key)
-            print(f"Tecla pressionada: {key}")
+            self.pyautogui.press(key)
+            event_log.info("key_press", "Tecla pressionada", key=key)
         except Exception as e:
-            print(f"Erro ao pressionar tecla: {e}")
+            event_log.error("key_press_error", "Erro ao pressionar tecla", error=e)
+    
+    def execute_input(self, command_data):
+        """Executa um comando de mouse ou teclado (thread de injeção)"""
+        command_type = command_data.get("type")
+        
+        if command_type == "mouse_move":
+            x, y = self.to_screen(command_data)
+            self.execute_mouse_move(x, y)
+        
+        elif command_type == "mouse_click":
+            x, y = self.to_screen(command_data)
+            button = command_data.get("button", "left")
+            self.execute_mouse_click(x, y, button)
+        
+        elif command_type == "key_press":
+            key = command_data.get("key", "")
+            if key:
+                self.execute_key_press(key)
     
     async def process_command(self, command_data):
         """Processa comandos recebidos do servidor"""
         try:
             command_type = command_data.get("type")
             
-            if command_type == "mouse_move":
-                x = command_data.get("x", 0)
-                y = command_data.get("y", 0)
-                self.execute_mouse_move(x, y)
+            if command_type in INPUT_COMMANDS:
+                if self.accepts_input:
+                    self.injector.submit(command_data)
+                else:
+                    event_log.warning("input_disabled", "Comando de entrada ignorado (modo stream)",
+                                      type=command_type)
+            
+            elif command_type == "command_batch":
+                # Comandos de um quadro do cliente; só o último de cada
+                # sequência de movimentos é executado
+                for command in coalesce_moves(command_data.get("commands", [])):
+                    if command.get("type") != "command_batch":
+                        await self.process_command(command)
+            
+            elif command_type == "viewer_feedback":
+                # Último frame exibido pelo cliente mais atrasado da sala
+                last_rendered = command_data.get("last_rendered")
+                if last_rendered is not None:
+                    self.rate_controller.record_viewer_feedback(
+                        last_rendered, self.frame_sequence - 1
+                    )
             
-            elif command_type == "mouse_click":
-                x = command_data.get("x", 0)
-                y = command_data.get("y", 0)
-                button = command_data.get("button", "left")
-                self.execute_mouse_click(x, y, button)
+            elif command_type == "request_keyframe":
+                # Novo cliente na sala ou cliente que perdeu a referência
+                layer = command_data.get("layer")
+                if layer is None:
+                    for encoder in self.encoders.values():
+                        encoder.request_keyframe()
+                elif layer in self.encoders:
+                    self.encoders[layer].request_keyframe()
             
-            elif command_type == "key_press":
-                key = command_data.get("key", "")
-                if key:
-                    self.execute_key_press(key)
+            elif command_type == "host_registered":
+                # Token novo (registro inicial ou servidor reiniciado): guarda
+                # para retomar a sala depois de uma queda ou reinício
+                token = command_data.get("resume_token")
+                if token and token != self.resume_token:
+                    self.resume_token = token
+                    save_identity(self.identity_path, self.host_id, token)
+                if command_data.get("resumed"):
+                    logger.info("Sessão retomada: sala e clientes mantidos pelo servidor")
+                self.ring_active = bool(self.ring and command_data.get("ring"))
+                if self.ring_active:
+                    logger.info("Frames enviados por memória compartilhada")
+            
+            elif command_type == "set_layers":
+                self.set_layers(command_data.get("layers", []), command_data.get("views", []))
+            
+            elif command_type == "viewer_demand":
+                self.set_viewer_demand(command_data.get("viewers", 0))
             
             else:
-                print(f"Comando desconhecido: {command_type}")
+                event_log.warning("unknown_command", "Comando desconhecido", type=command_type)
         
         except Exception as e:
-            print(f"Erro ao processar comando: {e}")
+            event_log.error("command_error", "Erro ao processar comando", error=e)
     
     async def listen_for_commands(self):
         """Escuta comandos do servidor"""
@@ -147,68 +589,140 @@ class HostAgent:
                     command_data = json.loads(message)
                     await self.process_command(command_data)
                 except json.JSONDecodeError:
-                    print("Mensagem recebida não é JSON válido")
+                    event_log.warning("invalid_json", "Mensagem recebida não é JSON válido")
                 except Exception as e:
-                    print(f"Erro ao processar mensagem: {e}")
+                    event_log.error("message_error", "Erro ao processar mensagem", error=e)
         
         except websockets.exceptions.ConnectionClosed:
-            print("Conexão com servidor foi fechada")
-            self.running = False
+            logger.info("Conexão com servidor foi fechada")
         except Exception as e:
-            print(f"Erro ao escutar comandos: {e}")
+            logger.error(f"Erro ao escutar comandos: {e}")
+    
+    def reconnect_delay(self, attempt):
+        """Espera antes da tentativa de reconexão (backoff exponencial com jitter)"""
+        return random.uniform(0, min(self.reconnect_max, self.reconnect_base * 2 ** attempt))
+    
+    def on_connected(self):
+        """Retoma a transmissão: o pipeline continua aquecido, só falta um keyframe"""
+        self.reconnected_at = time.perf_counter()
+        # Os clientes (e o cache do servidor) perderam os deltas do intervalo
+        for encoder in self.encoders.values():
+            encoder.request_keyframe()
+        if self.pipeline and (self.has_viewers or self.idle_mode != "pause"):
+            self.pipeline.resume()  # captura já, sem esperar o prazo
+    
+    def on_disconnected(self):
+        """Pausa a captura; threads, codificadores e estado ficam prontos para voltar"""
+        self.websocket = None
+        self.ring_active = False
+        if self.pipeline:
+            self.pipeline.pause()
+    
+    async def connection_loop(self, server_url):
+        """Conecta e reconecta ao servidor enquanto o agente estiver rodando"""
+        attempt = 0
+        while self.running:
+            if await self.connect_to_server(server_url):
+                attempt = 0
+                self.on_connected()
+                await self.listen_for_commands()
+                self.on_disconnected()
+            
+            delay = self.reconnect_delay(attempt)
+            attempt += 1
+            logger.info(f"Reconectando em {delay:.1f} s", extra=fields(attempt=attempt))
+            await asyncio.sleep(delay)
     
-    async def screen_capture_loop(self):
-        """Loop principal de captura e envio de tela"""
+    async def metrics_loop(self):
+        """Envia periodicamente os histogramas de estágios ao servidor"""
         while self.running:
-            await self.send_screen_frame()
-            await asyncio.sleep(self.capture_interval)
+            await asyncio.sleep(self.metrics_interval)
+            websocket = self.websocket
+            if websocket is None:
+                continue
+            try:
+                await websocket.send(json.dumps({
+                    "type": "host_metrics",
+                    "host_id": self.host_id,
+                    "stages": {
+                        stage: histogram.snapshot()
+                        for stage, histogram in self.stage_metrics.items()
+                    }
+                }))
+            except websockets.exceptions.ConnectionClosed:
+                continue  # a reconexão é tratada em connection_loop
     
-    async def run(self):
+    async def run(self, server_url="ws://localhost:8000"):
         """Executa o Host Agent"""
-        print("Iniciando Host Agent...")
-        
-        # Conecta ao servidor
-        if not await self.connect_to_server():
-            print("Falha ao conectar com o servidor. Verifique se o servidor está rodando.")
-            return
+        logger.info("Iniciando Host Agent...")
         
         self.running = True
+        if self.accepts_input:
+            self.injector.start()
         
-        try:
-            # Executa captura de tela e escuta de comandos em paralelo
-            await asyncio.gather(
-                self.screen_capture_loop(),
-                self.listen_for_commands()
+        tasks = [asyncio.create_task(self.metrics_loop())]
+        if self.streams:
+            # Captura e codificação rodam em threads; o loop asyncio fica livre para
+            # comandos. O pipeline vive entre reconexões e começa pausado até conectar.
+            self.pipeline = CapturePipeline(
+                self.grab_screen,
+                self.encode_screen,
+                self.send_screen_frame,
+                self.get_capture_interval
             )
+            self.pipeline.pause()
+            tasks.append(asyncio.create_task(self.pipeline.run()))
+        
+        try:
+            await self.connection_loop(server_url)
         
         except KeyboardInterrupt:
-            print("Host Agent interrompido pelo usuário")
+            logger.info("Host Agent interrompido pelo usuário")
         
         except Exception as e:
-            print(f"Erro durante execução: {e}")
+            logger.error(f"Erro durante execução: {e}")
         
         finally:
             self.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.injector.stop()
             if self.websocket:
                 await self.websocket.close()
-            print("Host Agent finalizado")
+            if self.ring is not None:
+                self.ring.close()
+            
+            stats = self.injector.get_stats()
+            logger.info("Comandos de entrada executados", extra=fields(
+                commands=stats['executed'],
+                avg_latency_ms=stats['avg_latency_ms'],
+                max_latency_ms=stats['max_latency_ms']
+            ))
+            logger.info("Host Agent finalizado")
 
-async def main():
+async def main(mode):
     """Função principal"""
-    # Configuração de segurança do pyautogui
-    pyautogui.FAILSAFE = True
-    pyautogui.PAUSE = 0.01
-    
-    # Criar e executar o Host Agent
-    host_agent = HostAgent()
+    # Criar e executar o Host Agent (TARNET_CODEC: jpeg, tiles, h264 ou vp8).
+    # TARNET_SERVER_SOCKET: socket Unix de um servidor na mesma máquina
+    host_agent = HostAgent(codec=os.environ.get("TARNET_CODEC", "tiles"),
+                           local_socket=os.environ.get("TARNET_SERVER_SOCKET"),
+                           mode=mode)
     await host_agent.run()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host Agent do TARNet")
+    parser.add_argument("--mode", choices=HOST_MODES,
+                        default=os.environ.get("TARNET_HOST_MODE", "both"),
+                        help="stream: só transmite; input: só aceita controle; both (padrão)")
+    args = parser.parse_args()
+    
     print("=== TARNet Host Agent ===")
     print("Pressione Ctrl+C para sair")
     print()
     
+    setup_logging()
     try:
-        asyncio.run(main())
+        asyncio.run(main(args.mode))
     except KeyboardInterrupt:
         print("\nHost Agent finalizado pelo usuário")
\ No newline at end of file
@@ -0,0 +1,43 @@
+"""Identidade persistente do Host Agent.
+
+O ID do host e o token de retomada ficam em um arquivo JSON (padrão
+~/.tarnet/host.json, ou TARNET_HOST_STATE), para que o host volte com o
+mesmo ID depois de reiniciar. Com o token, o servidor reconhece a volta
+dentro do período de tolerância e mantém a sala e os clientes.
+"""
+import json
+import logging
+import os
+import uuid
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".tarnet", "host.json")
+
+logger = logging.getLogger(__name__)
+
+
+def state_path():
+    return os.environ.get("TARNET_HOST_STATE", DEFAULT_PATH)
+
+
+def load_identity(path):
+    """Retorna (host_id, token de retomada); gera e grava um ID novo se não houver"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        host_id = str(uuid.UUID(state["host_id"]))
+        return host_id, state.get("resume_token")
+    except (OSError, ValueError, KeyError, TypeError):
+        host_id = str(uuid.uuid4())
+        save_identity(path, host_id, None)
+        return host_id, None
+
+
+def save_identity(path, host_id, resume_token):
+    """Grava o ID e o token (só o usuário lê: o token permite retomar a sala)"""
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"host_id": host_id, "resume_token": resume_token}, f)
+    except OSError as e:
+        logger.warning(f"Não foi possível gravar a identidade do host em {path}: {e}")
@@ -0,0 +1,132 @@
+"""Injeção de entrada (mouse e teclado) em uma thread dedicada.
+
+As funções do pyautogui bloqueiam (pelo menos `pyautogui.PAUSE` por
+evento), então rodam fora do loop asyncio para não atrasar o envio de
+frames nem a leitura do WebSocket. Os comandos passam por uma fila limitada
+com prioridade para cliques e teclas:
+
+- movimentos seguidos na fila são fundidos (só a posição final importa);
+- um clique descarta os movimentos que ainda esperavam antes dele, já que
+  traz a própria posição;
+- com a fila cheia, movimentos pendentes são descartados antes de qualquer
+  clique ou tecla.
+
+A latência de cada comando (da chegada até o fim da execução) é medida.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from shared.logs import RateLimitedLog
+from shared.metrics import Histogram
+
+MOUSE_MOVE = "mouse_move"
+MOUSE_CLICK = "mouse_click"
+
+# Falhas se repetem a cada evento quando o backend de entrada está quebrado
+error_log = RateLimitedLog(logging.getLogger(__name__), interval=5.0)
+
+
+class InputInjector:
+    """Fila limitada de comandos de entrada executados em uma thread própria"""
+
+    def __init__(self, execute, max_pending=256):
+        self.execute = execute  # (comando) -> None, chamado na thread de injeção
+        self.max_pending = max_pending
+
+        self._pending = deque()  # (instante de chegada, comando)
+        self._condition = threading.Condition()
+        self._thread = None
+        self.running = False
+
+        # Estatísticas
+        self.executed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.latency = Histogram()
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="input", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self.running = False
+            self._pending.clear()
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def submit(self, command):
+        """Enfileira um comando (chamado pelo loop asyncio, não bloqueia)"""
+        now = time.perf_counter()
+        command_type = command.get("type")
+
+        with self._condition:
+            pending = self._pending
+
+            if command_type == MOUSE_MOVE:
+                # Substitui o movimento que ainda não foi executado
+                if pending and pending[-1][1].get("type") == MOUSE_MOVE:
+                    pending[-1] = (pending[-1][0], command)
+                    self.coalesced += 1
+                    return
+
+            elif command_type == MOUSE_CLICK:
+                self._drop_moves()
+
+            if len(pending) >= self.max_pending and not self._drop_moves():
+                # Só cliques e teclas pendentes: descarta o comando novo
+                self.dropped += 1
+                return
+
+            pending.append((now, command))
+            self._condition.notify()
+
+    def _drop_moves(self):
+        """Remove os movimentos pendentes; retorna True se removeu algum"""
+        pending = self._pending
+        kept = [item for item in pending if item[1].get("type") != MOUSE_MOVE]
+        removed = len(pending) - len(kept)
+        if removed:
+            pending.clear()
+            pending.extend(kept)
+            self.coalesced += removed
+        return removed > 0
+
+    def _run(self):
+        """Executa os comandos na ordem da fila (thread de injeção)"""
+        while True:
+            with self._condition:
+                while self.running and not self._pending:
+                    self._condition.wait()
+                if not self.running:
+                    return
+                queued_at, command = self._pending.popleft()
+
+            try:
+                self.execute(command)
+            except Exception as e:
+                error_log.error(command.get('type'), "Erro ao executar comando",
+                                type=command.get('type'), error=e)
+
+            latency = time.perf_counter() - queued_at
+            self.executed += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.latency.observe(latency)
+
+    def get_stats(self):
+        """Comandos executados, fundidos e descartados, e latência em ms"""
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'pending': len(self._pending),
+            'avg_latency_ms': round(1000 * self.total_latency / self.executed, 1) if self.executed else 0.0,
+            'max_latency_ms': round(1000 * self.max_latency, 1)
+        }
@@ -0,0 +1,158 @@
+"""Pipeline de captura, codificação e envio de frames do Host Agent.
+
+Captura e codificação rodam em threads próprias (mss, PIL e NumPy liberam o
+GIL nas partes pesadas), então o loop asyncio fica livre para receber
+comandos. Os estágios se sobrepõem: enquanto o frame N é codificado ou
+enviado, o frame N+1 já está sendo capturado.
+
+O ritmo é controlado por prazo (deadline): cada captura é agendada para o
+instante ideal do próximo frame, descontando o tempo gasto. Se a codificação
+ou o envio não acompanharem, a captura nova é descartada em vez de
+enfileirada. Frames já codificados nunca são descartados, porque frames
+delta dependem dos anteriores. Um erro ao enviar um frame é registrado e o
+estágio de envio segue para o próximo, para não travar a codificação.
+
+O pipeline pode ser pausado (nenhuma captura) e acordado antes do prazo,
+para retomar na hora quando o intervalo muda.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from shared.logs import RateLimitedLog
+
+logger = logging.getLogger(__name__)
+error_log = RateLimitedLog(logger, interval=5.0)
+
+
+class CapturePipeline:
+    """Estágios captura → codificação → envio com ritmo por prazo"""
+
+    def __init__(self, grab, encode, send, get_interval):
+        self.grab = grab                  # () -> screenshot (thread de captura)
+        self.encode = encode              # (screenshot) -> frame ou None (thread de codificação)
+        self.send = send                  # async (frame, timestamp) -> None
+        self.get_interval = get_interval  # () -> segundos entre frames
+
+        self._capture_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+        self._encode_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+        self._send_queue = asyncio.Queue(maxsize=1)
+        self._encoding = None
+        self._sender = None
+        self._wake = asyncio.Event()
+        self.running = False
+        self.paused = False
+
+        # Estatísticas
+        self.captured_frames = 0
+        self.encoded_frames = 0
+        self.sent_frames = 0
+        self.dropped_frames = 0
+        self.failed_frames = 0
+
+    async def run(self):
+        """Executa o estágio de captura até stop() ser chamado"""
+        loop = asyncio.get_running_loop()
+        self.running = True
+        self._sender = asyncio.create_task(self._send_stage())
+        deadline = loop.time()
+
+        try:
+            while self.running:
+                if self.paused:
+                    await self._wake.wait()
+                    self._wake.clear()
+                    deadline = loop.time()
+                    continue
+
+                deadline += self.get_interval()
+
+                timestamp = time.time()
+                screenshot = await loop.run_in_executor(self._capture_pool, self.grab)
+                if screenshot is not None:
+                    self.captured_frames += 1
+
+                    # Codificador ocupado (ou envio atrasado): descarta a captura
+                    if self._encoding is None or self._encoding.done():
+                        self._encoding = asyncio.create_task(
+                            self._encode_stage(screenshot, timestamp)
+                        )
+                    else:
+                        self.dropped_frames += 1
+
+                delay = deadline - loop.time()
+                if delay <= 0 or await self._sleep(delay):
+                    # Atrasado (não compensa os frames perdidos) ou acordado
+                    deadline = loop.time()
+        finally:
+            await self.stop()
+
+    async def _sleep(self, delay):
+        """Espera até o prazo; retorna True se wake() interrompeu a espera"""
+        try:
+            await asyncio.wait_for(self._wake.wait(), delay)
+        except asyncio.TimeoutError:
+            return False
+        self._wake.clear()
+        return True
+
+    def wake(self):
+        """Captura o próximo frame já, sem esperar o prazo atual"""
+        self._wake.set()
+
+    def pause(self):
+        """Para de capturar até resume()"""
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        self._wake.set()
+
+    async def _encode_stage(self, screenshot, timestamp):
+        """Codifica fora do loop e entrega para o estágio de envio"""
+        loop = asyncio.get_running_loop()
+        frame = await loop.run_in_executor(self._encode_pool, self.encode, screenshot)
+        if frame is not None:
+            self.encoded_frames += 1
+            # Bloqueia enquanto o envio anterior não terminar (mantém a ordem)
+            await self._send_queue.put((frame, timestamp))
+
+    async def _send_stage(self):
+        """Envia frames codificados na ordem em que foram produzidos"""
+        while True:
+            frame, timestamp = await self._send_queue.get()
+            try:
+                await self.send(frame, timestamp)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # O frame se perde, mas o estágio continua: se esta tarefa
+                # morresse, _encode_stage ficaria preso na fila para sempre
+                self.failed_frames += 1
+                error_log.error("send", "Erro no envio do frame", error=e,
+                                failed=self.failed_frames)
+                continue
+            self.sent_frames += 1
+
+    async def stop(self):
+        """Interrompe os estágios e libera as threads"""
+        self.running = False
+        for task in (self._encoding, self._sender):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._capture_pool.shutdown(wait=False)
+        self._encode_pool.shutdown(wait=False)
+
+    def get_stats(self):
+        """Retorna contadores dos estágios"""
+        return {
+            'captured_frames': self.captured_frames,
+            'encoded_frames': self.encoded_frames,
+            'sent_frames': self.sent_frames,
+            'dropped_frames': self.dropped_frames
+        }
@@ -0,0 +1,79 @@
+"""Pré-processamento das capturas antes da compressão.
+
+O buffer BGRA do mss (`screenshot.raw`) é usado diretamente, sem cópia: o
+Pillow o enxerga como uma imagem RGBX com os canais B e R trocados. A
+redução de resolução acontece sobre essa visão e só a imagem já pequena é
+convertida para RGB, em vez de converter a captura inteira antes.
+
+A redução usa `reduce()` (média de blocos inteiros) quando a razão entre as
+resoluções é inteira, e BILINEAR nos demais casos, bem mais barato que
+LANCZOS para o ganho visual que dá em telas. A proporção da tela é mantida
+e capturas já no tamanho de saída não são redimensionadas.
+"""
+import io
+
+from PIL import Image
+
+# Filtro para razões não inteiras
+RESAMPLE = Image.Resampling.BILINEAR
+
+
+def fit_size(source_size, target_size, even=False):
+    """Maior tamanho dentro de target_size com a proporção de source_size (sem ampliar)"""
+    src_w, src_h = source_size
+    scale = min(target_size[0] / src_w, target_size[1] / src_h, 1.0)
+    width = max(1, round(src_w * scale))
+    height = max(1, round(src_h * scale))
+    if even:
+        # yuv420p exige dimensões pares
+        width = max(2, width & ~1)
+        height = max(2, height & ~1)
+    return width, height
+
+
+def bgra_view(bgra, size):
+    """Imagem sobre o buffer BGRA sem cópia (canais na ordem B, G, R, X)"""
+    return Image.frombuffer("RGBX", size, bgra, "raw", "RGBX", 0, 1)
+
+
+def downscale(img, size, resample=RESAMPLE):
+    """Reduz para size: média de blocos se a razão for inteira, senão o filtro"""
+    if img.size == size:
+        return img
+    factor_x, rest_x = divmod(img.width, size[0])
+    factor_y, rest_y = divmod(img.height, size[1])
+    if not rest_x and not rest_y:
+        return img.reduce((factor_x, factor_y))
+    return img.resize(size, resample, reducing_gap=2.0)
+
+
+def bgrx_to_rgb(img):
+    """Converte uma imagem BGRX (da visão do buffer) para RGB"""
+    b, g, r, _ = img.split()
+    return Image.merge("RGB", (r, g, b))
+
+
+def prepare_rgb(bgra, size, output_size, box=None):
+    """Captura (ou a região box dela) reduzida para output_size, em RGB"""
+    if box is None and size == output_size:
+        # Sem redimensionar: uma única conversão direto do buffer
+        return Image.frombuffer("RGB", size, bgra, "raw", "BGRX", 0, 1)
+
+    img = bgra_view(bgra, size)
+    if box is not None:
+        img = img.crop(box)
+    return bgrx_to_rgb(downscale(img, output_size))
+
+
+class JpegWriter:
+    """Compressão JPEG reaproveitando o mesmo buffer de saída entre frames"""
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+
+    def encode(self, img, quality):
+        buffer = self._buffer
+        buffer.seek(0)
+        buffer.truncate()
+        img.save(buffer, format="JPEG", quality=quality)
+        return buffer.getvalue()
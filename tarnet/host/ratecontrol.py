@@ -0,0 +1,156 @@
+"""Controle adaptativo de FPS, qualidade JPEG e resolução do Host Agent.
+
+O controlador observa três sinais:
+- tempo de codificação de cada frame (CPU do host);
+- esvaziamento do buffer de envio do WebSocket (uplink);
+- atraso dos clientes, a partir do último frame exibido que o servidor
+  repassa em `viewer_feedback` (o maior atraso do período; sem feedback
+  novo, o período seguinte começa sem atraso).
+
+A cada período decide se reduz ou aumenta a taxa. Em congestionamento de
+rede reduz primeiro a qualidade, depois a resolução e por fim o FPS; se o
+gargalo é a CPU reduz primeiro o FPS e depois a resolução. Com folga por
+alguns períodos seguidos, aumenta na ordem inversa.
+"""
+import time
+
+
+class RateController:
+    """Ajusta FPS, qualidade e escala a partir das medições do pipeline"""
+
+    def __init__(self, fps=10, quality=50, min_fps=2, max_fps=30,
+                 min_quality=20, max_quality=80, scales=(0.5, 0.75, 1.0)):
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.scales = scales
+
+        # Estado atual
+        self.fps = fps
+        self.quality = quality
+        self.scale_index = len(scales) - 1
+
+        # Parâmetros de decisão
+        self.update_period = 1.0         # segundos entre decisões
+        self.buffer_threshold = 32768    # bytes pendentes no socket considerados congestão
+        self.max_viewer_lag = 1.0        # segundos de atraso tolerados nos clientes
+        self.cpu_budget = 0.8            # fração do intervalo que a codificação pode usar
+        self.stable_periods_to_increase = 3
+
+        # Medições do período atual
+        self._period_start = time.monotonic()
+        self._encode_time = 0.0
+        self._encoded_frames = 0
+        self._bytes_sent = 0
+        self._buffer_start = 0
+        self._buffered = 0
+        self._viewer_lag_frames = 0
+        self._stable_periods = 0
+
+    @property
+    def scale(self):
+        return self.scales[self.scale_index]
+
+    @property
+    def interval(self):
+        return 1.0 / self.fps
+
+    def record_encode(self, seconds):
+        """Registra o tempo de codificação de um frame"""
+        self._encode_time += seconds
+        self._encoded_frames += 1
+
+    def record_send(self, size, buffered):
+        """Registra um frame enviado e os bytes ainda pendentes no socket"""
+        self._bytes_sent += size
+        self._buffered = buffered
+
+    def record_viewer_feedback(self, last_rendered, last_sent):
+        """Registra o atraso (em frames) do cliente mais lento"""
+        self._viewer_lag_frames = max(self._viewer_lag_frames, last_sent - last_rendered)
+
+    def update(self):
+        """Reavalia os parâmetros; retorna True se algo mudou"""
+        now = time.monotonic()
+        elapsed = now - self._period_start
+        if elapsed < self.update_period:
+            return False
+
+        avg_encode = self._encode_time / self._encoded_frames if self._encoded_frames else 0.0
+        # Bytes efetivamente escoados pelo socket no período
+        drained = self._bytes_sent - (self._buffered - self._buffer_start)
+        drain_rate = drained / elapsed
+
+        cpu_bound = avg_encode > self.interval * self.cpu_budget
+        congested = (
+            self._buffered > self.buffer_threshold
+            or self._viewer_lag_frames > self.fps * self.max_viewer_lag
+            or (self._bytes_sent > 0 and drain_rate < 0.8 * self._bytes_sent / elapsed)
+        )
+
+        changed = False
+        if cpu_bound:
+            self._stable_periods = 0
+            changed = self._decrease_fps() or self._decrease_scale()
+        elif congested:
+            self._stable_periods = 0
+            changed = self._decrease_quality() or self._decrease_scale() or self._decrease_fps()
+        else:
+            self._stable_periods += 1
+            if self._stable_periods >= self.stable_periods_to_increase:
+                self._stable_periods = 0
+                changed = self._increase_fps() or self._increase_scale() or self._increase_quality()
+
+        # Começa novo período
+        self._period_start = now
+        self._encode_time = 0.0
+        self._encoded_frames = 0
+        self._bytes_sent = 0
+        self._buffer_start = self._buffered
+        self._viewer_lag_frames = 0
+        return changed
+
+    def _decrease_quality(self):
+        if self.quality <= self.min_quality:
+            return False
+        self.quality = max(self.min_quality, self.quality - 10)
+        return True
+
+    def _increase_quality(self):
+        if self.quality >= self.max_quality:
+            return False
+        self.quality = min(self.max_quality, self.quality + 5)
+        return True
+
+    def _decrease_scale(self):
+        if self.scale_index == 0:
+            return False
+        self.scale_index -= 1
+        return True
+
+    def _increase_scale(self):
+        if self.scale_index == len(self.scales) - 1:
+            return False
+        self.scale_index += 1
+        return True
+
+    def _decrease_fps(self):
+        if self.fps <= self.min_fps:
+            return False
+        self.fps = max(self.min_fps, self.fps // 2)
+        return True
+
+    def _increase_fps(self):
+        if self.fps >= self.max_fps:
+            return False
+        self.fps = min(self.max_fps, self.fps + 2)
+        return True
+
+    def get_stats(self):
+        """Retorna os parâmetros atuais"""
+        return {
+            'fps': self.fps,
+            'quality': self.quality,
+            'scale': self.scale
+        }
@@ -0,0 +1,143 @@
+"""Codificação por tiles (regiões alteradas) para o Host Agent.
+
+O frame capturado é dividido em uma grade de tiles no espaço de saída.
+A comparação com o frame anterior é feita de forma vetorizada com NumPy
+direto sobre o buffer BGRA do mss; só os tiles alterados são
+redimensionados e comprimidos. Keyframes (frame completo) são enviados
+periodicamente ou sob demanda. A saída mantém a proporção da tela.
+"""
+import time
+
+import numpy as np
+
+from shared.protocol import (
+    FLAG_KEYFRAME, MSG_SCREEN_FRAME, MSG_TILE_FRAME, pack_tiles
+)
+from preprocess import JpegWriter, fit_size, prepare_rgb
+
+
+class TileEncoder:
+    """Gera keyframes ou frames só com os tiles alterados"""
+
+    def __init__(self, output_size=(1280, 720), tile_size=64,
+                 keyframe_interval=5.0, max_dirty_ratio=0.5):
+        self.output_size = output_size
+        self.requested_size = output_size  # aplicado no próximo encode()
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval  # segundos entre keyframes
+        self.max_dirty_ratio = max_dirty_ratio  # acima disso envia keyframe
+
+        self.previous = None  # último frame enviado (uint32 por pixel)
+        self.source_size = None
+        self.frame_size = None
+        self.last_keyframe = 0.0
+        self.keyframe_requested = True
+        self.resize_time = 0.0  # segundos gastos redimensionando no último encode()
+        self._jpeg = JpegWriter()
+
+        # Grade de tiles: limites no espaço de saída e no buffer original
+        self._out_x = self._out_y = None
+        self._src_x = self._src_y = None
+
+    def set_output_size(self, output_size):
+        """Pede outra resolução de saída; a grade é refeita no próximo frame.
+
+        Pode ser chamado de outra thread: encode() aplica o pedido no início,
+        então um frame nunca mistura a grade antiga e a nova.
+        """
+        self.requested_size = output_size
+
+    def request_keyframe(self):
+        """Força o envio de um frame completo na próxima codificação"""
+        self.keyframe_requested = True
+
+    def _prepare_grid(self, source_size):
+        """Recalcula a grade de tiles quando a resolução da tela muda"""
+        src_w, src_h = source_size
+        # Mantém a proporção e não amplia telas menores que a saída
+        out_w, out_h = fit_size(source_size, self.output_size)
+
+        self.source_size = source_size
+        self.frame_size = (out_w, out_h)
+        self._out_x = np.append(np.arange(0, out_w, self.tile_size), out_w)
+        self._out_y = np.append(np.arange(0, out_h, self.tile_size), out_h)
+        self._src_x = (self._out_x * src_w) // out_w
+        self._src_y = (self._out_y * src_h) // out_h
+
+    def encode(self, bgra, size, quality):
+        """Codifica o frame; retorna (tipo, flags, payload) ou None se nada mudou"""
+        width, height = size
+        frame = np.frombuffer(bgra, dtype=np.uint32).reshape(height, width)
+        self.resize_time = 0.0
+
+        requested = self.requested_size
+        if requested != self.output_size:
+            self.output_size = requested
+            self.source_size = None
+
+        if size != self.source_size:
+            self._prepare_grid(size)
+            self.keyframe_requested = True
+
+        now = time.time()
+        if (self.keyframe_requested or self.previous is None
+                or now - self.last_keyframe >= self.keyframe_interval):
+            return self._encode_keyframe(bgra, size, frame, quality, now)
+
+        # Tiles alterados: compara pixel a pixel e reduz por faixas da grade
+        diff = frame != self.previous
+        dirty = np.logical_or.reduceat(diff, self._src_y[:-1], axis=0)
+        dirty = np.logical_or.reduceat(dirty, self._src_x[:-1], axis=1)
+
+        if not dirty.any():
+            return None
+
+        if dirty.mean() > self.max_dirty_ratio:
+            return self._encode_keyframe(bgra, size, frame, quality, now)
+
+        tiles = []
+        for row, col_start, col_end in self._dirty_spans(dirty):
+            tiles.append(self._encode_span(bgra, size, row, col_start, col_end, quality))
+
+        self.previous = frame
+        out_w, out_h = self.frame_size
+        return MSG_TILE_FRAME, 0, pack_tiles(out_w, out_h, tiles)
+
+    def _encode_keyframe(self, bgra, size, frame, quality, now):
+        """Redimensiona e comprime o frame inteiro"""
+        started = time.perf_counter()
+        img = prepare_rgb(bgra, size, self.frame_size)
+        if size != self.frame_size:
+            self.resize_time += time.perf_counter() - started
+
+        self.previous = frame
+        self.last_keyframe = now
+        self.keyframe_requested = False
+        return MSG_SCREEN_FRAME, FLAG_KEYFRAME, self._jpeg.encode(img, quality)
+
+    @staticmethod
+    def _dirty_spans(dirty):
+        """Agrupa tiles alterados vizinhos na mesma linha em faixas contínuas"""
+        for row in np.flatnonzero(dirty.any(axis=1)):
+            cols = np.flatnonzero(dirty[row])
+            # Quebra onde a sequência de colunas deixa de ser contínua
+            breaks = np.flatnonzero(np.diff(cols) > 1)
+            starts = np.concatenate(([cols[0]], cols[breaks + 1]))
+            ends = np.concatenate((cols[breaks], [cols[-1]]))
+            for start, end in zip(starts, ends):
+                yield row, start, end + 1
+
+    def _encode_span(self, bgra, size, row, col_start, col_end, quality):
+        """Recorta, redimensiona e comprime uma faixa de tiles"""
+        sx0, sx1 = self._src_x[col_start], self._src_x[col_end]
+        sy0, sy1 = self._src_y[row], self._src_y[row + 1]
+        ox0, ox1 = int(self._out_x[col_start]), int(self._out_x[col_end])
+        oy0, oy1 = int(self._out_y[row]), int(self._out_y[row + 1])
+
+        box = (int(sx0), int(sy0), int(sx1), int(sy1))
+        started = time.perf_counter()
+        img = prepare_rgb(bgra, size, (ox1 - ox0, oy1 - oy0), box)
+        if size != self.frame_size:
+            self.resize_time += time.perf_counter() - started
+
+        return ox0, oy0, ox1 - ox0, oy1 - oy0, self._jpeg.encode(img, quality)
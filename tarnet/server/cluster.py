@@ -0,0 +1,351 @@
+"""Modo multi-processo do servidor TARNet.
+
+Vários processos (workers) escutam a mesma porta com SO_REUSEPORT, então um
+host e seus clientes podem cair em workers diferentes. O processo principal
+roda um hub local que conecta os workers por um socket Unix:
+
+- registro compartilhado: cada worker anuncia os hosts que aceitou e o hub
+  repassa para os demais, que mantêm um espelho (`HostEntry` remoto, sem
+  websocket). Assim `get_hosts` devolve a mesma lista em qualquer worker.
+  O anúncio leva o modo do host, guardado no hub e repassado também aos
+  workers que se conectam depois;
+- frames: o worker dono do host só encaminha frames ao hub quando há
+  clientes em outros workers, e o hub entrega apenas aos workers que têm
+  clientes daquele host. As camadas assinadas em cada worker também passam
+  pelo hub, para o host codificar só as camadas com clientes;
+- comandos, pedidos de keyframe e feedback dos clientes seguem o caminho
+  inverso, até o worker dono do host;
+- retomada: o token de retomada vai junto no anúncio do host, então o host
+  que cai e reconecta em outro worker é retomado lá. O worker anterior
+  recebe `host_moved` e passa a espelhar o host, mantendo a sala e os
+  clientes que estão nele.
+
+Mensagens no socket Unix: tamanho (uint32) + tipo (uint8) + payload. O tipo
+CTRL carrega JSON; o tipo FRAME carrega a mensagem binária original do frame.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import struct
+import tempfile
+
+from shared.logs import setup_logging
+from shared.protocol import host_id_from_bytes, unpack_header
+
+logger = logging.getLogger(__name__)
+
+LINK_HEADER = struct.Struct('!IB')
+KIND_CTRL = 1
+KIND_FRAME = 2
+
+# Bytes pendentes para um worker acima dos quais frames são descartados
+MAX_LINK_BUFFER = 4 * 1024 * 1024
+
+
+async def read_link_message(reader):
+    """Lê uma mensagem do socket Unix; retorna (tipo, payload)"""
+    header = await reader.readexactly(LINK_HEADER.size)
+    size, kind = LINK_HEADER.unpack(header)
+    payload = await reader.readexactly(size)
+    return kind, payload
+
+
+def write_link_message(writer, kind, payload):
+    """Escreve uma mensagem no socket Unix (sem aguardar o envio)"""
+    writer.write(LINK_HEADER.pack(len(payload), kind))
+    writer.write(payload)
+
+
+class ClusterHub:
+    """Hub do processo principal: registro compartilhado e roteamento entre workers"""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.workers = {}  # worker_id -> StreamWriter
+        self.hosts = {}    # host_id -> {'worker', 'connected_at', 'last_frame', 'mode', 'resume_token'}
+        self.viewers = {}  # host_id -> {worker_id: clientes daquele worker}
+        self.layers = {}   # host_id -> {worker_id: camadas assinadas naquele worker}
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.server = await asyncio.start_unix_server(self.handle_worker, self.socket_path)
+        logger.info(f"Hub do cluster escutando em {self.socket_path}")
+
+    def send(self, worker_id, message):
+        writer = self.workers.get(worker_id)
+        if writer is not None:
+            write_link_message(writer, KIND_CTRL, json.dumps(message).encode())
+
+    def broadcast(self, message, exclude=None):
+        payload = json.dumps(message).encode()
+        for worker_id, writer in self.workers.items():
+            if worker_id != exclude:
+                write_link_message(writer, KIND_CTRL, payload)
+
+    async def handle_worker(self, reader, writer):
+        worker_id = None
+        try:
+            while True:
+                kind, payload = await read_link_message(reader)
+
+                if kind == KIND_FRAME:
+                    self.route_frame(worker_id, payload)
+                    continue
+
+                message = json.loads(payload)
+                if message['op'] == 'hello':
+                    worker_id = message['worker']
+                    self.workers[worker_id] = writer
+                    self.send_snapshot(worker_id)
+                else:
+                    self.handle_control(worker_id, message)
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if worker_id is not None:
+                self.remove_worker(worker_id)
+            writer.close()
+
+    def send_snapshot(self, worker_id):
+        """Envia o registro atual para um worker recém-conectado"""
+        for host_id, host in self.hosts.items():
+            self.send(worker_id, {'op': 'host_up', 'host_id': host_id, **host})
+            self.send(worker_id, self.host_info(host_id))
+
+    def host_info(self, host_id):
+        """Resumo do host: total de clientes e clientes fora do worker dono"""
+        host = self.hosts[host_id]
+        counts = self.viewers.get(host_id, {})
+        remote_layers = set()
+        for worker_id, layers in self.layers.get(host_id, {}).items():
+            if worker_id != host['worker']:
+                remote_layers.update(layers)
+        return {
+            'op': 'host_info',
+            'host_id': host_id,
+            'last_frame': host['last_frame'],
+            'viewers': sum(counts.values()),
+            'remote_viewers': sum(count for worker_id, count in counts.items()
+                                  if worker_id != host['worker']),
+            'remote_layers': sorted(remote_layers)
+        }
+
+    def handle_control(self, worker_id, message):
+        op = message['op']
+        host_id = message.get('host_id')
+
+        if op == 'host_up':
+            previous = self.hosts.get(host_id)
+            resumed = bool(message.get('resumed')) and previous is not None
+            # Se o host estava em outro worker, aquele registro deixa de valer;
+            # numa retomada, o worker anterior mantém a sala como espelho
+            if previous is not None and previous['worker'] != worker_id:
+                self.send(previous['worker'], {'op': 'host_moved' if resumed else 'host_down',
+                                               'host_id': host_id, 'worker': worker_id})
+
+            self.hosts[host_id] = {
+                'worker': worker_id,
+                'connected_at': message['connected_at'],
+                'last_frame': previous['last_frame'] if resumed else None,
+                'mode': message.get('mode', 'both'),
+                'resume_token': message.get('resume_token')
+            }
+            self.broadcast({'op': 'host_up', 'host_id': host_id, 'resumed': resumed,
+                            **self.hosts[host_id]}, exclude=worker_id)
+            self.broadcast(self.host_info(host_id))
+
+        elif op == 'host_down':
+            host = self.hosts.get(host_id)
+            if host is not None and host['worker'] == worker_id:
+                del self.hosts[host_id]
+                self.broadcast({'op': 'host_down', 'host_id': host_id}, exclude=worker_id)
+
+        elif op == 'host_suspended':
+            host = self.hosts.get(host_id)
+            if host is not None and host['worker'] == worker_id:
+                self.broadcast(message, exclude=worker_id)
+
+        elif op == 'host_seen':
+            host = self.hosts.get(host_id)
+            if host is not None:
+                host['last_frame'] = message['last_frame']
+                self.broadcast(self.host_info(host_id))
+
+        elif op == 'viewers':
+            counts = self.viewers.setdefault(host_id, {})
+            layers = self.layers.setdefault(host_id, {})
+            if message['count']:
+                counts[worker_id] = message['count']
+                layers[worker_id] = message['layers']
+            else:
+                counts.pop(worker_id, None)
+                layers.pop(worker_id, None)
+            if not counts:
+                del self.viewers[host_id]
+                del self.layers[host_id]
+            if host_id in self.hosts:
+                self.broadcast(self.host_info(host_id))
+
+        elif op in ('command', 'feedback'):
+            # Encaminha ao worker dono do host
+            host = self.hosts.get(host_id)
+            if host is not None:
+                self.send(host['worker'], {**message, 'worker': worker_id})
+
+    def route_frame(self, worker_id, payload):
+        """Entrega o frame aos workers (exceto o dono) que têm clientes na camada"""
+        header = unpack_header(payload)
+        if header is None:
+            return
+
+        host_id = host_id_from_bytes(header.host_id)
+        layers = self.layers.get(host_id, {})
+        for target, count in self.viewers.get(host_id, {}).items():
+            # Só para workers com clientes na camada deste frame
+            if target == worker_id or not count or header.layer not in layers.get(target, ()):
+                continue
+            writer = self.workers.get(target)
+            # Worker atrasado: descarta o frame em vez de acumular memória
+            if writer is None or writer.transport.get_write_buffer_size() > MAX_LINK_BUFFER:
+                continue
+            write_link_message(writer, KIND_FRAME, payload)
+
+    def remove_worker(self, worker_id):
+        """Limpa hosts e contagens de um worker que saiu"""
+        self.workers.pop(worker_id, None)
+        for host_id in [h for h, host in self.hosts.items() if host['worker'] == worker_id]:
+            del self.hosts[host_id]
+            self.broadcast({'op': 'host_down', 'host_id': host_id})
+
+        for host_id in list(self.viewers):
+            counts = self.viewers[host_id]
+            if counts.pop(worker_id, None) is not None:
+                self.layers[host_id].pop(worker_id, None)
+                if not counts:
+                    del self.viewers[host_id]
+                    del self.layers[host_id]
+                if host_id in self.hosts:
+                    self.broadcast(self.host_info(host_id))
+        logger.warning(f"Worker {worker_id} desconectado do hub")
+
+
+class ClusterLink:
+    """Conexão de um worker com o hub"""
+
+    def __init__(self, server, worker_id, socket_path):
+        self.server = server
+        self.worker_id = worker_id
+        self.socket_path = socket_path
+        self.reader = None
+        self.writer = None
+        self._task = None
+
+        # Intervalo mínimo entre avisos de último frame por host
+        self.seen_interval = 1.0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+        self.send({'op': 'hello', 'worker': self.worker_id})
+        self._task = asyncio.create_task(self.listen())
+
+    def send(self, message):
+        write_link_message(self.writer, KIND_CTRL, json.dumps(message).encode())
+
+    # Eventos locais repassados ao hub
+
+    def host_up(self, host, resumed=False):
+        self.send({'op': 'host_up', 'host_id': host.host_id, 'connected_at': host.connected_at,
+                   'mode': host.mode, 'resume_token': host.resume_token, 'resumed': resumed})
+
+    def host_down(self, host_id):
+        self.send({'op': 'host_down', 'host_id': host_id})
+
+    def host_suspended(self, host_id, grace_period):
+        """Conexão do host caiu: os espelhos avisam seus clientes da espera"""
+        self.send({'op': 'host_suspended', 'host_id': host_id, 'grace_period': grace_period})
+
+    def host_seen(self, host):
+        """Avisa o último frame do host, no máximo a cada seen_interval"""
+        if host.last_frame - host.last_announced >= self.seen_interval:
+            host.last_announced = host.last_frame
+            self.send({'op': 'host_seen', 'host_id': host.host_id, 'last_frame': host.last_frame})
+
+    def update_viewers(self, host_id, count, layers):
+        self.send({'op': 'viewers', 'host_id': host_id, 'count': count, 'layers': layers})
+
+    def send_command(self, host_id, command):
+        self.send({'op': 'command', 'host_id': host_id, 'command': command})
+
+    def send_feedback(self, host_id, last_rendered):
+        self.send({'op': 'feedback', 'host_id': host_id, 'last_rendered': last_rendered})
+
+    def forward_frame(self, message):
+        write_link_message(self.writer, KIND_FRAME, message)
+
+    # Eventos vindos do hub
+
+    async def listen(self):
+        try:
+            while True:
+                kind, payload = await read_link_message(self.reader)
+                if kind == KIND_FRAME:
+                    self.server.relay_remote_frame(payload)
+                else:
+                    await self.server.handle_cluster_message(json.loads(payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.error("Conexão com o hub do cluster perdida")
+
+
+def _run_worker(host, port, worker_id, socket_path, record_dir=None, egress_limits=None):
+    """Ponto de entrada de cada processo worker"""
+    from server import TARNetServer
+
+    # A thread de escrita do log não existe no processo filho
+    setup_logging()
+
+    async def worker_main():
+        server = TARNetServer(host=host, port=port, record_dir=record_dir,
+                              **(egress_limits or {}))
+        server.cluster = ClusterLink(server, worker_id, socket_path)
+        await server.cluster.connect()
+        await server.start_server(reuse_port=True)
+
+    try:
+        asyncio.run(worker_main())
+    except KeyboardInterrupt:
+        pass
+
+
+async def run_cluster(host, port, workers, record_dir=None, egress_limits=None):
+    """Inicia o hub e os workers que compartilham a porta"""
+    socket_path = os.path.join(tempfile.gettempdir(), f"tarnet-{port}.sock")
+    hub = ClusterHub(socket_path)
+    await hub.start()
+
+    processes = []
+    for worker_id in range(workers):
+        process = multiprocessing.Process(
+            target=_run_worker,
+            args=(host, port, worker_id, socket_path, record_dir, egress_limits),
+            name=f"tarnet-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        processes.append(process)
+
+    logger.info(f"{workers} workers iniciados em ws://{host}:{port}")
+    try:
+        # Mantém o hub rodando enquanto houver workers
+        while any(process.is_alive() for process in processes):
+            await asyncio.sleep(1)
+        logger.error("Todos os workers terminaram")
+    finally:
+        for process in processes:
+            process.terminate()
+        hub.server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
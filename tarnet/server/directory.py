@@ -0,0 +1,122 @@
+"""Diretório de hosts publicado para os painéis (lista de hosts).
+
+Em vez de cada painel pedir a lista inteira periodicamente (get_hosts), o
+servidor compara o estado dos hosts com o último publicado a cada
+`directory_interval` e envia aos painéis inscritos só as diferenças: hosts
+adicionados, alterados e removidos. Cada mudança incrementa a versão do
+diretório; o snapshot da versão atual é serializado uma única vez e servido
+em GET /hosts com ETag, respondendo 304 a quem já tem o mesmo conteúdo.
+
+O horário do último frame só é republicado quando avança mais que
+`frame_resolution` segundos (ou o host fica online/offline); caso contrário,
+todo host transmitindo mudaria a cada verificação.
+"""
+import hashlib
+import json
+from datetime import datetime
+
+
+class HostDirectory:
+    """Estado publicado dos hosts, com versão, snapshot em cache e painéis inscritos"""
+
+    def __init__(self, hosts, online_after=30.0, frame_resolution=10.0):
+        self.hosts = hosts  # host_id -> HostEntry (o dicionário do servidor)
+        self.online_after = online_after
+        self.frame_resolution = frame_resolution
+
+        self.version = 0
+        self.published = {}    # host_id -> (estado, info publicada)
+        self.subscribers = {}  # websocket -> quer miniaturas
+        self.thumbnails = {}   # host_id -> última miniatura enviada aos painéis
+        self._snapshot = None  # (versão, ETag, corpo JSON)
+
+    def _state(self, host, previous, now):
+        """Tupla comparável com o que o painel exibe do host"""
+        last_frame = host.last_frame
+        online = last_frame is not None and now - last_frame < self.online_after
+        if host.mode == 'input':
+            online = host.disconnected_at is None  # não envia frames
+        if (previous is not None and previous[1] is not None and last_frame is not None
+                and last_frame - previous[1] < self.frame_resolution):
+            last_frame = previous[1]
+        clients = (host.total_viewers if host.total_viewers is not None
+                   else len(host.room.clients))
+        return host.connected_at, last_frame, online, clients, host.mode
+
+    @staticmethod
+    def _info(host_id, state):
+        connected_at, last_frame, online, clients, mode = state
+        return {
+            'host_id': host_id,
+            'connected_at': datetime.fromtimestamp(connected_at).isoformat(),
+            'last_frame': datetime.fromtimestamp(last_frame).isoformat() if last_frame else None,
+            'online': online,
+            'clients_connected': clients,
+            'mode': mode
+        }
+
+    def sync(self, now):
+        """Publica o estado atual; retorna a mensagem hosts_delta ou None se nada mudou"""
+        added, changed = [], []
+        published = {}
+        for host_id, host in self.hosts.items():
+            previous = self.published.get(host_id)
+            state = self._state(host, previous[0] if previous else None, now)
+            if previous is not None and previous[0] == state:
+                published[host_id] = previous
+                continue
+            entry = (state, self._info(host_id, state))
+            published[host_id] = entry
+            (changed if previous else added).append(entry[1])
+
+        removed = [host_id for host_id in self.published if host_id not in published]
+        for host_id in removed:
+            self.thumbnails.pop(host_id, None)
+        self.published = published
+
+        if not (added or changed or removed):
+            return None
+        self.version += 1
+        return {
+            'type': 'hosts_delta',
+            'version': self.version,
+            'added': added,
+            'changed': changed,
+            'removed': removed
+        }
+
+    def snapshot(self):
+        """Hosts da versão atual"""
+        return [info for _, info in self.published.values()]
+
+    def http_snapshot(self):
+        """(ETag, corpo JSON) da versão atual, serializado uma vez por versão.
+
+        O ETag vem do conteúdo, não da versão: no modo multi-worker cada worker
+        numera suas versões, mas o mesmo conteúdo continua gerando 304.
+        """
+        if self._snapshot is None or self._snapshot[0] != self.version:
+            hosts = json.dumps(self.snapshot())
+            etag = '"' + hashlib.sha1(hosts.encode()).hexdigest()[:20] + '"'
+            body = f'{{"version": {self.version}, "hosts": {hosts}}}'.encode()
+            self._snapshot = (self.version, etag, body)
+        return self._snapshot[1], self._snapshot[2]
+
+    def subscribe(self, websocket, thumbnails=False):
+        self.subscribers[websocket] = thumbnails
+
+    def unsubscribe(self, websocket):
+        self.subscribers.pop(websocket, None)
+
+    def thumbnail_subscribers(self):
+        return [websocket for websocket, thumbnails in self.subscribers.items() if thumbnails]
+
+    async def refresh_thumbnails(self, frame_cache):
+        """Atualiza as miniaturas; retorna só as que mudaram desde o último envio"""
+        changed = {}
+        for host_id in self.published:
+            thumbnail = await frame_cache.get_thumbnail(host_id)
+            if thumbnail is not None and thumbnail != self.thumbnails.get(host_id):
+                self.thumbnails[host_id] = thumbnail
+                changed[host_id] = thumbnail
+        return changed
@@ -0,0 +1,235 @@
+"""Escalonamento da saída de frames com orçamentos de banda.
+
+Sem limites configurados cada ClientChannel envia seus frames assim que
+pode. Com limites, os frames passam pelo EgressScheduler antes de serem
+enviados:
+
+- balde de tokens global (uplink do servidor), por sala (orçamento de cada
+  host, somando todos os clientes dele) e por cliente;
+- entre salas, enfileiramento justo ponderado (WFQ com relógio virtual
+  próprio, SCFQ): a sala com menor tag de término é servida primeiro, então
+  uma sala com muitos clientes ou frames grandes não ocupa o uplink inteiro;
+- dentro da sala, os clientes são servidos em rodízio.
+
+Um cliente só recebe uma nova concessão quando termina de enviar a anterior,
+então a pressão do TCP também chega ao escalonador. Frames que não cabem no
+orçamento ficam na fila limitada do cliente, que descarta frames (nunca
+mensagens de controle ou comandos) quando ela enche.
+
+O orçamento e o peso de cada sala podem ser configurados individualmente
+(`room_rates` e `weights`); sem configuração a sala usa `room_rate` e peso 1.
+Um erro inesperado numa rodada é registrado e a tarefa continua; se ela
+terminar mesmo assim, o próximo notify a recria.
+"""
+import asyncio
+import logging
+import time
+
+from shared.logs import RateLimitedLog
+
+logger = logging.getLogger(__name__)
+error_log = RateLimitedLog(logger, interval=5.0)
+
+
+class TokenBucket:
+    """Balde de tokens em bytes por segundo (pode ficar negativo após um frame grande)"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, size, now):
+        """Segundos até poder enviar size bytes (0 se já pode)"""
+        self._refill(now)
+        # Frames maiores que a rajada passam com o balde cheio e deixam dívida
+        needed = min(size, self.burst)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def consume(self, size, now):
+        self._refill(now)
+        self.tokens -= size
+
+
+class RoomQueue:
+    """Clientes de uma sala com frames pendentes, com orçamento e tag de término"""
+
+    __slots__ = ('room_id', 'weight', 'bucket', 'channels', 'start', 'finish', 'sent_bytes')
+
+    def __init__(self, room_id, weight, bucket):
+        self.room_id = room_id
+        self.weight = weight
+        self.bucket = bucket
+        self.channels = []   # rodízio dos clientes aguardando concessão
+        self.start = None    # tag de início do próximo frame (fixada enquanto a sala espera)
+        self.finish = 0.0    # tag de término do último frame servido
+        self.sent_bytes = 0
+
+
+class EgressScheduler:
+    """Concede o envio dos frames respeitando os orçamentos e a justiça entre salas"""
+
+    def __init__(self, global_rate=None, room_rate=None, client_rate=None, burst_seconds=0.25,
+                 room_rates=None, weights=None):
+        # Taxas em bytes/s; None é ilimitado
+        self.room_rate = room_rate
+        self.client_rate = client_rate
+        self.burst_seconds = burst_seconds
+        self.global_bucket = self._bucket(global_rate)
+        self.room_rates = dict(room_rates or {})  # room_id -> taxa própria (substitui room_rate)
+        self.weights = dict(weights or {})        # room_id -> peso no WFQ (padrão 1.0)
+
+        self.rooms = {}  # room_id -> RoomQueue
+        self.virtual_time = 0.0
+        self.granted_frames = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def _bucket(self, rate):
+        if not rate:
+            return None
+        # Rajada mínima de 64 KB para um keyframe não esperar vários ciclos
+        return TokenBucket(rate, max(rate * self.burst_seconds, 64 * 1024))
+
+    def client_bucket(self):
+        """Balde de um novo cliente (guardado no ClientChannel)"""
+        return self._bucket(self.client_rate)
+
+    def notify(self, channel):
+        """O canal tem frame pendente ou terminou um envio"""
+        room = self.rooms.get(channel.room_id)
+        if room is None:
+            room = self.rooms[channel.room_id] = RoomQueue(
+                channel.room_id, self.weights.get(channel.room_id, 1.0),
+                self._bucket(self.room_rates.get(channel.room_id, self.room_rate))
+            )
+        if not channel.scheduled:
+            channel.scheduled = True
+            room.channels.append(channel)
+
+        if self._task is None or self._task.done():
+            if self._task is not None and not self._task.cancelled():
+                logger.error("Escalonador de saída havia terminado; reiniciando",
+                             exc_info=self._task.exception())
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    def remove_room(self, room_id):
+        self.rooms.pop(room_id, None)
+
+    def _candidate(self, room, now):
+        """(canal, tamanho) elegível na sala, ou (None, espera em segundos ou None)"""
+        wait = None
+        for channel in room.channels:
+            if channel.closed or not channel.frames:
+                continue
+            if channel.granted is not None:
+                continue  # ainda enviando a concessão anterior (notify ao terminar)
+            size = len(channel.frames[0][1])
+            delay = 0.0
+            if channel.bucket is not None:
+                delay = channel.bucket.delay(size, now)
+            if room.bucket is not None:
+                delay = max(delay, room.bucket.delay(size, now))
+            if delay == 0.0:
+                return channel, size
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _prune(self):
+        """Tira do rodízio os canais sem frames ou fechados"""
+        for room in self.rooms.values():
+            if any(channel.closed or not channel.frames for channel in room.channels):
+                keep = []
+                for channel in room.channels:
+                    if channel.closed or not channel.frames:
+                        channel.scheduled = False
+                    else:
+                        keep.append(channel)
+                room.channels = keep
+
+    def _select(self, now):
+        """Próxima concessão (sala, canal, tamanho) pelo WFQ, ou a espera até haver uma"""
+        best = None
+        best_tag = 0.0
+        wait = None
+        for room in self.rooms.values():
+            if not room.channels:
+                room.start = None  # ociosa: volta a partir do relógio virtual atual
+                continue
+            channel, size = self._candidate(room, now)
+            if channel is None:
+                if size is not None:
+                    wait = size if wait is None else min(wait, size)
+                continue
+            # A tag de início é fixada quando a sala passa a esperar; recalculada
+            # a cada rodada ela acompanharia o relógio virtual e uma sala com
+            # frames grandes nunca seria servida
+            if room.start is None:
+                room.start = max(self.virtual_time, room.finish)
+            tag = room.start + size / room.weight
+            if best is None or tag < best_tag:
+                best, best_tag = (room, channel, size), tag
+
+        if best is None:
+            return None, wait
+
+        # Uplink global esgotado: espera, mantendo a ordem do WFQ
+        if self.global_bucket is not None:
+            delay = self.global_bucket.delay(best[2], now)
+            if delay > 0:
+                return None, delay
+
+        room, channel, _ = best
+        self.virtual_time = best_tag
+        room.finish = best_tag
+        room.start = None
+        # Rodízio: quem foi servido vai para o fim
+        room.channels.remove(channel)
+        room.channels.append(channel)
+        return best, None
+
+    async def _run(self):
+        """Tarefa única que concede os envios"""
+        while True:
+            try:
+                await self._step()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Uma rodada com erro não pode parar a saída de todas as salas
+                error_log.error("run", "Erro no escalonador de saída", error=e)
+                await asyncio.sleep(0.05)
+
+    async def _step(self):
+        """Uma rodada: espera até haver concessão possível ou concede um envio"""
+        self._prune()
+        now = time.monotonic()
+        selected, wait = self._select(now)
+        if selected is None:
+            self._wakeup.clear()
+            if wait is None:
+                await self._wakeup.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            return
+
+        room, channel, size = selected
+        for bucket in (self.global_bucket, room.bucket, channel.bucket):
+            if bucket is not None:
+                bucket.consume(size, now)
+        room.sent_bytes += size
+        self.granted_frames += 1
+        channel.grant()
@@ -0,0 +1,169 @@
+"""Distribuição de frames para os clientes de uma sala.
+
+Cada cliente tem sua própria fila de saída limitada e uma tarefa de envio
+dedicada. O servidor apenas enfileira a mensagem já serializada (sem await),
+então um cliente lento nunca atrasa os demais nem o loop de leitura do host.
+
+Quando a fila de frames enche, os frames pendentes são descartados e o canal
+espera o próximo keyframe (deltas sem a referência só gerariam artefatos),
+avisando on_gap para o servidor pedir um keyframe ao host. Mensagens de
+controle nunca são descartadas.
+
+Com limites de banda, o envio de cada frame precisa de uma concessão do
+EgressScheduler (egress.py); mensagens de controle não passam por ele.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from websockets.exceptions import ConnectionClosed
+
+from shared.protocol import is_keyframe
+
+logger = logging.getLogger(__name__)
+
+
+class ClientChannel:
+    """Fila de saída de um cliente com descarte do frame mais antigo"""
+
+    def __init__(self, websocket, max_frames=2, stats=None, latency=None,
+                 scheduler=None, room_id=None):
+        self.websocket = websocket
+        self.max_frames = max_frames
+        self.stats = stats
+        self.latency = latency  # Histogram do tempo entre enfileirar e enviar
+
+        self.frames = deque()    # (instante, frame) pendentes (podem ser descartados)
+        self.messages = deque()  # mensagens de controle (nunca descartadas)
+        self.waiting_keyframe = False
+        self.on_gap = None       # () -> None, chamado ao começar a esperar um keyframe
+
+        # Escalonador de saída (None sem limites de banda)
+        self.scheduler = scheduler
+        self.room_id = room_id
+        self.bucket = scheduler.client_bucket() if scheduler else None
+        self.scheduled = False   # no rodízio da sala no escalonador
+        self.granted = None      # frame liberado pelo escalonador, aguardando envio
+
+        self.sent_frames = 0
+        self.dropped_frames = 0
+        self.closed = False
+
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @property
+    def queue_depth(self):
+        return len(self.frames) + len(self.messages) + (self.granted is not None)
+
+    def start(self):
+        """Inicia a tarefa de envio do cliente"""
+        self._task = asyncio.create_task(self._sender())
+
+    def push_frame(self, payload):
+        """Enfileira um frame; com a fila cheia descarta até o próximo keyframe"""
+        if self.closed:
+            return
+
+        keyframe = is_keyframe(payload)
+        if self.waiting_keyframe:
+            if not keyframe:
+                self.dropped_frames += 1
+                return
+            self.waiting_keyframe = False
+
+        if keyframe:
+            # Frames pendentes anteriores a um keyframe já não serão vistos
+            self.dropped_frames += len(self.frames)
+            self.frames.clear()
+        elif len(self.frames) >= self.max_frames:
+            self.dropped_frames += len(self.frames) + 1
+            self.frames.clear()
+            self.waiting_keyframe = True
+            if self.on_gap is not None:
+                self.on_gap()
+            return
+
+        self.frames.append((time.perf_counter(), payload))
+        if self.scheduler is not None:
+            self.scheduler.notify(self)
+        else:
+            self._wakeup.set()
+
+    def grant(self):
+        """Libera o envio do frame mais antigo (chamado pelo escalonador)"""
+        self.granted = self.frames.popleft()
+        self._wakeup.set()
+
+    def _next_frame(self):
+        """Frame a enviar agora: o concedido ou, sem escalonador, o mais antigo"""
+        if self.scheduler is None:
+            return self.frames.popleft() if self.frames else None
+        return self.granted
+
+    def push_message(self, payload):
+        """Enfileira uma mensagem que não pode ser descartada"""
+        if self.closed:
+            return
+
+        self.messages.append(payload)
+        self._wakeup.set()
+
+    async def _sender(self):
+        """Envia mensagens pendentes; mensagens de controle têm prioridade"""
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+
+                while True:
+                    if self.messages:
+                        await self.websocket.send(self.messages.popleft())
+                    else:
+                        frame = self._next_frame()
+                        if frame is None:
+                            break
+                        queued_at, payload = frame
+                        await self.websocket.send(payload)
+                        self.sent_frames += 1
+                        if self.latency is not None:
+                            self.latency.observe(time.perf_counter() - queued_at)
+                        if self.scheduler is not None:
+                            # Só recebe outra concessão depois de escoar esta
+                            self.granted = None
+                            if self.frames:
+                                self.scheduler.notify(self)
+
+                    if self.stats is not None:
+                        self.stats['messages_processed'] += 1
+
+        except ConnectionClosed:
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro no envio para cliente: {e}")
+        finally:
+            self.closed = True
+            self.frames.clear()
+            self.messages.clear()
+            self.granted = None
+
+    async def close(self):
+        """Encerra a tarefa de envio"""
+        self.closed = True
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def get_stats(self):
+        """Retorna profundidade da fila e contadores de envio/descarte"""
+        return {
+            'queue_depth': self.queue_depth,
+            'sent_frames': self.sent_frames,
+            'dropped_frames': self.dropped_frames
+        }
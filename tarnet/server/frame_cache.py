@@ -0,0 +1,162 @@
+"""Cache do último keyframe de cada host.
+
+Guarda o último keyframe recebido de cada host (por camada ou visão) e
+os frames delta que chegaram depois dele. Um cliente que entra na sala recebe esse conjunto
+imediatamente, sem esperar o próximo frame do host. O cache tem limite de
+memória por host (cadeia de deltas) e global (remove os hosts menos
+recentes).
+
+Também gera miniaturas (JPEG pequeno) a partir do keyframe, sob demanda e
+renovadas por idade, para a lista de hosts. Requer Pillow; sem ele as
+miniaturas ficam desativadas.
+"""
+import asyncio
+import base64
+import io
+import time
+from collections import OrderedDict
+
+from shared.protocol import (
+    FLAG_KEYFRAME, HEADER_SIZE, LAYER_FULL, LAYERS, MSG_SCREEN_FRAME, unpack_header
+)
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow é opcional no servidor
+    Image = None
+
+
+class CachedStream:
+    """Keyframe e deltas seguintes de um host"""
+
+    __slots__ = ('frames', 'size', 'complete', 'updated_at',
+                 'thumbnail', 'thumbnail_at', 'thumbnail_source')
+
+    def __init__(self, keyframe):
+        self.frames = [keyframe]
+        self.size = len(keyframe)
+        self.complete = True  # False quando a cadeia de deltas foi truncada
+        self.updated_at = time.time()
+        self.thumbnail = None
+        self.thumbnail_at = 0.0
+        self.thumbnail_source = None
+
+
+class FrameCache:
+    """Cache com limite de memória dos últimos frames completos por host"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_stream_bytes=2 * 1024 * 1024,
+                 thumbnail_size=(320, 180), thumbnail_max_age=10.0):
+        self.max_bytes = max_bytes
+        self.max_stream_bytes = max_stream_bytes
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_max_age = thumbnail_max_age
+
+        self.streams = OrderedDict()  # (host_id, camada) -> CachedStream (ordem de uso)
+        self.total_bytes = 0
+        self.evictions = 0
+
+    def store(self, host_id, header, message):
+        """Atualiza o cache com um frame recebido do host"""
+        key = (host_id, header.layer)
+        stream = self.streams.get(key)
+
+        if header.flags & FLAG_KEYFRAME:
+            if stream is not None:
+                self.total_bytes -= stream.size
+            stream = CachedStream(message)
+            self.streams[key] = stream
+            self.total_bytes += stream.size
+
+        elif stream is not None and stream.complete:
+            # Cadeia longa demais: mantém só o keyframe e marca como incompleta
+            if stream.size + len(message) > self.max_stream_bytes:
+                self.total_bytes -= stream.size - len(stream.frames[0])
+                stream.frames = stream.frames[:1]
+                stream.size = len(stream.frames[0])
+                stream.complete = False
+            else:
+                stream.frames.append(message)
+                stream.size += len(message)
+                self.total_bytes += len(message)
+            stream.updated_at = time.time()
+
+        else:
+            return
+
+        self.streams.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        """Remove os hosts menos recentes até caber no limite global"""
+        while self.total_bytes > self.max_bytes and self.streams:
+            _, stream = self.streams.popitem(last=False)
+            self.total_bytes -= stream.size
+            self.evictions += 1
+
+    def get(self, host_id, layer=LAYER_FULL):
+        """Retorna (frames, completo) para um novo cliente, ou (None, False)"""
+        stream = self.streams.get((host_id, layer))
+        if stream is None:
+            return None, False
+        return list(stream.frames), stream.complete
+
+    def remove(self, host_id, layer=None):
+        """Remove uma camada (ou visão) do host, ou todas se layer for None"""
+        if layer is None:
+            keys = [key for key in self.streams if key[0] == host_id]
+        else:
+            keys = [(host_id, layer)]
+        for key in keys:
+            stream = self.streams.pop(key, None)
+            if stream is not None:
+                self.total_bytes -= stream.size
+
+    async def get_thumbnail(self, host_id):
+        """Miniatura em base64 do último keyframe, gerada sob demanda"""
+        if Image is None:
+            return None
+
+        # Usa a camada atualizada mais recentemente (só as assinadas são
+        # codificadas) entre as que têm keyframe JPEG (vídeo exigiria decodificar)
+        streams = [self.streams.get((host_id, layer)) for layer in range(len(LAYERS))]
+        streams = [stream for stream in streams
+                   if stream is not None
+                   and unpack_header(stream.frames[0]).msg_type == MSG_SCREEN_FRAME]
+        if not streams:
+            return None
+        stream = max(streams, key=lambda stream: stream.updated_at)
+
+        keyframe = stream.frames[0]
+        now = time.time()
+        # Reaproveita enquanto for recente ou o keyframe não mudou
+        if stream.thumbnail is not None and (
+                now - stream.thumbnail_at < self.thumbnail_max_age
+                or stream.thumbnail_source is keyframe):
+            return stream.thumbnail
+
+        loop = asyncio.get_running_loop()
+        thumbnail = await loop.run_in_executor(None, self._make_thumbnail, keyframe)
+        stream.thumbnail = thumbnail
+        stream.thumbnail_at = now
+        stream.thumbnail_source = keyframe
+        return thumbnail
+
+    def _make_thumbnail(self, keyframe):
+        """Decodifica o JPEG do keyframe e gera a miniatura (fora do loop)"""
+        try:
+            img = Image.open(io.BytesIO(keyframe[HEADER_SIZE:]))
+            img.draft('RGB', self.thumbnail_size)  # decodificação reduzida do JPEG
+            img.thumbnail(self.thumbnail_size)
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=60)
+            return base64.b64encode(buffer.getvalue()).decode()
+        except Exception:
+            return None
+
+    def get_stats(self):
+        return {
+            'cached_hosts': len(self.streams),
+            'cached_bytes': self.total_bytes,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,390 @@
+"""Gravação das sessões e reprodução a partir de qualquer instante.
+
+Cada host (sala) gravado ganha uma sessão em `<diretório>/<host_id>/<início>/`
+com segmentos append-only (`00000.seg`, `00001.seg`, ...) e um índice
+(`index.tni`). Cada registro do segmento é o cabeçalho RECORD (instante de
+chegada ao servidor e tamanho) seguido da mensagem binária original do host,
+sem reserializar. O índice tem uma entrada de tamanho fixo (INDEX_ENTRY) por
+keyframe: instante, segmento, offset e camada, os únicos pontos por onde a
+reprodução pode começar.
+
+O loop de eventos só coloca a mensagem (já em bytes, sem cópia) em uma fila;
+uma thread de escrita esvazia a fila em lotes e grava com buffer grande,
+então a gravação não atrasa a distribuição ao vivo. Se a fila encher, os
+frames da camada são descartados até o próximo keyframe dela, para a gravação
+nunca ficar com deltas sem referência.
+
+A reprodução mapeia os segmentos em memória (mmap) e lê só a partir da
+entrada do índice escolhida, entregando memoryviews do mapeamento. Ler o
+mapeamento pode bloquear em disco, então o servidor lê em lotes
+(read_batch) fora do loop de eventos.
+"""
+import bisect
+import logging
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from datetime import datetime
+
+from shared.protocol import FLAG_KEYFRAME, HEADER_SIZE, unpack_header
+
+logger = logging.getLogger(__name__)
+
+# Registro no segmento: instante de chegada, tamanho da mensagem
+RECORD = struct.Struct('!dI')
+# Entrada do índice: instante, segmento, offset no segmento, camada
+INDEX_ENTRY = struct.Struct('!dHIB')
+
+INDEX_FILE = 'index.tni'
+SEGMENT_NAME = '{:05d}.seg'
+
+# "<host_id>/<início>", como listado em sessions()
+SESSION_ID = re.compile(r'^[0-9a-f-]{36}/\d{8}-\d{6}(-\d+)?$')
+
+# Bytes lidos do mmap por lote da reprodução
+READ_BATCH_BYTES = 4 * 1024 * 1024
+
+
+class _Session:
+    """Arquivos abertos de uma sessão (usado só pela thread de escrita)"""
+
+    def __init__(self, path, segment_bytes):
+        os.makedirs(path)
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.segment = -1
+        self.offset = 0
+        self.file = None
+        self.index = open(os.path.join(path, INDEX_FILE), 'ab')
+        self._next_segment()
+
+    def _next_segment(self):
+        if self.file is not None:
+            self.file.close()
+        self.segment += 1
+        self.offset = 0
+        self.file = open(os.path.join(self.path, SEGMENT_NAME.format(self.segment)),
+                         'wb', buffering=1024 * 1024)
+
+    def write(self, received_at, message, keyframe, layer):
+        # Segmentos novos só começam em keyframes
+        if keyframe and self.offset >= self.segment_bytes:
+            self._next_segment()
+        if keyframe:
+            self.index.write(INDEX_ENTRY.pack(received_at, self.segment, self.offset, layer))
+        self.file.writelines((RECORD.pack(received_at, len(message)), message))
+        self.offset += RECORD.size + len(message)
+
+    def flush(self):
+        self.file.flush()
+        self.index.flush()
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+
+class SessionRecorder:
+    """Grava os frames de cada host em uma thread separada do loop de eventos"""
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024,
+                 max_pending=512, flush_interval=1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+
+        self.recorded_frames = 0
+        self.dropped_frames = 0
+        self.waiting_keyframe = set()  # (host_id, camada) com frames descartados
+
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._writer, name='tarnet-recorder', daemon=True)
+        self._thread.start()
+
+    def record(self, host_id, header, message, received_at):
+        """Enfileira um frame para gravação (chamado no loop, não bloqueia)"""
+        keyframe = bool(header.flags & FLAG_KEYFRAME)
+        # Cada camada (ou visão) tem sua própria cadeia de deltas
+        stream = (host_id, header.layer)
+        if stream in self.waiting_keyframe:
+            if not keyframe:
+                self.dropped_frames += 1
+                return
+            self.waiting_keyframe.discard(stream)
+
+        if self._queue.qsize() >= self.max_pending:
+            # Disco atrasado: descarta até o próximo keyframe desta camada
+            self.waiting_keyframe.add(stream)
+            self.dropped_frames += 1
+            return
+
+        self._queue.put((host_id, received_at, message, keyframe, header.layer))
+        self.recorded_frames += 1
+
+    def end_session(self, host_id):
+        """Fecha a sessão do host; o próximo frame dele abre uma nova"""
+        self.waiting_keyframe = {stream for stream in self.waiting_keyframe
+                                 if stream[0] != host_id}
+        self._queue.put((host_id, None, None, False, 0))
+
+    def close(self):
+        """Grava o que estiver pendente e encerra a thread de escrita"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _new_session(self, host_id):
+        base = os.path.join(self.directory, host_id, datetime.now().strftime('%Y%m%d-%H%M%S'))
+        path, suffix = base, 1
+        while os.path.exists(path):
+            path = f"{base}-{suffix}"
+            suffix += 1
+        logger.info(f"Gravando sessão {os.path.relpath(path, self.directory)}")
+        return _Session(path, self.segment_bytes)
+
+    def _writer(self):
+        """Thread de escrita: grava a fila em lotes e descarrega periodicamente"""
+        sessions = {}  # host_id -> _Session
+        dirty = set()
+        last_flush = time.monotonic()
+        running = True
+
+        while running:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+            # Tudo o que já estiver na fila vai no mesmo lote
+            while batch and len(batch) < self.max_pending:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for item in batch:
+                if item is None:
+                    running = False
+                    break
+                host_id, received_at, message, keyframe, layer = item
+                try:
+                    if message is None:
+                        session = sessions.pop(host_id, None)
+                        if session is not None:
+                            session.close()
+                            dirty.discard(host_id)
+                        continue
+
+                    session = sessions.get(host_id)
+                    if session is None:
+                        # Uma sessão só começa em um keyframe
+                        if not keyframe:
+                            continue
+                        session = sessions[host_id] = self._new_session(host_id)
+                    session.write(received_at, message, keyframe, layer)
+                    dirty.add(host_id)
+                except OSError as e:
+                    logger.error(f"Erro ao gravar sessão do host {host_id}: {e}")
+                    sessions.pop(host_id, None)
+
+            now = time.monotonic()
+            if dirty and (now - last_flush >= self.flush_interval or not running):
+                for host_id in dirty:
+                    try:
+                        sessions[host_id].flush()
+                    except (KeyError, OSError):
+                        pass
+                dirty.clear()
+                last_flush = now
+
+        for session in sessions.values():
+            session.close()
+
+    def session_path(self, session_id):
+        """Caminho de uma sessão pelo ID "<host_id>/<início>", ou None se inválido"""
+        if not isinstance(session_id, str) or not SESSION_ID.match(session_id):
+            return None
+        path = os.path.join(self.directory, *session_id.split('/'))
+        return path if os.path.isdir(path) else None
+
+    def sessions(self):
+        """Lista as sessões gravadas (faz I/O: chamar fora do loop de eventos)"""
+        result = []
+        for host_id in sorted(os.listdir(self.directory)):
+            host_dir = os.path.join(self.directory, host_id)
+            if not os.path.isdir(host_dir):
+                continue
+            for name in sorted(os.listdir(host_dir)):
+                session_id = f"{host_id}/{name}"
+                if not SESSION_ID.match(session_id):
+                    continue
+                with SessionReader(os.path.join(host_dir, name)) as reader:
+                    if reader.start_time is None:
+                        continue
+                    result.append({
+                        'session': session_id,
+                        'host_id': host_id,
+                        'started_at': datetime.fromtimestamp(reader.start_time).isoformat(),
+                        'duration': reader.duration,
+                        'layers': reader.layers(),
+                        'bytes': reader.size
+                    })
+        return result
+
+    def get_stats(self):
+        return {
+            'recorded_frames': self.recorded_frames,
+            'recording_dropped_frames': self.dropped_frames,
+            'recording_pending': self._queue.qsize()
+        }
+
+
+class SessionReader:
+    """Leitura de uma sessão gravada via mmap, a partir de qualquer instante"""
+
+    def __init__(self, path):
+        self.path = path
+        self._maps = {}  # segmento -> mmap (abertos sob demanda)
+
+        # Índice por camada: instantes (para bisect) e posições dos keyframes
+        self.keyframes = {}  # camada -> ([instantes], [(segmento, offset)])
+        with open(os.path.join(path, INDEX_FILE), 'rb') as f:
+            data = f.read()
+        usable = len(data) - len(data) % INDEX_ENTRY.size  # ignora entrada incompleta
+        for received_at, segment, offset, layer in INDEX_ENTRY.iter_unpack(data[:usable]):
+            times, positions = self.keyframes.setdefault(layer, ([], []))
+            times.append(received_at)
+            positions.append((segment, offset))
+
+        self.segments = 0
+        self.size = 0
+        while os.path.exists(self._segment_path(self.segments)):
+            self.size += os.path.getsize(self._segment_path(self.segments))
+            self.segments += 1
+
+        first = next(self._records(0, 0), None)
+        self.start_time = first[0] if first else None
+        self.end_time = self._last_time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def duration(self):
+        if self.start_time is None:
+            return 0.0
+        return self.end_time - self.start_time
+
+    def layers(self):
+        return sorted(self.keyframes)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, SEGMENT_NAME.format(segment))
+
+    def _map(self, segment):
+        """mmap do segmento (None se vazio ou inexistente)"""
+        mapped = self._maps.get(segment)
+        if mapped is None:
+            try:
+                with open(self._segment_path(segment), 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):  # ValueError: arquivo vazio
+                return None
+            self._maps[segment] = mapped
+        return mapped
+
+    def _records(self, segment, offset):
+        """(instante, segmento, offset, memoryview da mensagem) a partir da posição"""
+        while segment < self.segments:
+            mapped = self._map(segment)
+            if mapped is not None:
+                view = memoryview(mapped)
+                try:
+                    end = len(mapped)
+                    while offset + RECORD.size <= end:
+                        received_at, length = RECORD.unpack_from(mapped, offset)
+                        start = offset + RECORD.size
+                        if start + length > end:
+                            break  # registro ainda sendo gravado
+                        yield received_at, segment, offset, view[start:start + length]
+                        offset = start + length
+                finally:
+                    view.release()
+            segment += 1
+            offset = 0
+
+    def _last_time(self):
+        """Instante do último registro, percorrendo só os cabeçalhos do último segmento"""
+        for segment in range(self.segments - 1, -1, -1):
+            mapped = self._map(segment)
+            if mapped is None:
+                continue
+            last, offset, end = None, 0, len(mapped)
+            while offset + RECORD.size <= end:
+                received_at, length = RECORD.unpack_from(mapped, offset)
+                offset += RECORD.size + length
+                if offset > end:
+                    break
+                last = received_at
+            if last is not None:
+                return last
+        return self.start_time
+
+    def seek(self, layer, position):
+        """(segmento, offset) do último keyframe da camada até position (segundos do início)"""
+        entry = self.keyframes.get(layer)
+        if entry is None or self.start_time is None:
+            return None
+        times, positions = entry
+        i = bisect.bisect_right(times, self.start_time + position) - 1
+        return positions[max(i, 0)]
+
+    def frames(self, layer, position=0.0, keyframes_only=False):
+        """Frames da camada a partir do keyframe anterior a position.
+
+        Gera (segundos desde o início, memoryview da mensagem). Os deltas entre
+        o keyframe e position também são gerados (sem eles a imagem em position
+        ficaria incompleta); cabe a quem reproduz não esperar por eles.
+        """
+        start = self.seek(layer, position)
+        if start is None:
+            return
+        for received_at, _, _, message in self._records(*start):
+            header = unpack_header(message[:HEADER_SIZE])
+            if header is None or header.layer != layer:
+                continue
+            if keyframes_only and not header.flags & FLAG_KEYFRAME:
+                continue
+            yield received_at - self.start_time, message
+
+    @staticmethod
+    def read_batch(frames, max_bytes=READ_BATCH_BYTES):
+        """Próximos frames de um gerador frames(), copiados do mmap para bytes.
+
+        Faz I/O (falta de página no mmap): chamar fora do loop de eventos.
+        Retorna uma lista vazia no fim da sessão.
+        """
+        batch, size = [], 0
+        for offset, message in frames:
+            data = bytes(message)
+            message.release()
+            batch.append((offset, data))
+            size += len(data)
+            if size >= max_bytes:
+                break
+        return batch
+
+    def close(self):
+        for mapped in self._maps.values():
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # ainda há memoryviews em uso; o GC libera depois
+        self._maps.clear()
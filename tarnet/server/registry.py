@@ -0,0 +1,198 @@
+"""Registros de hosts, clientes e salas do servidor TARNet.
+
+Registros compactos com `__slots__` em vez de dicionários aninhados. Cada
+host aponta diretamente para sua sala e cada cliente para a sala em que
+está, então o roteamento de frames e a limpeza de conexões não precisam
+montar chaves `room_...` nem varrer os dicionários do servidor.
+"""
+import time
+from datetime import datetime
+
+from shared.metrics import Histogram
+from shared.protocol import MAX_STREAMS, VIEW_BASE, host_id_to_bytes
+
+
+class Room:
+    """Sala de um host com seus clientes"""
+
+    __slots__ = ('room_id', 'host', 'clients', 'subscribers', 'views', 'view_specs',
+                 'created_at', 'last_feedback', 'remote_rendered', 'gap_keyframes')
+
+    def __init__(self, host):
+        self.room_id = Room.id_for(host.host_id)
+        self.host = host
+        self.clients = {}  # client_id -> ClientEntry
+        self.subscribers = {}  # stream (camada ou visão) -> {client_id: ClientEntry}
+        # Visões assinadas: (monitor, região) -> stream e stream -> (monitor, região)
+        self.views = {}
+        self.view_specs = {}
+        self.created_at = time.time()
+        self.last_feedback = 0.0
+        self.remote_rendered = {}  # worker_id -> último frame exibido lá (modo cluster)
+        self.gap_keyframes = {}    # stream -> último pedido de keyframe por descarte
+
+    @staticmethod
+    def id_for(host_id):
+        """room_id da sala de um host"""
+        return f"room_{host_id}"
+
+    def add_client(self, client):
+        self.clients[client.client_id] = client
+        self.subscribers.setdefault(client.layer, {})[client.client_id] = client
+
+    def remove_client(self, client):
+        self.clients.pop(client.client_id, None)
+        self._unsubscribe(client)
+
+    def _unsubscribe(self, client):
+        subscribers = self.subscribers.get(client.layer)
+        if subscribers is None:
+            return
+        subscribers.pop(client.client_id, None)
+        if not subscribers:
+            del self.subscribers[client.layer]
+
+    def set_layer(self, client, layer):
+        """Move o cliente para outra camada (ou visão)"""
+        self._unsubscribe(client)
+        client.layer = layer
+        self.subscribers.setdefault(layer, {})[client.client_id] = client
+
+    def view_stream(self, monitor, region):
+        """Stream da visão (reaproveitada entre clientes); None se não há IDs livres"""
+        key = (monitor, region)
+        stream = self.views.get(key)
+        if stream is None:
+            stream = next((stream for stream in range(VIEW_BASE, MAX_STREAMS)
+                           if stream not in self.view_specs), None)
+            if stream is None:
+                return None
+            self.views[key] = stream
+            self.view_specs[stream] = key
+        return stream
+
+    def release_views(self):
+        """Libera as visões sem clientes; retorna os streams liberados"""
+        released = [stream for stream in self.view_specs if stream not in self.subscribers]
+        for stream in released:
+            del self.views[self.view_specs.pop(stream)]
+        return released
+
+    def active_layers(self):
+        """Camadas e visões com pelo menos um cliente nesta sala"""
+        return sorted(self.subscribers)
+
+class HostEntry:
+    """Host Agent conectado (ou espelho de um host de outro worker)"""
+
+    __slots__ = ('host_id', 'host_id_bytes', 'websocket', 'worker_id', 'room',
+                 'connected_at', 'last_frame', 'last_seen', 'last_announced',
+                 'total_viewers', 'remote_viewers', 'layers', 'views', 'remote_layers',
+                 'has_viewers', 'monitors', 'mode', 'resume_token', 'disconnected_at', 'expire_handle',
+                 'frames_received', 'bytes_received', 'last_sequence', 'fps',
+                 'bytes_per_second', 'receive_delay', 'stage_metrics',
+                 '_window_start', '_window_frames', '_window_bytes')
+
+    def __init__(self, host_id, websocket, worker_id=None, connected_at=None):
+        now = time.time()
+        self.host_id = host_id
+        self.host_id_bytes = host_id_to_bytes(host_id)
+        self.websocket = websocket  # None quando o host está em outro worker
+        self.worker_id = worker_id
+        self.room = Room(self)
+        self.connected_at = connected_at or now
+        self.last_frame = None
+        self.last_seen = now
+        self.last_announced = 0.0
+
+        # Modo cluster: clientes em todos os workers / fora do worker dono
+        self.total_viewers = None
+        self.remote_viewers = 0
+        self.remote_layers = ()  # camadas assinadas em outros workers
+
+        # Camadas pedidas ao host na última atualização
+        self.layers = []
+        self.views = []
+        # Demanda informada ao host (None até o primeiro viewer_demand)
+        self.has_viewers = None
+        # Monitores informados no registro ({left, top, width, height}, 1-based)
+        self.monitors = []
+        # Modo do host (HOST_MODES): sem "input" os comandos são recusados,
+        # sem "stream" não há camadas a pedir
+        self.mode = 'both'
+        # Retomada: token entregue ao host e, enquanto ele está fora, o instante
+        # da queda e a remoção agendada para o fim do período de tolerância
+        self.resume_token = None
+        self.disconnected_at = None
+        self.expire_handle = None
+
+        # Métricas (só contadores no caminho quente; formatadas em /metrics)
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.last_sequence = None
+        self.fps = 0.0
+        self.bytes_per_second = 0.0
+        self.receive_delay = Histogram()  # captura no host -> chegada ao servidor
+        self.stage_metrics = {}           # estágio do host -> Histogram (host_metrics)
+        self._window_start = now
+        self._window_frames = 0
+        self._window_bytes = 0
+
+    @property
+    def is_remote(self):
+        return self.websocket is None
+
+    def record_frame(self, header, size, now):
+        """Atualiza contadores e taxas a partir de um frame recebido"""
+        self.frames_received += 1
+        self.bytes_received += size
+        self.last_sequence = header.sequence
+        self.receive_delay.observe(max(0.0, now - header.timestamp))
+
+        # FPS e bytes/s em janelas de um segundo
+        self._window_frames += 1
+        self._window_bytes += size
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self.fps = self._window_frames / elapsed
+            self.bytes_per_second = self._window_bytes / elapsed
+            self._window_start = now
+            self._window_frames = 0
+            self._window_bytes = 0
+
+    def get_info(self):
+        """Informações públicas do host (datas formatadas só aqui)"""
+        return {
+            'host_id': self.host_id,
+            'connected_at': datetime.fromtimestamp(self.connected_at).isoformat(),
+            'last_frame': (datetime.fromtimestamp(self.last_frame).isoformat()
+                           if self.last_frame else None),
+            'clients_connected': (self.total_viewers if self.total_viewers is not None
+                                  else len(self.room.clients))
+        }
+
+
+class ClientEntry:
+    """Cliente web conectado à sala de um host"""
+
+    __slots__ = ('client_id', 'websocket', 'channel', 'room', 'layer',
+                 'connected_at', 'last_rendered', 'render_fps', 'render_backlog',
+                 'render_dropped')
+
+    def __init__(self, client_id, websocket, channel, room, layer=0):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.channel = channel
+        self.room = room
+        self.layer = layer
+        self.connected_at = time.time()
+        self.last_rendered = None
+        # Informados pelo navegador em frame_ack: ritmo de exibição, frames
+        # recebidos ainda não exibidos e descartados por estarem obsoletos
+        self.render_fps = None
+        self.render_backlog = None
+        self.render_dropped = 0
+
+    @property
+    def host_id(self):
+        return self.room.host.host_id
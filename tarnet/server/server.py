@@ -1,27 +1,121 @@
+import argparse
 import asyncio
 import websockets
 import json
 import logging
+import math
+import os
+import secrets
+import socket
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from http import HTTPStatus
 from typing import Dict, Set, Optional
 
-# Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Permite importar o pacote compartilhado (tarnet/shared) ao rodar "python server.py"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cluster import run_cluster
+from directory import HostDirectory
+from egress import EgressScheduler
+from fanout import ClientChannel
+from frame_cache import FrameCache
+from recorder import SessionReader, SessionRecorder
+from registry import ClientEntry, HostEntry, Room
+from shared.logs import RateLimitedLog, fields, setup_logging
+from shared.metrics import Histogram, MetricsRegistry, is_count
+from shared.protocol import (
+    FRAME_TYPES, HEADER_SIZE, HOST_MODES, LAYER_FULL, LAYERS, MAX_STREAMS, VIEW_BASE, coalesce_moves,
+    host_id_from_bytes, host_id_to_bytes, parse_layer, parse_monitors, parse_view, unpack_header
 )
+from shared.ring import DOORBELL, FrameRing
+
+# Logging configurado por setup_logging() (escrita em thread separada)
 logger = logging.getLogger(__name__)
+# Eventos por comando ou por mensagem: no máximo um registro por segundo de
+# cada tipo, com a contagem dos suprimidos
+event_log = RateLimitedLog(logger, interval=1.0)
 
 class TARNetServer:
-    def __init__(self, host='localhost', port=8000):
+    def __init__(self, host='localhost', port=8000, record_dir=None,
+                 egress_rate=None, host_rate=None, client_rate=None, local_socket=None,
+                 host_rates=None, host_weights=None):
         self.host = host
         self.port = port
         
+        # Socket Unix para hosts na mesma máquina: a conexão de controle é um
+        # WebSocket e os frames chegam por um anel em memória compartilhada
+        self.local_socket = local_socket
+        self.local_connections: Set[object] = set()
+        self.rings: Dict[object, FrameRing] = {}  # websocket -> anel do host
+        
         # Armazenamento de conexões
-        self.hosts: Dict[str, dict] = {}  # host_id -> {websocket, info, last_seen}
-        self.clients: Dict[str, dict] = {}  # client_id -> {websocket, info, connected_host}
-        self.rooms: Dict[str, dict] = {}  # room_id -> {host_id, clients_set, created_at}
+        self.hosts: Dict[str, HostEntry] = {}  # host_id -> HostEntry (com link para a sala)
+        self.clients: Dict[str, ClientEntry] = {}  # client_id -> ClientEntry
+        self.rooms: Dict[str, Room] = {}  # room_id -> Room
+        self.connections: Dict[object, list] = {}  # websocket -> registros da conexão
+        
+        # Frames pendentes por cliente antes de descartar até o próximo keyframe
+        self.client_queue_size = 2
+        
+        # Limites do WebSocket explícitos para mensagens de frame: tamanho máximo
+        # de uma mensagem recebida e buffer de escrita antes de o envio esperar.
+        # Sem permessage-deflate: JPEG e vídeo já vêm comprimidos e o deflate
+        # era o maior custo de CPU do relay.
+        self.max_message_size = 16 * 1024 * 1024
+        self.write_limit = 256 * 1024
+        
+        # Orçamentos de banda de saída em bytes/s (None: sem limite): global,
+        # por host (soma dos clientes da sala) e por cliente. Com qualquer um
+        # deles os envios passam pelo escalonador (WFQ entre as salas).
+        # host_rates e host_weights (host_id -> bytes/s ou peso) ajustam hosts
+        # específicos
+        self.egress = None
+        if egress_rate or host_rate or client_rate or host_rates or host_weights:
+            self.egress = EgressScheduler(
+                egress_rate, host_rate, client_rate,
+                room_rates={Room.id_for(h): rate for h, rate in (host_rates or {}).items()},
+                weights={Room.id_for(h): weight for h, weight in (host_weights or {}).items()}
+            )
+        # Intervalo mínimo entre pedidos de keyframe por descarte em uma sala
+        self.gap_keyframe_interval = 0.5
+        
+        # Intervalo mínimo entre feedbacks dos clientes repassados ao host
+        self.feedback_interval = 0.5
+        
+        # Tempo que a sala de um host que caiu espera ele voltar (register_host
+        # com o resume_token) antes de ser removida
+        self.host_grace_period = 30.0
+        
+        # Máximo de comandos aceitos em um control_batch
+        self.max_batch_commands = 256
+        
+        # Último keyframe (e deltas seguintes) de cada host, para novos clientes
+        self.frame_cache = FrameCache()
+        
+        # Lista de hosts publicada aos painéis inscritos (deltas) e em GET /hosts
+        self.directory = HostDirectory(self.hosts)
+        self.directory_interval = 1.0
+        self.thumbnail_interval = 10.0
+        
+        # Gravação das sessões (opcional) e reproduções em andamento
+        self.recorder = SessionRecorder(record_dir) if record_dir else None
+        self.replays: Dict[object, asyncio.Task] = {}  # websocket -> tarefa de reprodução
+        # A partir desta velocidade a reprodução envia só keyframes
+        self.scrub_speed = 8.0
+        
+        # Conexão com o hub quando rodando em modo multi-worker (cluster.py)
+        self.cluster = None
+        
+        # Métricas expostas em /metrics (formatadas só quando lidas)
+        self.metrics = MetricsRegistry()
+        self.fanout_latency = self.metrics.histogram(
+            'tarnet_fanout_latency_seconds',
+            'Tempo entre o frame chegar ao servidor e ser enviado ao cliente'
+        ).labels()
+        self.metrics.collector(self.collect_metrics)
         
         # Estatísticas
         self.stats = {
@@ -40,39 +134,183 @@ class TARNetServer:
             await self.send_error(websocket, "ID do host não fornecido")
             return False
         
-        # Registra o host
-        self.hosts[host_id] = {
-            'websocket': websocket,
-            'info': {
-                'host_id': host_id,
-                'connected_at': datetime.now().isoformat(),
-                'last_frame': None
-            },
-            'last_seen': time.time()
-        }
+        # O ID trafega no cabeçalho binário dos frames, então precisa ser um UUID
+        try:
+            host = HostEntry(host_id, websocket)
+        except ValueError:
+            await self.send_error(websocket, "ID do host deve ser um UUID")
+            return False
         
-        # Cria uma sala para o host
-        room_id = f"room_{host_id}"
-        self.rooms[room_id] = {
-            'host_id': host_id,
-            'clients': set(),
-            'created_at': datetime.now().isoformat()
-        }
+        # Monitores do host, para os clientes escolherem visões (set_view)
+        if data.get('monitors') is not None:
+            monitors = parse_monitors(data['monitors'])
+            if monitors is None:
+                await self.send_error(websocket, "Monitores inválidos: esperado lista de "
+                                                 "{left, top, width, height} inteiros, com tamanho positivo")
+                return False
+            host.monitors = monitors
+        if data.get('mode') in HOST_MODES:
+            host.mode = data['mode']
+        
+        # Host na mesma máquina: frames pelo anel em memória compartilhada
+        if data.get('ring'):
+            self.attach_ring(websocket, data['ring'])
+        
+        # O mesmo host voltando com o token: mantém a sala e os clientes
+        existing = self.hosts.get(host_id)
+        token = data.get('resume_token')
+        if (existing is not None and existing.resume_token and isinstance(token, str)
+                and secrets.compare_digest(token, existing.resume_token)):
+            existing.mode = host.mode
+            await self.resume_host(existing, websocket, host.monitors)
+            return True
+        
+        # Um novo registro com o mesmo ID substitui o anterior
+        if host_id in self.hosts:
+            await self.remove_host(host_id)
+        host.resume_token = secrets.token_urlsafe(24)
+        
+        # Registra o host e sua sala
+        room = host.room
+        self.hosts[host_id] = host
+        self.rooms[room.room_id] = room
+        self.connections.setdefault(websocket, []).append(host)
         
         self.stats['total_hosts'] += 1
         
-        logger.info(f"Host registrado: {host_id} na sala {room_id}")
+        if self.cluster:
+            self.cluster.host_up(host)
+        
+        logger.info("Host registrado", extra=fields(host_id=host_id, room_id=room.room_id,
+                                                    mode=host.mode, ring=websocket in self.rings))
         
         # Confirma registro
         await self.send_message(websocket, {
             'type': 'host_registered',
             'host_id': host_id,
-            'room_id': room_id,
+            'room_id': room.room_id,
+            'resume_token': host.resume_token,
+            'grace_period': self.host_grace_period,
+            'resumed': False,
+            'ring': websocket in self.rings,
             'server_time': datetime.now().isoformat()
         })
         
+        # Ninguém assistindo ainda: o host começa ocioso
+        await self.update_host_layers(host)
+        
         return True
     
+    async def resume_host(self, host, websocket, monitors):
+        """Reassocia à sala que ficou esperando um host que voltou com o token"""
+        if host.expire_handle is not None:
+            host.expire_handle.cancel()
+            host.expire_handle = None
+        
+        # A conexão anterior pode ainda não ter sido detectada como fechada
+        previous = host.websocket
+        self._unindex_connection(host)
+        if previous is not websocket and previous is not None:
+            asyncio.create_task(previous.close())
+        
+        host.websocket = websocket
+        host.worker_id = None  # espelho de outro worker passa a ser local
+        host.disconnected_at = None
+        host.last_seen = time.time()
+        if monitors:
+            host.monitors = monitors
+        self.connections.setdefault(websocket, []).append(host)
+        
+        # No cluster o host pode ter voltado em outro worker: o anúncio move
+        # a posse para este e atualiza os espelhos
+        if self.cluster:
+            self.cluster.host_up(host, resumed=True)
+        
+        # O host precisa receber de novo camadas, visões e demanda
+        host.layers = None
+        host.views = None
+        host.has_viewers = None
+        
+        resumed = json.dumps({'type': 'host_resumed', 'host_id': host.host_id})
+        for client in host.room.clients.values():
+            client.channel.push_message(resumed)
+        
+        logger.info("Host retomado", extra=fields(host_id=host.host_id, clients=len(host.room.clients),
+                                                  ring=websocket in self.rings))
+        
+        await self.send_message(websocket, {
+            'type': 'host_registered',
+            'host_id': host.host_id,
+            'room_id': host.room.room_id,
+            'resume_token': host.resume_token,
+            'grace_period': self.host_grace_period,
+            'resumed': True,
+            'ring': websocket in self.rings,
+            'server_time': datetime.now().isoformat()
+        })
+        await self.update_host_layers(host)
+    
+    async def suspend_host(self, host):
+        """Conexão do host caiu: mantém a sala e os clientes pelo período de tolerância"""
+        if self.host_grace_period <= 0:
+            await self.remove_host(host.host_id)
+            return
+        
+        self._unindex_connection(host)
+        host.disconnected_at = time.time()
+        loop = asyncio.get_running_loop()
+        host.expire_handle = loop.call_later(
+            self.host_grace_period, lambda: asyncio.create_task(self.expire_host(host))
+        )
+        
+        reconnecting = json.dumps({
+            'type': 'host_reconnecting',
+            'host_id': host.host_id,
+            'grace_period': self.host_grace_period
+        })
+        for client in host.room.clients.values():
+            client.channel.push_message(reconnecting)
+        if self.cluster:
+            self.cluster.host_suspended(host.host_id, self.host_grace_period)
+        
+        logger.info(f"Host {host.host_id} desconectado; aguardando retomada por "
+                    f"{self.host_grace_period:.0f} s")
+    
+    async def release_host(self, host, worker_id):
+        """O host foi retomado em outro worker: a sala daqui passa a espelhá-lo"""
+        if host.expire_handle is not None:
+            host.expire_handle.cancel()
+            host.expire_handle = None
+        
+        # A conexão anterior pode ainda não ter sido detectada como fechada
+        previous = host.websocket
+        self._unindex_connection(host)
+        if previous is not None:
+            asyncio.create_task(previous.close())
+        if self.recorder:
+            self.recorder.end_session(host.host_id)
+        
+        host.websocket = None
+        host.worker_id = worker_id
+        host.disconnected_at = None
+        host.layers = None
+        host.views = None
+        host.has_viewers = None
+        
+        resumed = json.dumps({'type': 'host_resumed', 'host_id': host.host_id})
+        for client in host.room.clients.values():
+            client.channel.push_message(resumed)
+        
+        logger.info("Host retomado em outro worker", extra=fields(
+            host_id=host.host_id, worker=worker_id, clients=len(host.room.clients)))
+    
+    async def expire_host(self, host):
+        """Fim do período de tolerância: remove o host que não voltou"""
+        host.expire_handle = None
+        if self.hosts.get(host.host_id) is host and host.disconnected_at is not None:
+            logger.info(f"Host {host.host_id} não voltou a tempo")
+            await self.remove_host(host.host_id)
+    
     async def register_client(self, websocket, data):
         """Registra um novo cliente web"""
         client_id = data.get('client_id')
@@ -86,82 +324,283 @@ class TARNetServer:
             await self.send_error(websocket, "Host de destino não especificado")
             return False
         
+        # Camada de simulcast assinada (nome ou índice; padrão: resolução completa)
+        layer = parse_layer(data.get('layer', LAYER_FULL))
+        if layer is None:
+            await self.send_error(websocket, f"Camada inválida: {data.get('layer')}")
+            return False
+        
         # Verifica se o host existe
-        if target_host not in self.hosts:
+        host = self.hosts.get(target_host)
+        if host is None:
             await self.send_error(websocket, f"Host {target_host} não está conectado")
             return False
         
-        # Registra o cliente
-        self.clients[client_id] = {
-            'websocket': websocket,
-            'info': {
-                'client_id': client_id,
-                'target_host': target_host,
-                'connected_at': datetime.now().isoformat()
-            },
-            'connected_host': target_host
-        }
+        # Um novo registro com o mesmo ID substitui o anterior
+        if client_id in self.clients:
+            await self.remove_client(client_id)
         
-        # Adiciona o cliente à sala do host
-        room_id = f"room_{target_host}"
-        if room_id in self.rooms:
-            self.rooms[room_id]['clients'].add(client_id)
+        # Registra o cliente com sua fila de saída própria e o adiciona à sala do host
+        channel = ClientChannel(websocket, self.client_queue_size, self.stats, self.fanout_latency,
+                                self.egress, host.room.room_id)
+        channel.start()
+        
+        client = ClientEntry(client_id, websocket, channel, host.room, layer)
+        channel.on_gap = lambda: self.request_gap_keyframe(client)
+        self.clients[client_id] = client
+        host.room.add_client(client)
+        self.connections.setdefault(websocket, []).append(client)
         
         self.stats['total_clients'] += 1
+        await self.update_viewers(host.room)
+        
+        logger.info("Cliente conectado", extra=fields(client_id=client_id, host_id=target_host,
+                                                      layer=LAYERS[layer]))
         
-        logger.info(f"Cliente conectado: {client_id} -> Host: {target_host}")
+        await self.send_cached_frames(client)
         
-        # Confirma registro e envia lista de hosts disponíveis
+        # Confirma registro (a lista de hosts fica em get_hosts, para o custo
+        # de cada conexão não crescer com o número de hosts)
         await self.send_message(websocket, {
             'type': 'client_registered',
             'client_id': client_id,
             'target_host': target_host,
-            'available_hosts': list(self.hosts.keys()),
+            'layer': LAYERS[layer],
+            'monitors': host.monitors,
             'server_time': datetime.now().isoformat()
         })
         
         return True
     
-    async def handle_screen_frame(self, websocket, data):
-        """Processa frame de tela do host e distribui para clientes"""
-        host_id = data.get('host_id')
-        frame_data = data.get('data')
+    async def send_cached_frames(self, client):
+        """Envia ao cliente o último frame completo em cache da camada dele"""
+        host = client.room.host
+        cached, complete = self.frame_cache.get(host.host_id, client.layer)
+        for frame in cached or ():
+            client.channel.push_message(frame)
+        
+        # Sem cache completo, pede um keyframe ao host para o cliente
+        # não depender de frames delta
+        if not complete:
+            await self.send_to_host(host, {'type': 'request_keyframe', 'layer': client.layer})
+    
+    def request_gap_keyframe(self, client):
+        """Cliente descartou frames: pede um keyframe da camada dele (limitado por sala)"""
+        room = client.room
+        now = time.monotonic()
+        if now - room.gap_keyframes.get(client.layer, 0.0) < self.gap_keyframe_interval:
+            return
+        room.gap_keyframes[client.layer] = now
+        asyncio.create_task(self.send_to_host(room.host, {
+            'type': 'request_keyframe',
+            'layer': client.layer
+        }))
+    
+    async def handle_set_layer(self, websocket, data):
+        """Troca a camada de simulcast assinada por um cliente"""
+        client = self.clients.get(data.get('client_id'))
+        if client is None or client.websocket is not websocket:
+            await self.send_error(websocket, "Cliente não registrado")
+            return
         
-        if not host_id or host_id not in self.hosts:
+        layer = parse_layer(data.get('layer'))
+        if layer is None:
+            await self.send_error(websocket, f"Camada inválida: {data.get('layer')}")
             return
         
-        # Atualiza informações do host
-        self.hosts[host_id]['last_seen'] = time.time()
-        self.hosts[host_id]['info']['last_frame'] = datetime.now().isoformat()
+        if layer != client.layer:
+            client.room.set_layer(client, layer)
+            await self.update_viewers(client.room)
+            await self.send_cached_frames(client)
         
-        # Encontra a sala do host
-        room_id = f"room_{host_id}"
-        if room_id not in self.rooms:
+        client.channel.push_message(json.dumps({
+            'type': 'layer_changed',
+            'layer': LAYERS[layer]
+        }))
+    
+    async def handle_set_view(self, websocket, data):
+        """Assina uma visão: um monitor ou região dele na resolução nativa"""
+        client = self.clients.get(data.get('client_id'))
+        if client is None or client.websocket is not websocket:
+            await self.send_error(websocket, "Cliente não registrado")
             return
         
-        # Envia frame para todos os clientes conectados na sala
-        room = self.rooms[room_id]
-        frame_message = {
-            'type': 'screen_frame',
-            'host_id': host_id,
-            'data': frame_data,
-            'timestamp': data.get('timestamp', time.time())
-        }
+        # O host é quem recebe a lista de visões, então só funciona no worker dono
+        host = client.room.host
+        if host.is_remote:
+            await self.send_error(websocket, "Visões só são suportadas no worker do host")
+            return
         
-        disconnected_clients = []
-        for client_id in room['clients'].copy():
-            if client_id in self.clients:
-                try:
-                    await self.send_message(
-                        self.clients[client_id]['websocket'], 
-                        frame_message
-                    )
-                except websockets.exceptions.ConnectionClosed:
-                    disconnected_clients.append(client_id)
-        
-        # Remove clientes desconectados
-        for client_id in disconnected_clients:
-            await self.remove_client(client_id)
+        view = parse_view(data, host.monitors)
+        if view is None:
+            await self.send_error(websocket, "Monitor ou região inválidos")
+            return
+        
+        # Clientes com a mesma visão compartilham o stream (uma só codificação)
+        stream = client.room.view_stream(*view)
+        if stream is None:
+            await self.send_error(websocket, "Limite de visões da sala atingido")
+            return
+        
+        # Confirma antes dos frames em cache: o cliente só aceita os do stream informado
+        monitor, region = view
+        client.channel.push_message(json.dumps({
+            'type': 'view_changed',
+            'stream': stream,
+            'monitor': monitor,
+            'region': list(region) if region else None
+        }))
+        
+        if stream != client.layer:
+            client.room.set_layer(client, stream)
+            await self.update_viewers(client.room)
+            await self.send_cached_frames(client)
+    
+    def attach_ring(self, websocket, name):
+        """Abre o anel criado pelo host; só vale para conexões pelo socket Unix"""
+        if websocket not in self.local_connections or not isinstance(name, str):
+            return
+        if websocket in self.rings:
+            return
+        try:
+            ring = FrameRing.attach(name)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Anel {name} indisponível, frames seguem pelo WebSocket: {e}")
+            return
+        # Frames de uma conexão anterior não são mais esperados
+        ring.reset()
+        self.rings[websocket] = ring
+    
+    async def drain_ring(self, websocket, doorbell):
+        """Processa os frames do anel até a posição anunciada no aviso"""
+        ring = self.rings.get(websocket)
+        if ring is None or len(doorbell) != DOORBELL.size:
+            return
+        (until,) = DOORBELL.unpack(doorbell)
+        while True:
+            message = ring.read(until)
+            if message is None:
+                return
+            await self.handle_screen_frame(websocket, message)
+    
+    async def handle_screen_frame(self, websocket, message):
+        """Processa frame binário do host e repassa para os clientes sem decodificar"""
+        header = unpack_header(message)
+        if header is None or header.msg_type not in FRAME_TYPES:
+            return
+        
+        # Só aceita frames do host registrado nesta própria conexão
+        host = self.find_host_by_connection(websocket, header.host_id)
+        if host is None:
+            return
+        
+        # Atualiza informações do host (datas só são formatadas em get_hosts)
+        now = time.time()
+        host.last_seen = now
+        host.last_frame = now
+        host.record_frame(header, len(message), now)
+        
+        self.frame_cache.store(host.host_id, header, message)
+        self.relay_frame(host, message, header.layer)
+        
+        # Só enfileira: a escrita em disco fica na thread do gravador
+        if self.recorder:
+            self.recorder.record(host.host_id, header, message, now)
+        
+        # Modo cluster: só encaminha ao hub se houver clientes em outros workers
+        if self.cluster:
+            self.cluster.host_seen(host)
+            if host.remote_viewers:
+                self.cluster.forward_frame(message)
+    
+    def relay_frame(self, host, message, layer):
+        """Enfileira a mensagem binária original para os clientes da camada"""
+        subscribers = host.room.subscribers.get(layer)
+        if subscribers is None:
+            return
+        
+        # Cada cliente tem sua própria tarefa de envio, então não há await aqui
+        for client in subscribers.values():
+            client.channel.push_frame(message)
+    
+    def relay_remote_frame(self, message):
+        """Distribui um frame de host de outro worker recebido pelo hub"""
+        header = unpack_header(message)
+        if header is None:
+            return
+        
+        host = self.hosts.get(host_id_from_bytes(header.host_id))
+        if host is not None and host.is_remote:
+            self.frame_cache.store(host.host_id, header, message)
+            self.relay_frame(host, message, header.layer)
+    
+    async def send_to_host(self, host, message):
+        """Envia mensagem ao host, direto ou via hub se estiver em outro worker"""
+        if host.is_remote:
+            self.cluster.send_command(host.host_id, message)
+        elif host.disconnected_at is None:
+            # Host fora aguardando retomada: o estado é reenviado quando ele volta
+            await self.send_message(host.websocket, message)
+    
+    async def update_viewers(self, room):
+        """Atualiza o hub e o host após mudança nos clientes da sala"""
+        host = room.host
+        # Visões sem clientes deixam de ser codificadas e saem do cache
+        for stream in room.release_views():
+            self.frame_cache.remove(host.host_id, stream)
+        
+        active = room.active_layers()
+        if self.cluster:
+            self.cluster.update_viewers(host.host_id, len(room.clients), active)
+        
+        if not host.is_remote:
+            await self.update_host_layers(host)
+            return
+        
+        # Host de outro worker: camadas sem clientes aqui deixam de chegar pelo
+        # hub, então o cache delas ficaria desatualizado
+        for layer in range(len(LAYERS)):
+            if layer not in active:
+                self.frame_cache.remove(host.host_id, layer)
+    
+    async def update_host_layers(self, host):
+        """Informa ao host quais camadas e visões têm clientes (só essas são codificadas)"""
+        if host.disconnected_at is not None:
+            return  # reenviado em resume_host
+        if host.mode == 'input':
+            return  # não transmite a tela
+        
+        streams = set(host.room.active_layers()) | set(host.remote_layers)
+        layers = sorted(stream for stream in streams if stream < VIEW_BASE)
+        views = [
+            {'id': stream, 'monitor': monitor, 'region': list(region) if region else None}
+            for stream, (monitor, region) in sorted(host.room.view_specs.items())
+        ]
+        if layers != host.layers or views != host.views:
+            host.layers = layers
+            host.views = views
+            await self.send_message(host.websocket, {
+                'type': 'set_layers',
+                'layers': layers,
+                'views': views
+            })
+        
+        # Sala passou de vazia para assistida (ou o contrário): o host pausa ou
+        # retoma a captura
+        has_viewers = bool(layers or views)
+        if has_viewers != host.has_viewers:
+            host.has_viewers = has_viewers
+            await self.send_message(host.websocket, {
+                'type': 'viewer_demand',
+                'viewers': len(host.room.clients) + host.remote_viewers
+            })
+    
+    def find_host_by_connection(self, websocket, host_id_bytes):
+        """Retorna o host registrado na conexão com o ID (em bytes) informado"""
+        for entry in self.connections.get(websocket, ()):
+            if isinstance(entry, HostEntry) and entry.host_id_bytes == host_id_bytes:
+                return entry
+        return None
     
     async def handle_control_command(self, websocket, data):
         """Processa comando de controle do cliente e envia para o host"""
@@ -173,50 +612,443 @@ class TARNetServer:
             await self.send_error(websocket, "Dados do comando incompletos")
             return
         
-        # Verifica se o cliente está registrado
-        if client_id not in self.clients:
-            await self.send_error(websocket, "Cliente não registrado")
+        if not isinstance(command, dict) or not isinstance(command.get('type'), str):
+            await self.send_error(websocket, "Comando inválido: esperado objeto com 'type'")
             return
         
-        # Verifica se o host está conectado
-        if target_host not in self.hosts:
-            await self.send_error(websocket, "Host não está conectado")
+        # Pedido de keyframe é do lado da tela, válido também em modo stream
+        host = await self.get_command_host(websocket, client_id, target_host,
+                                           needs_input=command.get('type') != 'request_keyframe')
+        if host is None:
             return
         
         # Envia comando para o host
         try:
-            await self.send_message(self.hosts[target_host]['websocket'], command)
-            logger.info(f"Comando enviado: {client_id} -> {target_host} : {command.get('type', 'unknown')}")
+            await self.send_to_host(host, command)
+            event_log.debug('command', "Comando enviado", client_id=client_id,
+                            host_id=target_host, type=command.get('type', 'unknown'))
+        except websockets.exceptions.ConnectionClosed:
+            await self.remove_host(target_host)
+            await self.send_error(websocket, "Host desconectado")
+    
+    async def handle_control_batch(self, websocket, data):
+        """Repassa ao host, em uma única mensagem, os comandos de um quadro do cliente"""
+        client_id = data.get('client_id')
+        target_host = data.get('target_host')
+        commands = data.get('commands')
+        
+        if not client_id or not target_host or not isinstance(commands, list) or not commands:
+            await self.send_error(websocket, "Dados do lote de comandos incompletos")
+            return
+        
+        if len(commands) > self.max_batch_commands:
+            await self.send_error(websocket, "Lote de comandos muito grande")
+            return
+        
+        invalid = next((index for index, command in enumerate(commands)
+                        if not isinstance(command, dict) or not isinstance(command.get('type'), str)),
+                       None)
+        if invalid is not None:
+            await self.send_error(websocket, f"Comando {invalid} do lote inválido: esperado objeto com 'type'")
+            return
+        
+        host = await self.get_command_host(websocket, client_id, target_host)
+        if host is None:
+            return
+        
+        try:
+            await self.send_to_host(host, {
+                'type': 'command_batch',
+                'commands': coalesce_moves(commands)
+            })
+            event_log.debug('command_batch', "Lote enviado", client_id=client_id,
+                            host_id=target_host, commands=len(commands))
         except websockets.exceptions.ConnectionClosed:
             await self.remove_host(target_host)
             await self.send_error(websocket, "Host desconectado")
     
+    async def get_command_host(self, websocket, client_id, target_host, needs_input=True):
+        """Valida cliente e host de um comando (needs_input: comando de entrada); retorna o host ou None"""
+        # Verifica se o cliente está registrado
+        if client_id not in self.clients:
+            await self.send_error(websocket, "Cliente não registrado")
+            return None
+        
+        # Verifica se o host está conectado
+        host = self.hosts.get(target_host)
+        if host is None:
+            await self.send_error(websocket, "Host não está conectado")
+            return None
+        
+        if needs_input and host.mode == 'stream':
+            await self.send_error(websocket, "Host em modo somente visualização")
+            return None
+        
+        return host
+    
+    async def handle_frame_ack(self, websocket, data):
+        """Registra o último frame exibido pelo cliente e repassa ao host"""
+        client = self.clients.get(data.get('client_id'))
+        if client is None or client.websocket is not websocket:
+            return
+        
+        # Valores inválidos chegariam às métricas e ao controle de taxa do
+        # host: o ack inteiro é descartado
+        sequence = data.get('sequence')
+        render_fps = data.get('render_fps')
+        backlog = data.get('backlog')
+        dropped = data.get('dropped')
+        if not (is_count(sequence) and sequence < 2 ** 32):
+            return
+        if render_fps is not None and (isinstance(render_fps, bool)
+                                       or not isinstance(render_fps, (int, float))
+                                       or not math.isfinite(render_fps)):
+            return
+        if (backlog is not None and not is_count(backlog)) or (dropped is not None and not is_count(dropped)):
+            return
+        
+        client.last_rendered = sequence
+        if render_fps is not None:
+            client.render_fps = render_fps
+        if backlog is not None:
+            client.render_backlog = backlog
+        if dropped is not None:
+            client.render_dropped += dropped
+        await self.send_viewer_feedback(client.room)
+    
+    async def send_viewer_feedback(self, room):
+        """Agrega os clientes da sala e repassa o mais atrasado ao host"""
+        host = room.host
+        if self.hosts.get(host.host_id) is not host:
+            return
+        
+        # Limita a frequência de envio ao host
+        now = time.time()
+        if now - room.last_feedback < self.feedback_interval:
+            return
+        room.last_feedback = now
+        
+        rendered = [
+            client.last_rendered for client in room.clients.values()
+            if client.last_rendered is not None
+        ]
+        
+        # Host em outro worker: o worker dono faz a agregação final
+        if host.is_remote:
+            if rendered:
+                self.cluster.send_feedback(host.host_id, min(rendered))
+            return
+        
+        rendered.extend(room.remote_rendered.values())
+        if not rendered or host.disconnected_at is not None:
+            return
+        
+        await self.send_message(host.websocket, {
+            'type': 'viewer_feedback',
+            'last_rendered': min(rendered),
+            'viewers': host.total_viewers if host.total_viewers is not None else len(room.clients)
+        })
+    
+    async def handle_host_metrics(self, websocket, data):
+        """Guarda os histogramas de estágios (captura, codificação, envio) do host"""
+        host = self.hosts.get(data.get('host_id'))
+        stages = data.get('stages')
+        if host is None or host.websocket is not websocket or not isinstance(stages, dict):
+            return
+        
+        # O host envia os valores acumulados, então cada relatório substitui o anterior
+        for stage, snapshot in stages.items():
+            histogram = Histogram.from_snapshot(snapshot)
+            if histogram is not None:
+                host.stage_metrics[stage] = histogram
+    
+    def collect_metrics(self):
+        """Métricas lidas dos registros na hora da leitura de /metrics"""
+        # Só hosts deste worker; hosts de outros workers aparecem nas métricas deles
+        hosts = [host for host in self.hosts.values() if not host.is_remote]
+        # Taxas de hosts parados há mais de 2 s valem zero (a janela não fecha sem frames)
+        now = time.time()
+        active = {host.host_id: host.last_frame is not None and now - host.last_frame < 2.0
+                  for host in hosts}
+        clients = [(host, client) for host in hosts for client in host.room.clients.values()]
+        
+        yield ('tarnet_hosts', 'gauge', 'Hosts conectados', (), [((), len(hosts))])
+        yield ('tarnet_clients', 'gauge', 'Clientes conectados', (), [((), len(self.clients))])
+        yield ('tarnet_ring_hosts', 'gauge', 'Hosts locais enviando frames por memória compartilhada',
+               (), [((), len(self.rings))])
+        yield ('tarnet_messages_processed_total', 'counter', 'Mensagens enviadas pelo servidor',
+               (), [((), self.stats['messages_processed'])])
+        
+        yield ('tarnet_host_frames_received_total', 'counter', 'Frames recebidos do host',
+               ('host_id',), [((host.host_id,), host.frames_received) for host in hosts])
+        yield ('tarnet_host_bytes_received_total', 'counter', 'Bytes de frames recebidos do host',
+               ('host_id',), [((host.host_id,), host.bytes_received) for host in hosts])
+        yield ('tarnet_host_fps', 'gauge', 'Frames por segundo recebidos do host',
+               ('host_id',), [((host.host_id,), round(host.fps, 2) if active[host.host_id] else 0.0)
+                for host in hosts])
+        yield ('tarnet_host_bytes_per_second', 'gauge', 'Bytes por segundo recebidos do host',
+               ('host_id',), [((host.host_id,), round(host.bytes_per_second) if active[host.host_id] else 0)
+                for host in hosts])
+        yield ('tarnet_frame_receive_delay_seconds', 'histogram',
+               'Tempo entre a captura no host e a chegada ao servidor (inclui diferença de relógio)',
+               ('host_id',), [((host.host_id,), host.receive_delay) for host in hosts])
+        yield ('tarnet_host_stage_seconds', 'histogram',
+               'Duração de cada estágio no host (captura, redimensionamento, codificação, envio, entrada)',
+               ('host_id', 'stage'),
+               [((host.host_id, stage), histogram)
+                for host in hosts for stage, histogram in host.stage_metrics.items()])
+        
+        yield ('tarnet_client_lag_frames', 'gauge',
+               'Frames entre o último recebido do host e o último exibido pelo cliente',
+               ('host_id', 'client_id'),
+               [((host.host_id, client.client_id), (host.last_sequence - client.last_rendered) & 0xFFFFFFFF)
+                for host, client in clients
+                if client.last_rendered is not None and host.last_sequence is not None])
+        yield ('tarnet_client_render_fps', 'gauge', 'Frames exibidos por segundo no navegador',
+               ('host_id', 'client_id'),
+               [((host.host_id, client.client_id), client.render_fps)
+                for host, client in clients if client.render_fps is not None])
+        yield ('tarnet_client_render_backlog', 'gauge',
+               'Frames recebidos pelo navegador e ainda não exibidos',
+               ('host_id', 'client_id'),
+               [((host.host_id, client.client_id), client.render_backlog)
+                for host, client in clients if client.render_backlog is not None])
+        yield ('tarnet_client_render_dropped_total', 'counter',
+               'Frames descartados pelo navegador por já haver um mais recente',
+               ('host_id', 'client_id'),
+               [((host.host_id, client.client_id), client.render_dropped) for host, client in clients])
+        yield ('tarnet_client_sent_frames_total', 'counter', 'Frames enviados ao cliente',
+               ('host_id', 'client_id'),
+               [((host.host_id, client.client_id), client.channel.sent_frames) for host, client in clients])
+        yield ('tarnet_client_dropped_frames_total', 'counter', 'Frames descartados na fila do cliente',
+               ('host_id', 'client_id'),
+               [((host.host_id, client.client_id), client.channel.dropped_frames) for host, client in clients])
+        yield ('tarnet_client_queue_depth', 'gauge', 'Mensagens pendentes na fila do cliente',
+               ('host_id', 'client_id'),
+               [((host.host_id, client.client_id), client.channel.queue_depth) for host, client in clients])
+        
+        cache = self.frame_cache.get_stats()
+        yield ('tarnet_frame_cache_bytes', 'gauge', 'Bytes no cache de keyframes',
+               (), [((), cache['cached_bytes'])])
+        yield ('tarnet_frame_cache_evictions_total', 'counter', 'Hosts removidos do cache por falta de espaço',
+               (), [((), cache['evictions'])])
+        
+        if self.egress:
+            rooms = [(host, self.egress.rooms.get(host.room.room_id)) for host in self.hosts.values()]
+            yield ('tarnet_egress_bytes_total', 'counter',
+                   'Bytes de frames liberados pelo escalonador de saída, por host',
+                   ('host_id',), [((host.host_id,), room.sent_bytes) for host, room in rooms if room])
+            yield ('tarnet_egress_waiting_clients', 'gauge',
+                   'Clientes com frames aguardando orçamento de banda, por host',
+                   ('host_id',), [((host.host_id,), len(room.channels)) for host, room in rooms if room])
+        
+        if self.recorder:
+            recorder = self.recorder.get_stats()
+            yield ('tarnet_recorded_frames_total', 'counter', 'Frames enfileirados para gravação',
+                   (), [((), recorder['recorded_frames'])])
+            yield ('tarnet_recording_dropped_frames_total', 'counter',
+                   'Frames não gravados por atraso do disco (até o próximo keyframe)',
+                   (), [((), recorder['recording_dropped_frames'])])
+            yield ('tarnet_recording_pending', 'gauge', 'Frames na fila da thread de gravação',
+                   (), [((), recorder['recording_pending'])])
+            yield ('tarnet_replays', 'gauge', 'Reproduções em andamento', (), [((), len(self.replays))])
+    
+    def process_http_request(self, path, request_headers):
+        """Responde requisições HTTP comuns na porta do WebSocket (ex.: /metrics)"""
+        path = path.split('?', 1)[0]
+        if path == '/metrics':
+            body = self.metrics.render().encode()
+            return HTTPStatus.OK, [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')], body
+        
+        if path == '/hosts':
+            # Snapshot do diretório, serializado uma vez por versão
+            etag, body = self.directory.http_snapshot()
+            headers = [('ETag', etag), ('Cache-Control', 'no-cache')]
+            if request_headers.get('If-None-Match') == etag:
+                return HTTPStatus.NOT_MODIFIED, headers, b''
+            return HTTPStatus.OK, headers + [('Content-Type', 'application/json')], body
+        
+        return None  # segue o handshake do WebSocket
+    
+    async def handle_subscribe_hosts(self, websocket, data):
+        """Inscreve um painel no diretório: snapshot agora, depois só deltas"""
+        thumbnails = bool(data.get('thumbnails'))
+        message = {
+            'type': 'hosts_snapshot',
+            'version': self.directory.version,
+            'hosts': self.directory.snapshot(),
+            'server_stats': dict(self.stats, **self.frame_cache.get_stats())
+        }
+        if thumbnails:
+            # Miniaturas novas também vão para os painéis já inscritos
+            await self.refresh_thumbnails()
+            message['thumbnails'] = dict(self.directory.thumbnails)
+        
+        self.directory.subscribe(websocket, thumbnails)
+        await self.send_message(websocket, message)
+    
+    async def refresh_thumbnails(self):
+        """Envia aos painéis as miniaturas que mudaram"""
+        changed = await self.directory.refresh_thumbnails(self.frame_cache)
+        subscribers = self.directory.thumbnail_subscribers()
+        if changed and subscribers:
+            websockets.broadcast(subscribers, json.dumps({
+                'type': 'host_thumbnails',
+                'thumbnails': changed
+            }))
+    
+    async def directory_loop(self):
+        """Publica as mudanças do diretório de hosts aos painéis inscritos"""
+        last_thumbnails = 0.0
+        while True:
+            await asyncio.sleep(self.directory_interval)
+            try:
+                now = time.time()
+                delta = self.directory.sync(now)
+                # broadcast não espera conexões lentas; quem perder um delta
+                # percebe pela versão e pede um novo snapshot
+                if delta and self.directory.subscribers:
+                    websockets.broadcast(list(self.directory.subscribers), json.dumps(delta))
+                
+                if (self.directory.thumbnail_subscribers()
+                        and now - last_thumbnails >= self.thumbnail_interval):
+                    last_thumbnails = now
+                    await self.refresh_thumbnails()
+            except Exception as e:
+                logger.error(f"Erro ao publicar o diretório de hosts: {e}")
+    
     async def handle_get_hosts(self, websocket, data):
         """Retorna lista de hosts disponíveis"""
         hosts_info = []
-        for host_id, host_data in self.hosts.items():
-            hosts_info.append({
-                'host_id': host_id,
-                'connected_at': host_data['info']['connected_at'],
-                'last_frame': host_data['info']['last_frame'],
-                'clients_connected': len(self.rooms.get(f"room_{host_id}", {}).get('clients', set()))
-            })
+        for host in self.hosts.values():
+            info = host.get_info()
+            info['clients'] = [
+                dict(client_id=client_id, **client.channel.get_stats())
+                for client_id, client in host.room.clients.items()
+            ]
+            hosts_info.append(info)
+        
+        # Miniaturas só quando pedidas (página de hosts), geradas sob demanda
+        if data.get('thumbnails'):
+            thumbnails = await asyncio.gather(*(
+                self.frame_cache.get_thumbnail(info['host_id']) for info in hosts_info
+            ))
+            for info, thumbnail in zip(hosts_info, thumbnails):
+                info['thumbnail'] = thumbnail
         
         await self.send_message(websocket, {
             'type': 'hosts_list',
             'hosts': hosts_info,
-            'server_stats': self.stats
+            'server_stats': dict(self.stats, **self.frame_cache.get_stats())
+        })
+    
+    async def handle_list_recordings(self, websocket, data):
+        """Lista as sessões gravadas disponíveis para reprodução"""
+        if self.recorder is None:
+            await self.send_error(websocket, "Gravação não habilitada no servidor")
+            return
+        
+        sessions = await asyncio.to_thread(self.recorder.sessions)
+        await self.send_message(websocket, {'type': 'recordings', 'sessions': sessions})
+    
+    async def handle_replay_start(self, websocket, data):
+        """Reproduz uma sessão gravada a partir de um instante, na velocidade pedida"""
+        path = self.recorder.session_path(data.get('session')) if self.recorder else None
+        if path is None:
+            await self.send_error(websocket, "Sessão gravada não encontrada")
+            return
+        
+        layer = data.get('layer', LAYER_FULL)
+        layer = parse_layer(layer) if isinstance(layer, str) else layer
+        position = data.get('start', 0.0)
+        speed = data.get('speed', 1.0)
+        if (not isinstance(layer, int) or not 0 <= layer < MAX_STREAMS
+                or not isinstance(position, (int, float)) or position < 0
+                or not isinstance(speed, (int, float)) or speed <= 0):
+            await self.send_error(websocket, "Parâmetros de reprodução inválidos")
+            return
+        
+        # Uma reprodução por conexão: a nova substitui a anterior
+        await self.stop_replay(websocket)
+        
+        reader = await asyncio.to_thread(SessionReader, path)
+        if layer not in reader.keyframes:
+            reader.close()
+            await self.send_error(websocket, f"Camada {layer} não gravada nesta sessão")
+            return
+        
+        await self.send_message(websocket, {
+            'type': 'replay_started',
+            'session': data['session'],
+            'layer': layer,
+            'start': position,
+            'speed': speed,
+            'duration': reader.duration,
+            'keyframes_only': speed >= self.scrub_speed
         })
+        self.replays[websocket] = asyncio.create_task(
+            self.replay_session(websocket, reader, data['session'], layer, position, speed)
+        )
+    
+    async def replay_session(self, websocket, reader, session, layer, position, speed):
+        """Envia os frames gravados respeitando os intervalos originais / speed"""
+        keyframes_only = speed >= self.scrub_speed
+        frames = reader.frames(layer, position, keyframes_only)
+        # O mmap é lido em lotes em uma thread própria da reprodução: a leitura
+        # pode bloquear em disco, e o fechamento entra na mesma fila, depois de
+        # um lote que ainda esteja sendo lido
+        io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="replay")
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            while True:
+                batch = await loop.run_in_executor(io, reader.read_batch, frames)
+                if not batch:
+                    break
+                for offset, message in batch:
+                    # Frames antes de position só reconstroem a imagem: vão sem espera
+                    delay = max(0.0, offset - position) / speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    # O envio aguarda a conexão, então um cliente lento atrasa a
+                    # reprodução em vez de perder deltas
+                    await websocket.send(message)
+            
+            await self.send_message(websocket, {'type': 'replay_ended', 'session': session})
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.error(f"Erro na reprodução: {e}")
+        finally:
+            io.submit(frames.close)
+            io.submit(reader.close)
+            io.shutdown(wait=False)
+            if self.replays.get(websocket) is asyncio.current_task():
+                del self.replays[websocket]
+    
+    async def stop_replay(self, websocket):
+        """Interrompe a reprodução em andamento na conexão, se houver"""
+        task = self.replays.pop(websocket, None)
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
     
     async def send_message(self, websocket, message):
-        """Envia mensagem via WebSocket"""
+        """Envia mensagem JSON via WebSocket"""
+        await self.send_raw(websocket, json.dumps(message))
+    
+    async def send_raw(self, websocket, payload):
+        """Envia mensagem já serializada (texto ou binária) via WebSocket"""
         try:
-            await websocket.send(json.dumps(message))
+            await websocket.send(payload)
             self.stats['messages_processed'] += 1
         except websockets.exceptions.ConnectionClosed:
-            logger.warning("Tentativa de envio para conexão fechada")
+            event_log.warning('send_closed', "Tentativa de envio para conexão fechada")
         except Exception as e:
-            logger.error(f"Erro ao enviar mensagem: {e}")
+            event_log.error('send_error', "Erro ao enviar mensagem", error=e)
     
     async def send_error(self, websocket, error_message):
         """Envia mensagem de erro"""
@@ -226,49 +1058,64 @@ class TARNetServer:
             'timestamp': datetime.now().isoformat()
         })
     
-    async def remove_host(self, host_id):
+    def _unindex_connection(self, entry):
+        """Remove o registro do índice websocket -> registros"""
+        entries = self.connections.get(entry.websocket)
+        if entries is None:
+            return
+        
+        if entry in entries:
+            entries.remove(entry)
+        if not entries:
+            del self.connections[entry.websocket]
+    
+    async def remove_host(self, host_id, from_cluster=False):
         """Remove host e limpa recursos relacionados"""
-        if host_id in self.hosts:
-            del self.hosts[host_id]
-            
-            # Remove a sala do host
-            room_id = f"room_{host_id}"
-            if room_id in self.rooms:
-                # Notifica clientes que o host desconectou
-                room = self.rooms[room_id]
-                disconnect_message = {
-                    'type': 'host_disconnected',
-                    'host_id': host_id,
-                    'message': 'Host desconectado'
-                }
-                
-                for client_id in room['clients'].copy():
-                    if client_id in self.clients:
-                        try:
-                            await self.send_message(
-                                self.clients[client_id]['websocket'],
-                                disconnect_message
-                            )
-                        except:
-                            pass
-                
-                del self.rooms[room_id]
-            
-            logger.info(f"Host removido: {host_id}")
+        host = self.hosts.pop(host_id, None)
+        if host is None:
+            return
+        
+        if not host.is_remote:
+            self._unindex_connection(host)
+            if host.expire_handle is not None:
+                host.expire_handle.cancel()
+                host.expire_handle = None
+            if self.recorder:
+                self.recorder.end_session(host_id)
+            if self.cluster and not from_cluster:
+                self.cluster.host_down(host_id)
+        
+        # Remove a sala do host e notifica os clientes que o host desconectou
+        room = host.room
+        disconnect_message = json.dumps({
+            'type': 'host_disconnected',
+            'host_id': host_id,
+            'message': 'Host desconectado'
+        })
+        
+        for client in room.clients.values():
+            client.channel.push_message(disconnect_message)
+        
+        self.rooms.pop(room.room_id, None)
+        self.frame_cache.remove(host_id)
+        if self.egress:
+            self.egress.remove_room(room.room_id)
+        
+        logger.info("Host removido", extra=fields(host_id=host_id))
     
     async def remove_client(self, client_id):
         """Remove cliente e limpa recursos relacionados"""
-        if client_id in self.clients:
-            client_data = self.clients[client_id]
-            target_host = client_data['connected_host']
-            
-            # Remove cliente da sala
-            room_id = f"room_{target_host}"
-            if room_id in self.rooms:
-                self.rooms[room_id]['clients'].discard(client_id)
-            
-            del self.clients[client_id]
-            logger.info(f"Cliente removido: {client_id}")
+        client = self.clients.pop(client_id, None)
+        if client is None:
+            return
+        
+        # Remove cliente da sala
+        client.room.remove_client(client)
+        self._unindex_connection(client)
+        await self.update_viewers(client.room)
+        
+        await client.channel.close()
+        logger.info("Cliente removido", extra=fields(client_id=client_id))
     
     async def handle_connection(self, websocket, path):
         """Manipula nova conexão WebSocket"""
@@ -278,6 +1125,15 @@ class TARNetServer:
         try:
             async for message in websocket:
                 try:
+                    # Frames de tela chegam como mensagens binárias
+                    if isinstance(message, bytes):
+                        # Mensagem curta: aviso de frames no anel (host local)
+                        if len(message) < HEADER_SIZE:
+                            await self.drain_ring(websocket, message)
+                        else:
+                            await self.handle_screen_frame(websocket, message)
+                        continue
+                    
                     data = json.loads(message)
                     message_type = data.get('type')
                     
@@ -288,22 +1144,46 @@ class TARNetServer:
                     elif message_type == 'register_client':
                         await self.register_client(websocket, data)
                     
-                    elif message_type == 'screen_frame':
-                        await self.handle_screen_frame(websocket, data)
-                    
                     elif message_type == 'control_command':
                         await self.handle_control_command(websocket, data)
                     
+                    elif message_type == 'control_batch':
+                        await self.handle_control_batch(websocket, data)
+                    
+                    elif message_type == 'set_layer':
+                        await self.handle_set_layer(websocket, data)
+                    
+                    elif message_type == 'set_view':
+                        await self.handle_set_view(websocket, data)
+                    
+                    elif message_type == 'host_metrics':
+                        await self.handle_host_metrics(websocket, data)
+                    
+                    elif message_type == 'frame_ack':
+                        await self.handle_frame_ack(websocket, data)
+                    
                     elif message_type == 'get_hosts':
                         await self.handle_get_hosts(websocket, data)
                     
+                    elif message_type == 'subscribe_hosts':
+                        await self.handle_subscribe_hosts(websocket, data)
+                    
+                    elif message_type == 'list_recordings':
+                        await self.handle_list_recordings(websocket, data)
+                    
+                    elif message_type == 'replay_start':
+                        await self.handle_replay_start(websocket, data)
+                    
+                    elif message_type == 'replay_stop':
+                        await self.stop_replay(websocket)
+                    
                     else:
                         await self.send_error(websocket, f"Tipo de mensagem desconhecido: {message_type}")
                 
                 except json.JSONDecodeError:
                     await self.send_error(websocket, "Formato JSON inválido")
                 except Exception as e:
-                    logger.error(f"Erro ao processar mensagem: {e}")
+                    event_log.error('message_error', "Erro ao processar mensagem", error=e)
                     await self.send_error(websocket, "Erro interno do servidor")
         
         except websockets.exceptions.ConnectionClosed:
@@ -317,38 +1197,194 @@ class TARNetServer:
     
     async def cleanup_connection(self, websocket):
         """Limpa recursos de uma conexão desconectada"""
-        # Procura e remove hosts
-        hosts_to_remove = []
-        for host_id, host_data in self.hosts.items():
-            if host_data['websocket'] == websocket:
-                hosts_to_remove.append(host_id)
+        # Só os registros desta conexão, sem varrer todos os hosts e clientes;
+        # ignora registros já substituídos por um novo registro com o mesmo ID
+        for entry in list(self.connections.get(websocket, ())):
+            if isinstance(entry, HostEntry):
+                if self.hosts.get(entry.host_id) is entry:
+                    await self.suspend_host(entry)
+            elif self.clients.get(entry.client_id) is entry:
+                await self.remove_client(entry.client_id)
+        self.connections.pop(websocket, None)
+        self.directory.unsubscribe(websocket)
+        await self.stop_replay(websocket)
+        self.local_connections.discard(websocket)
+        ring = self.rings.pop(websocket, None)
+        if ring is not None:
+            ring.close()
+    
+    async def handle_cluster_message(self, message):
+        """Aplica eventos de outros workers recebidos pelo hub"""
+        op = message['op']
+        host = self.hosts.get(message.get('host_id'))
         
-        for host_id in hosts_to_remove:
-            await self.remove_host(host_id)
+        if op == 'host_up':
+            if host is not None and message.get('resumed'):
+                # Retomado (neste ou em outro worker): a sala e os clientes daqui continuam
+                host.worker_id = message['worker']
+                if host.disconnected_at is not None:
+                    host.disconnected_at = None
+                    resumed = json.dumps({'type': 'host_resumed', 'host_id': host.host_id})
+                    for client in host.room.clients.values():
+                        client.channel.push_message(resumed)
+            else:
+                if host is not None:
+                    await self.remove_host(host.host_id, from_cluster=True)
+                host = HostEntry(message['host_id'], None, message['worker'], message['connected_at'])
+                self.hosts[host.host_id] = host
+                self.rooms[host.room.room_id] = host.room
+            host.mode = message.get('mode', 'both')
+            host.resume_token = message.get('resume_token')
         
-        # Procura e remove clientes
-        clients_to_remove = []
-        for client_id, client_data in self.clients.items():
-            if client_data['websocket'] == websocket:
-                clients_to_remove.append(client_id)
+        elif op == 'host_moved':
+            if host is not None and not host.is_remote:
+                await self.release_host(host, message['worker'])
         
-        for client_id in clients_to_remove:
-            await self.remove_client(client_id)
+        elif op == 'host_suspended':
+            if host is not None and host.is_remote:
+                host.disconnected_at = time.time()
+                reconnecting = json.dumps({
+                    'type': 'host_reconnecting',
+                    'host_id': host.host_id,
+                    'grace_period': message['grace_period']
+                })
+                for client in host.room.clients.values():
+                    client.channel.push_message(reconnecting)
+        
+        elif op == 'host_down':
+            await self.remove_host(message['host_id'], from_cluster=True)
+        
+        elif host is None:
+            return
+        
+        elif op == 'host_info':
+            host.total_viewers = message['viewers']
+            host.remote_viewers = message['remote_viewers']
+            host.remote_layers = message['remote_layers']
+            if host.is_remote:
+                host.last_frame = message['last_frame']
+            else:
+                await self.update_host_layers(host)
+        
+        elif op == 'command' and not host.is_remote:
+            await self.send_to_host(host, message['command'])
+        
+        elif op == 'feedback' and not host.is_remote:
+            host.room.remote_rendered[message['worker']] = message['last_rendered']
+            await self.send_viewer_feedback(host.room)
+    
+    def serve_options(self):
+        """Opções comuns do websockets.serve (TCP e socket Unix)"""
+        return {
+            'process_request': self.process_http_request,
+            'max_size': self.max_message_size,
+            'write_limit': self.write_limit,
+            'compression': None
+        }
+    
+    async def handle_local_connection(self, websocket, path):
+        """Conexão pelo socket Unix: pode registrar um anel de frames"""
+        self.local_connections.add(websocket)
+        await self.handle_connection(websocket, path)
     
-    async def start_server(self):
+    async def serve_local(self):
+        """Escuta no socket Unix local (o arquivo de uma execução anterior é removido)"""
+        if os.path.exists(self.local_socket):
+            os.unlink(self.local_socket)
+        server = await websockets.unix_serve(self.handle_local_connection, self.local_socket,
+                                             **self.serve_options())
+        logger.info(f"Hosts locais: socket Unix {self.local_socket}")
+        return server
+    
+    async def start_server(self, reuse_port=False):
         """Inicia o servidor WebSocket"""
         logger.info(f"Iniciando servidor TARNet em {self.host}:{self.port}")
         
-        async with websockets.serve(self.handle_connection, self.host, self.port):
+        # reuse_port permite que vários workers escutem a mesma porta (SO_REUSEPORT)
+        options = {'reuse_port': True} if reuse_port else {}
+        async with websockets.serve(self.handle_connection, self.host, self.port,
+                                    **self.serve_options(), **options):
             logger.info(f"Servidor TARNet rodando em ws://{self.host}:{self.port}")
             logger.info("Pressione Ctrl+C para parar o servidor")
             
-            # Mantém o servidor rodando
-            await asyncio.Future()  # Executa indefinidamente
+            local = await self.serve_local() if self.local_socket else None
+            
+            # Mantém o servidor rodando, publicando o diretório de hosts
+            try:
+                await self.directory_loop()
+            finally:
+                if local is not None:
+                    local.close()
+                    await local.wait_closed()
+                    if os.path.exists(self.local_socket):
+                        os.unlink(self.local_socket)
+                if self.recorder:
+                    self.recorder.close()
+
+def mbps_to_rate(mbps):
+    """Mbit/s para bytes/s (None ou 0: sem limite)"""
+    return mbps * 1_000_000 / 8 if mbps else None
+
+def host_value(text):
+    """Argumento HOST_ID=VALOR das opções por host"""
+    host_id, sep, value = text.partition('=')
+    try:
+        host_id_to_bytes(host_id)
+        number = float(value)
+    except ValueError:
+        number = None
+    if not sep or number is None or not 0 < number < float('inf'):
+        raise argparse.ArgumentTypeError(f"esperado HOST_ID=VALOR positivo: {text!r}")
+    return host_id, number
+
+def egress_limits(args):
+    """Converte os limites de banda da linha de comando (Mbit/s) para bytes/s"""
+    return {
+        'egress_rate': mbps_to_rate(args.egress_mbps),
+        'host_rate': mbps_to_rate(args.host_mbps),
+        'client_rate': mbps_to_rate(args.client_mbps),
+        'host_rates': {host_id: mbps_to_rate(mbps) for host_id, mbps in args.host_budget},
+        'host_weights': dict(args.host_weight)
+    }
 
 async def main():
     """Função principal"""
-    server = TARNetServer(host='0.0.0.0', port=8000)
+    parser = argparse.ArgumentParser(description="Servidor WebSocket do TARNet")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processos que compartilham a porta (SO_REUSEPORT)")
+    parser.add_argument('--egress-mbps', type=float,
+                        help="Banda de saída total do servidor (Mbit/s)")
+    parser.add_argument('--host-mbps', type=float,
+                        help="Banda de saída por host, somando seus clientes (Mbit/s)")
+    parser.add_argument('--client-mbps', type=float,
+                        help="Banda de saída por cliente (Mbit/s)")
+    parser.add_argument('--host-budget', type=host_value, action='append', default=[],
+                        metavar='HOST_ID=MBPS',
+                        help="Banda de saída de um host específico (substitui --host-mbps; repetível)")
+    parser.add_argument('--host-weight', type=host_value, action='append', default=[],
+                        metavar='HOST_ID=PESO',
+                        help="Peso de um host na divisão do uplink (padrão 1; repetível)")
+    parser.add_argument('--record', metavar='DIR',
+                        help="Grava as sessões neste diretório e habilita a reprodução")
+    parser.add_argument('--local-socket', metavar='PATH',
+                        help="Socket Unix para hosts na mesma máquina (frames por memória compartilhada)")
+    args = parser.parse_args()
+    
+    if args.workers > 1 and args.local_socket:
+        logger.warning("--local-socket não é suportado com --workers; hosts locais usam a porta TCP")
+    
+    if args.workers > 1:
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            logger.error("SO_REUSEPORT não suportado neste sistema; usando um único processo")
+        else:
+            await run_cluster(args.host, args.port, args.workers, args.record,
+                              egress_limits(args))
+            return
+    
+    server = TARNetServer(host=args.host, port=args.port, record_dir=args.record,
+                          local_socket=args.local_socket, **egress_limits(args))
     
     try:
         await server.start_server()
@@ -363,4 +1399,5 @@ if __name__ == "__main__":
     print("Ctrl+C para parar")
     print()
     
+    setup_logging()
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1 @@
+"""Recursos compartilhados entre os componentes do TARNet."""
@@ -0,0 +1,163 @@
+"""Logging do TARNet sem E/S no caminho quente.
+
+setup_logging() troca os handlers do logger raiz por um QueueHandler: quem
+loga só coloca o registro em uma fila limitada e uma thread (QueueListener)
+formata e escreve no console. Se a fila encher, registros são descartados e
+contados, em vez de travar o loop de eventos ou a thread de entrada.
+
+Campos estruturados vão em extra=fields(chave=valor) e saem como
+`chave=valor` no fim da linha, ou como objeto JSON com TARNET_LOG_FORMAT=json.
+O nível vem de TARNET_LOG_LEVEL (padrão INFO).
+
+Eventos que acontecem por comando de entrada ou por frame usam
+RateLimitedLog: no máximo um registro por chave a cada `interval` segundos
+(ou um a cada `sample` eventos), com a contagem dos suprimidos no campo
+`suppressed`.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None  # (pid, QueueListener) do processo atual
+
+
+def fields(**values):
+    """extra= de um registro com campos estruturados"""
+    return {'fields': values}
+
+
+def _format_value(value):
+    text = str(value)
+    if not text or any(c in text for c in ' "='):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+class FieldsFormatter(logging.Formatter):
+    """Texto do registro seguido dos campos como chave=valor"""
+
+    def format(self, record):
+        text = super().format(record)
+        values = getattr(record, 'fields', None)
+        if values:
+            text += ' ' + ' '.join(f"{key}={_format_value(value)}" for key, value in values.items())
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """Um objeto JSON por linha, com os campos no nível de cima"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        values = getattr(record, 'fields', None)
+        if values:
+            entry.update(values)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (e conta) registros quando a fila está cheia"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Sem formatar nem copiar aqui: a mensagem é montada na thread de escrita
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level=None, log_format=None, stream=None, max_pending=10000):
+    """Configura o logging do processo para escrever em uma thread separada.
+
+    Pode ser chamada de novo em um processo filho (fork): a thread do pai não
+    existe no filho, então uma nova fila e uma nova thread são criadas.
+    """
+    global _listener
+    if _listener is not None and _listener[0] == os.getpid():
+        return _listener[1]
+
+    level = level or os.environ.get('TARNET_LOG_LEVEL', 'INFO')
+    log_format = log_format or os.environ.get('TARNET_LOG_FORMAT', 'text')
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if log_format == 'json' else FieldsFormatter(FORMAT))
+
+    log_queue = queue.Queue(max_pending)
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    # Escreve o que ainda estiver na fila ao sair
+    atexit.register(listener.stop)
+    _listener = (os.getpid(), listener)
+    return listener
+
+
+class RateLimitedLog:
+    """Registros de eventos frequentes, limitados por chave"""
+
+    def __init__(self, logger, interval=1.0, sample=None):
+        self.logger = logger
+        self.interval = interval
+        self.sample = sample  # um registro a cada `sample` eventos (em vez do intervalo)
+        self._state = {}  # chave -> [instante do último registro, eventos suprimidos]
+
+    def log(self, level, key, msg, *args, **values):
+        if not self.logger.isEnabledFor(level):
+            return
+        state = self._state.get(key)
+        if state is None:
+            state = self._state[key] = [None, 0]
+        elif self.sample:
+            if state[1] + 1 < self.sample:
+                state[1] += 1
+                return
+        else:
+            now = time.monotonic()
+            if now - state[0] < self.interval:
+                state[1] += 1
+                return
+
+        if state[1]:
+            values['suppressed'] = state[1]
+        state[0] = time.monotonic()
+        state[1] = 0
+        self.logger.log(level, msg, *args, extra={'fields': values})
+
+    def debug(self, key, msg, *args, **values):
+        self.log(logging.DEBUG, key, msg, *args, **values)
+
+    def info(self, key, msg, *args, **values):
+        self.log(logging.INFO, key, msg, *args, **values)
+
+    def warning(self, key, msg, *args, **values):
+        self.log(logging.WARNING, key, msg, *args, **values)
+
+    def error(self, key, msg, *args, **values):
+        self.log(logging.ERROR, key, msg, *args, **values)
@@ -0,0 +1,183 @@
+"""Métricas do TARNet: contadores e histogramas expostos no formato de texto
+do Prometheus.
+
+No caminho quente só há incrementos de inteiros e a busca do bucket do
+histograma; o texto só é montado quando alguém lê o endpoint de métricas.
+Valores que já existem em outros objetos (filas, contadores dos registros)
+são lidos por coletores na hora da leitura, sem custo por frame.
+"""
+import bisect
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Buckets de latência, em segundos
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# (valores dos rótulos, valor ou Histogram)
+Sample = Tuple[Tuple[str, ...], object]
+# (nome, tipo, ajuda, nomes dos rótulos, amostras)
+Collected = Tuple[str, str, str, Sequence[str], Iterable[Sample]]
+
+
+def is_count(value) -> bool:
+    """Inteiro não negativo (bool não conta)"""
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+class Counter:
+    """Contador monotônico"""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    """Histograma com buckets fixos (contagens não cumulativas internamente)"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # o último é +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        """Estado serializável em JSON (para enviar a outro processo)"""
+        return {
+            'bounds': list(self.bounds),
+            'counts': list(self.counts),
+            'sum': self.sum,
+            'count': self.count
+        }
+
+    def accepts(self, snapshot) -> bool:
+        """True se o snapshot tem os mesmos buckets e contagens e soma não negativas"""
+        if not isinstance(snapshot, dict) or not isinstance(snapshot.get('bounds'), list):
+            return False
+        counts = snapshot.get('counts')
+        if (tuple(snapshot['bounds']) != self.bounds
+                or not isinstance(counts, list) or len(counts) != len(self.counts)):
+            return False
+        total = snapshot.get('sum', 0.0)
+        return (all(is_count(count) for count in counts)
+                and is_count(snapshot.get('count', 0))
+                and isinstance(total, (int, float)) and not isinstance(total, bool)
+                and math.isfinite(total) and total >= 0)
+
+    def merge(self, snapshot: dict) -> bool:
+        """Soma um snapshot com os mesmos buckets; retorna False (sem alterar
+        nada) se for incompatível ou inválido"""
+        if not self.accepts(snapshot):
+            return False
+        for i, count in enumerate(snapshot['counts']):
+            self.counts[i] += count
+        self.sum += snapshot.get('sum', 0.0)
+        self.count += snapshot.get('count', 0)
+        return True
+
+    @classmethod
+    def from_snapshot(cls, snapshot) -> Optional['Histogram']:
+        bounds = snapshot.get('bounds') if isinstance(snapshot, dict) else None
+        if not isinstance(bounds, list) or not all(isinstance(bound, (int, float)) for bound in bounds):
+            return None
+        histogram = cls(bounds)
+        return histogram if histogram.merge(snapshot) else None
+
+
+class MetricFamily:
+    """Métrica com rótulos; cada combinação de valores tem seu próprio objeto"""
+
+    __slots__ = ('name', 'kind', 'help', 'labelnames', 'children', '_factory')
+
+    def __init__(self, name, kind, help, labelnames, factory):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self._factory = factory
+
+    def labels(self, *values):
+        """Retorna o contador/histograma dos valores de rótulo (guarde a referência)"""
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._factory()
+        return child
+
+    def remove(self, *values):
+        self.children.pop(values, None)
+
+
+class MetricsRegistry:
+    """Conjunto de métricas de um processo"""
+
+    def __init__(self):
+        self._families: List[MetricFamily] = []
+        self._collectors: List[Callable[[], Iterable[Collected]]] = []
+
+    def counter(self, name, help, labelnames=()) -> MetricFamily:
+        family = MetricFamily(name, 'counter', help, labelnames, Counter)
+        self._families.append(family)
+        return family
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> MetricFamily:
+        family = MetricFamily(name, 'histogram', help, labelnames, lambda: Histogram(buckets))
+        self._families.append(family)
+        return family
+
+    def collector(self, collect: Callable[[], Iterable[Collected]]):
+        """Registra uma função chamada só na leitura das métricas"""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        """Texto no formato de exposição do Prometheus"""
+        lines = []
+        for family in self._families:
+            _render(lines, family.name, family.kind, family.help,
+                    family.labelnames, family.children.items())
+        for collect in self._collectors:
+            for name, kind, help, labelnames, samples in collect():
+                _render(lines, name, kind, help, labelnames, samples)
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra='') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _render(lines, name, kind, help, labelnames, samples):
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} {kind}')
+    for values, metric in samples:
+        if isinstance(metric, Histogram):
+            cumulative = 0
+            for bound, count in zip(metric.bounds, metric.counts):
+                cumulative += count
+                bucket = _labels(labelnames, values, 'le="%s"' % bound)
+                lines.append(f'{name}_bucket{bucket} {cumulative}')
+            bucket = _labels(labelnames, values, 'le="+Inf"')
+            lines.append(f'{name}_bucket{bucket} {metric.count}')
+            lines.append(f'{name}_sum{_labels(labelnames, values)} {metric.sum}')
+            lines.append(f'{name}_count{_labels(labelnames, values)} {metric.count}')
+        else:
+            value = metric.value if isinstance(metric, Counter) else metric
+            lines.append(f'{name}{_labels(labelnames, values)} {value}')
@@ -0,0 +1,223 @@
+"""Formato binário dos frames de tela do TARNet.
+
+Frames trafegam como mensagens binárias do WebSocket: um cabeçalho fixo
+seguido dos bytes da imagem já codificada (JPEG ou vídeo). O servidor só lê o
+cabeçalho para rotear e repassa a mensagem inteira aos clientes, sem
+decodificar nem reserializar o conteúdo.
+
+Frames de tiles (MSG_TILE_FRAME) carregam apenas as regiões alteradas desde
+o frame anterior: largura/altura do frame, quantidade de tiles e, para cada
+tile, sua posição, tamanho e JPEG.
+
+Frames de vídeo (MSG_VIDEO_FRAME) carregam a saída de um codec com predição
+entre frames (H.264 em Annex B ou VP8), precedida do codec e da resolução.
+Só frames com FLAG_KEYFRAME podem iniciar a decodificação.
+
+Cada host pode transmitir várias camadas (simulcast) da mesma captura em
+resoluções diferentes; o byte de camada do cabeçalho identifica a camada e
+o servidor entrega a cada cliente só a camada que ele assinou.
+
+Valores a partir de VIEW_BASE no mesmo byte identificam visões: um monitor
+ou um retângulo dele, capturado e codificado na resolução nativa. O servidor
+atribui o ID de cada visão assinada na sala e o informa ao host em set_layers.
+"""
+import struct
+import uuid
+from typing import List, NamedTuple, Optional, Tuple
+
+MAGIC = b'TN'
+VERSION = 1
+
+# Tipos de mensagem binária
+MSG_SCREEN_FRAME = 1  # frame completo (JPEG único)
+MSG_TILE_FRAME = 2    # apenas os tiles alterados
+MSG_VIDEO_FRAME = 3   # frame de codec de vídeo (H.264/VP8)
+
+FRAME_TYPES = (MSG_SCREEN_FRAME, MSG_TILE_FRAME, MSG_VIDEO_FRAME)
+
+# Flags
+FLAG_KEYFRAME = 0x01  # frame completo que não depende dos anteriores
+
+# Camadas de simulcast; o índice é o valor no cabeçalho
+LAYERS = ('full', 'half', 'thumb')
+LAYER_FULL = 0
+LAYER_THUMB = 2
+
+# IDs de visão (monitor/região) no byte de camada: VIEW_BASE até MAX_STREAMS - 1
+VIEW_BASE = len(LAYERS)
+MAX_STREAMS = 64
+
+# Modos do host: transmite a tela e aceita entrada, só transmite
+# (quiosques sem controle remoto) ou só aceita entrada
+HOST_MODES = ('both', 'stream', 'input')
+
+# magic, versão, tipo, flags, camada, host_id (UUID), sequência, timestamp
+HEADER = struct.Struct('!2sBBBB16sId')
+HEADER_SIZE = HEADER.size
+
+# Payload de MSG_TILE_FRAME: largura, altura, quantidade de tiles
+TILE_FRAME_HEADER = struct.Struct('!HHH')
+# Cada tile: x, y, largura, altura, tamanho do JPEG
+TILE_HEADER = struct.Struct('!HHHHI')
+
+# Payload de MSG_VIDEO_FRAME: codec (índice em VIDEO_CODECS), largura, altura
+VIDEO_HEADER = struct.Struct('!BHH')
+VIDEO_CODECS = ('', 'h264', 'vp8')
+
+Tile = Tuple[int, int, int, int, bytes]
+
+
+class FrameHeader(NamedTuple):
+    msg_type: int
+    flags: int
+    layer: int
+    host_id: bytes
+    sequence: int
+    timestamp: float
+
+
+def host_id_to_bytes(host_id: str) -> bytes:
+    """Converte o ID textual (UUID) do host para os 16 bytes do cabeçalho"""
+    return uuid.UUID(host_id).bytes
+
+
+def host_id_from_bytes(data: bytes) -> str:
+    """Converte os 16 bytes do cabeçalho de volta para o ID textual"""
+    return str(uuid.UUID(bytes=bytes(data)))
+
+
+def parse_layer(value) -> Optional[int]:
+    """Converte o nome ou índice de uma camada; retorna None se for inválido"""
+    if value in LAYERS:
+        return LAYERS.index(value)
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value < len(LAYERS):
+        return value
+    return None
+
+
+def parse_monitors(value) -> Optional[List[dict]]:
+    """Valida a lista de monitores do registro do host; None se algum for inválido.
+
+    left/top podem ser negativos (monitor à esquerda ou acima do principal no
+    mss); width/height precisam ser positivos. A lista inteira é recusada em
+    vez de pular entradas, porque as visões usam a posição do monitor.
+    """
+    if not isinstance(value, list):
+        return None
+    monitors = []
+    for monitor in value:
+        if not isinstance(monitor, dict):
+            return None
+        rect = {key: monitor.get(key, 0) for key in ('left', 'top')}
+        rect['width'], rect['height'] = monitor.get('width'), monitor.get('height')
+        if not all(isinstance(v, int) and not isinstance(v, bool) for v in rect.values()):
+            return None
+        if rect['width'] <= 0 or rect['height'] <= 0:
+            return None
+        monitors.append(rect)
+    return monitors
+
+
+def parse_view(value, monitors) -> Optional[Tuple[int, Optional[Tuple[int, int, int, int]]]]:
+    """Valida um pedido de visão {monitor, region} contra os monitores do host.
+
+    O monitor é 1-based (como no mss) e a região [x, y, w, h] está em pixels
+    nativos do monitor; é recortada aos limites dele. Retorna (monitor,
+    região ou None) ou None se for inválido.
+    """
+    if not isinstance(value, dict):
+        return None
+    monitor = value.get('monitor', 1)
+    if not isinstance(monitor, int) or not 1 <= monitor <= len(monitors):
+        return None
+
+    region = value.get('region')
+    if region is None:
+        return monitor, None
+    if (not isinstance(region, (list, tuple)) or len(region) != 4
+            or not all(isinstance(v, int) for v in region)):
+        return None
+
+    width, height = monitors[monitor - 1]['width'], monitors[monitor - 1]['height']
+    x, y, w, h = region
+    left, top = max(0, x), max(0, y)
+    right, bottom = min(width, x + w), min(height, y + h)
+    if right - left < 2 or bottom - top < 2:
+        return None
+    if (left, top, right, bottom) == (0, 0, width, height):
+        return monitor, None
+    return monitor, (left, top, right - left, bottom - top)
+
+
+def pack_frame(msg_type: int, host_id: bytes, sequence: int, timestamp: float,
+               payload: bytes, flags: int = 0, layer: int = LAYER_FULL) -> bytes:
+    """Monta uma mensagem binária (cabeçalho + payload)"""
+    header = HEADER.pack(MAGIC, VERSION, msg_type, flags, layer, host_id,
+                         sequence & 0xFFFFFFFF, timestamp)
+    return header + payload
+
+
+def unpack_header(message: bytes) -> Optional[FrameHeader]:
+    """Lê o cabeçalho de uma mensagem binária; retorna None se for inválido"""
+    if len(message) < HEADER_SIZE:
+        return None
+
+    magic, version, msg_type, flags, layer, host_id, sequence, timestamp = HEADER.unpack_from(message)
+    if magic != MAGIC or version != VERSION:
+        return None
+
+    return FrameHeader(msg_type, flags, layer, host_id, sequence, timestamp)
+
+
+def is_keyframe(message: bytes) -> bool:
+    """Lê só o byte de flags de uma mensagem já validada (caminho quente do relay)"""
+    return bool(message[4] & FLAG_KEYFRAME)
+
+
+def coalesce_moves(commands: List[dict]) -> List[dict]:
+    """Funde movimentos de mouse consecutivos, mantendo só o último.
+
+    Cliques, teclas e demais comandos continuam na mesma posição em relação
+    aos movimentos.
+    """
+    result = []
+    for command in commands:
+        if (command.get('type') == 'mouse_move' and result
+                and result[-1].get('type') == 'mouse_move'):
+            result[-1] = command
+        else:
+            result.append(command)
+    return result
+
+
+def pack_tiles(width: int, height: int, tiles: List[Tile]) -> bytes:
+    """Monta o payload de MSG_TILE_FRAME a partir de (x, y, w, h, jpeg)"""
+    parts = [TILE_FRAME_HEADER.pack(width, height, len(tiles))]
+    for x, y, w, h, data in tiles:
+        parts.append(TILE_HEADER.pack(x, y, w, h, len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def unpack_tiles(payload: bytes) -> Tuple[int, int, List[Tile]]:
+    """Lê o payload de MSG_TILE_FRAME"""
+    width, height, count = TILE_FRAME_HEADER.unpack_from(payload)
+    offset = TILE_FRAME_HEADER.size
+    tiles = []
+    for _ in range(count):
+        x, y, w, h, size = TILE_HEADER.unpack_from(payload, offset)
+        offset += TILE_HEADER.size
+        tiles.append((x, y, w, h, bytes(payload[offset:offset + size])))
+        offset += size
+    return width, height, tiles
+
+
+def pack_video(codec: int, width: int, height: int, data: bytes) -> bytes:
+    """Monta o payload de MSG_VIDEO_FRAME"""
+    return VIDEO_HEADER.pack(codec, width, height) + data
+
+
+def unpack_video(payload: bytes) -> Tuple[int, int, int, bytes]:
+    """Lê o payload de MSG_VIDEO_FRAME: (codec, largura, altura, dados)"""
+    codec, width, height = VIDEO_HEADER.unpack_from(payload)
+    return codec, width, height, bytes(payload[VIDEO_HEADER.size:])
@@ -0,0 +1,161 @@
+"""Anel de frames em memória compartilhada (host e servidor na mesma máquina).
+
+Transporte local opcional: o host grava os frames codificados direto em um
+anel de memória compartilhada e avisa o servidor por uma mensagem binária
+curta (DOORBELL, com a posição de escrita) na conexão de controle, um
+WebSocket sobre socket Unix. O servidor lê do anel só até a posição
+anunciada, então um frame grande demais para o anel, enviado pelo próprio
+WebSocket logo depois de um aviso, continua na ordem em que foi gerado. Cada frame é copiado uma vez
+para o anel e uma vez para fora dele, sem enquadramento nem máscara do
+WebSocket e sem passar pela pilha TCP.
+
+Um único produtor (host) e um único consumidor (servidor). Layout:
+
+    [posição de escrita u64][posição de leitura u64] ... até DATA_OFFSET
+    [registros: tamanho u32 + mensagem (cabeçalho HEADER + payload), alinhados a 8]
+
+As posições são contadores de bytes que só crescem; o offset no anel é a
+posição módulo a capacidade. Só o host escreve a posição de escrita (depois
+dos dados) e só o servidor escreve a de leitura. Um registro que não cabe no
+fim do anel é precedido de WRAP e recomeça no início.
+"""
+import struct
+from multiprocessing import shared_memory
+from typing import Optional
+
+from shared.protocol import HEADER, HEADER_SIZE, MAGIC, VERSION
+
+POSITIONS = struct.Struct('=QQ')  # escrita, leitura
+POSITION = struct.Struct('=Q')
+# Aviso de frames novos no anel: a posição de escrita (menor que um cabeçalho)
+DOORBELL = POSITION
+DATA_OFFSET = 64
+LENGTH = struct.Struct('=I')
+WRAP = 0xFFFFFFFF
+ALIGN = 8
+
+DEFAULT_SIZE = 32 * 1024 * 1024
+
+
+def _aligned(size):
+    return (size + ALIGN - 1) & ~(ALIGN - 1)
+
+
+class FrameRing:
+    """Anel SPSC de mensagens de frame sobre SharedMemory"""
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner  # quem criou também remove (unlink) ao fechar
+        self.buf = shm.buf
+        self.capacity = (shm.size - DATA_OFFSET) & ~(ALIGN - 1)
+        # Registros maiores que isso vão pelo WebSocket
+        self.max_message = self.capacity // 2 - LENGTH.size
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @classmethod
+    def create(cls, size=DEFAULT_SIZE):
+        shm = shared_memory.SharedMemory(create=True, size=DATA_OFFSET + size)
+        POSITIONS.pack_into(shm.buf, 0, 0, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13: o resource_tracker removeria o segmento do host
+            # quando este processo terminasse
+            shm = shared_memory.SharedMemory(name=name)
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, owner=False)
+
+    def _positions(self):
+        return POSITIONS.unpack_from(self.buf, 0)
+
+    def pending(self):
+        """Bytes gravados e ainda não lidos"""
+        write, read = self._positions()
+        return write - read
+
+    def write_frame(self, msg_type, host_id, sequence, timestamp, payload,
+                    flags=0, layer=0) -> Optional[bool]:
+        """Grava um frame (cabeçalho montado direto no anel).
+
+        Retorna True se gravou, False se o anel está cheio agora e None se a
+        mensagem é grande demais para o anel.
+        """
+        size = HEADER_SIZE + len(payload)
+        if size > self.max_message:
+            return None
+        record = _aligned(LENGTH.size + size)
+
+        write, read = self._positions()
+        offset = write % self.capacity
+        contiguous = self.capacity - offset
+        skip = contiguous if record > contiguous else 0
+        if write + skip + record - read > self.capacity:
+            return False
+
+        buf = self.buf
+        if skip:
+            LENGTH.pack_into(buf, DATA_OFFSET + offset, WRAP)
+            write += skip
+            offset = 0
+
+        start = DATA_OFFSET + offset
+        LENGTH.pack_into(buf, start, size)
+        HEADER.pack_into(buf, start + LENGTH.size, MAGIC, VERSION, msg_type, flags, layer,
+                         host_id, sequence & 0xFFFFFFFF, timestamp)
+        data = start + LENGTH.size + HEADER_SIZE
+        buf[data:data + len(payload)] = payload
+
+        # A posição só avança depois dos dados
+        POSITION.pack_into(buf, 0, write + record)
+        return True
+
+    def doorbell(self) -> bytes:
+        """Mensagem de aviso com a posição de escrita atual"""
+        return DOORBELL.pack(self._positions()[0])
+
+    def read(self, until=None) -> Optional[bytes]:
+        """Próxima mensagem antes de until (copiada para bytes), ou None"""
+        write, read = self._positions()
+        if until is not None:
+            write = min(write, until)
+        if read >= write:
+            return None
+
+        buf = self.buf
+        offset = read % self.capacity
+        (size,) = LENGTH.unpack_from(buf, DATA_OFFSET + offset)
+        if size == WRAP:
+            read += self.capacity - offset
+            offset = 0
+            (size,) = LENGTH.unpack_from(buf, DATA_OFFSET)
+
+        start = DATA_OFFSET + offset + LENGTH.size
+        message = bytes(buf[start:start + size])
+        POSITION.pack_into(buf, 8, read + _aligned(LENGTH.size + size))
+        return message
+
+    def reset(self):
+        """Descarta o que não foi lido (consumidor novo após reconexão)"""
+        write, _ = self._positions()
+        POSITION.pack_into(self.buf, 8, write)
+
+    def close(self):
+        self.buf = None
+        try:
+            self.shm.close()
+        except BufferError:
+            return
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
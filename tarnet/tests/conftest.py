@@ -0,0 +1,14 @@
+"""Caminhos de importação dos testes.
+
+Os módulos do servidor e do host importam os vizinhos diretamente (como
+quando rodam com "python server.py"), e o pacote compartilhado a partir da
+raiz do tarnet.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for path in (ROOT, os.path.join(ROOT, 'server'), os.path.join(ROOT, 'host')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
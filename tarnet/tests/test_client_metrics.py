@@ -0,0 +1,57 @@
+import uuid
+
+import pytest
+
+from client import app as client_app
+
+HOST_ID = str(uuid.uuid4())
+BOUNDS = list(client_app.stage_template.bounds)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(client_app, 'known_host_ids', lambda: {HOST_ID})
+    client_app.client_stage_seconds.children.clear()
+    client_app.client_frames_rendered.children.clear()
+    return client_app.app.test_client()
+
+
+def histogram(counts=None, total=0.5, count=None):
+    counts = counts if counts is not None else [1] + [0] * len(BOUNDS)
+    return {'bounds': BOUNDS, 'counts': counts, 'sum': total,
+            'count': sum(counts) if count is None else count}
+
+
+def test_valid_report_is_merged(client):
+    response = client.post('/api/metrics', json={
+        'host_id': HOST_ID, 'frames_rendered': 3, 'stages': {'decode': histogram()}
+    })
+    assert response.status_code == 204
+    assert client_app.client_frames_rendered.labels(HOST_ID).value == 3
+    assert client_app.client_stage_seconds.labels(HOST_ID, 'decode').count == 1
+
+
+@pytest.mark.parametrize('report', [
+    {'host_id': str(uuid.uuid4())},                              # fora do diretório
+    {'host_id': 'x'},
+    {'host_id': HOST_ID, 'frames_rendered': 'muitos'},
+    {'host_id': HOST_ID, 'frames_rendered': -5},
+    {'host_id': HOST_ID, 'stages': {'outro': histogram()}},
+    {'host_id': HOST_ID, 'stages': {'decode': histogram(counts=[1, 2])}},
+    {'host_id': HOST_ID, 'stages': {'decode': histogram(counts=[-1] + [0] * len(BOUNDS))}},
+    {'host_id': HOST_ID, 'stages': {'decode': histogram(total='x')}},
+])
+def test_bad_reports_are_rejected(client, report):
+    assert client.post('/api/metrics', json=report).status_code == 400
+    assert not client_app.client_frames_rendered.children
+    assert not client_app.client_stage_seconds.children
+
+
+def test_bad_stage_leaves_other_stages_untouched(client):
+    response = client.post('/api/metrics', json={
+        'host_id': HOST_ID, 'frames_rendered': 1,
+        'stages': {'decode': histogram(), 'paint': histogram(count=-1)}
+    })
+    assert response.status_code == 400
+    assert not client_app.client_stage_seconds.children
+    assert not client_app.client_frames_rendered.children
@@ -0,0 +1,49 @@
+from cluster import ClusterHub
+
+
+class RecordingHub(ClusterHub):
+    """Hub sem socket: guarda as mensagens para cada worker"""
+
+    def __init__(self, workers):
+        super().__init__('/dev/null')
+        self.sent = {worker_id: [] for worker_id in workers}
+
+    def send(self, worker_id, message):
+        self.sent[worker_id].append(message)
+
+    def broadcast(self, message, exclude=None):
+        for worker_id, messages in self.sent.items():
+            if worker_id != exclude:
+                messages.append(message)
+
+
+def host_up(hub, worker_id, mode, resumed=False):
+    hub.handle_control(worker_id, {'op': 'host_up', 'host_id': 'h1', 'connected_at': 1.0,
+                                   'mode': mode, 'resume_token': 't', 'resumed': resumed})
+
+
+def announced(messages):
+    return [message for message in messages if message['op'] == 'host_up']
+
+
+def test_mode_reaches_other_workers_and_late_snapshot():
+    hub = RecordingHub([1, 2, 3])
+    host_up(hub, 1, 'stream')
+
+    assert announced(hub.sent[1]) == []
+    assert announced(hub.sent[2])[0]['mode'] == 'stream'
+
+    hub.sent[3].clear()
+    hub.send_snapshot(3)
+    assert announced(hub.sent[3])[0]['mode'] == 'stream'
+
+
+def test_resume_with_new_mode_is_announced_again():
+    hub = RecordingHub([1, 2])
+    host_up(hub, 1, 'stream')
+    host_up(hub, 2, 'both', resumed=True)
+
+    assert {'op': 'host_moved', 'host_id': 'h1', 'worker': 2} in hub.sent[1]
+    latest = announced(hub.sent[1])[-1]
+    assert latest['mode'] == 'both' and latest['resumed'] and latest['worker'] == 2
+    assert hub.hosts['h1']['mode'] == 'both'
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import uuid
+
+from registry import HostEntry
+from server import TARNetServer
+from shared.protocol import coalesce_moves
+
+
+def move(x):
+    return {'type': 'mouse_move', 'x': x, 'y': x}
+
+
+def test_coalesce_keeps_last_of_consecutive_moves():
+    click = {'type': 'mouse_click', 'x': 3, 'y': 3, 'button': 'left'}
+    key = {'type': 'key_press', 'key': 'a'}
+
+    assert coalesce_moves([move(1), move(2), click, move(4), move(5), key, move(6)]) == [
+        move(2), click, move(5), key, move(6)
+    ]
+    assert coalesce_moves([]) == []
+    assert coalesce_moves([click, key]) == [click, key]
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, payload):
+        self.sent.append(json.loads(payload))
+
+
+def control_batch(commands):
+    server = TARNetServer()
+    websocket = RecordingSocket()
+    asyncio.run(server.handle_control_batch(websocket, {
+        'client_id': 'cliente', 'target_host': 'host', 'commands': commands
+    }))
+    return [message['message'] for message in websocket.sent]
+
+
+def test_batch_rejects_entries_that_are_not_commands():
+    assert control_batch([move(1), 'mouse_move']) == [
+        "Comando 1 do lote inválido: esperado objeto com 'type'"
+    ]
+    assert control_batch([{'x': 1}]) == ["Comando 0 do lote inválido: esperado objeto com 'type'"]
+    assert control_batch({'type': 'mouse_move'}) == ["Dados do lote de comandos incompletos"]
+
+
+def test_valid_batch_reaches_client_validation():
+    assert control_batch([move(1), move(2)]) == ["Cliente não registrado"]
+
+
+def control_command(mode, command):
+    server = TARNetServer()
+    client, host = RecordingSocket(), RecordingSocket()
+    entry = HostEntry(str(uuid.uuid4()), host)
+    entry.mode = mode
+    server.hosts[entry.host_id] = entry
+    server.clients['cliente'] = object()
+    asyncio.run(server.handle_control_command(client, {
+        'client_id': 'cliente', 'target_host': entry.host_id, 'command': command
+    }))
+    return [message['message'] for message in client.sent], host.sent
+
+
+def test_stream_host_refuses_input_but_accepts_keyframe_requests():
+    errors, received = control_command('stream', move(1))
+    assert errors == ["Host em modo somente visualização"] and received == []
+
+    keyframe = {'type': 'request_keyframe', 'layer': 0}
+    assert control_command('stream', keyframe) == ([], [keyframe])
+    assert control_command('both', move(1)) == ([], [move(1)])
+
+
+def test_command_must_be_an_object_with_type():
+    for command in ('x', ['mouse_move'], {'x': 1}):
+        assert control_command('both', command) == (
+            ["Comando inválido: esperado objeto com 'type'"], []
+        )
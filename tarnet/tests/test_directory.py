@@ -0,0 +1,58 @@
+import uuid
+
+from directory import HostDirectory
+from registry import HostEntry
+
+
+def add_host(hosts, connected_at=1000.0):
+    host = HostEntry(str(uuid.uuid4()), websocket=object(), connected_at=connected_at)
+    hosts[host.host_id] = host
+    return host
+
+
+def test_sync_publishes_only_differences():
+    hosts = {}
+    directory = HostDirectory(hosts, online_after=30.0, frame_resolution=10.0)
+    assert directory.sync(now=1000.0) is None
+
+    host = add_host(hosts)
+    delta = directory.sync(now=1000.0)
+    assert delta['version'] == 1
+    assert [info['host_id'] for info in delta['added']] == [host.host_id]
+    assert delta['changed'] == [] and delta['removed'] == []
+    assert directory.sync(now=1001.0) is None
+
+    # Primeiro frame: fica online
+    host.last_frame = 1001.0
+    delta = directory.sync(now=1001.0)
+    assert delta['version'] == 2 and delta['changed'][0]['online']
+
+    # Frames seguintes dentro da resolução não geram delta
+    host.last_frame = 1005.0
+    assert directory.sync(now=1005.0) is None
+    host.last_frame = 1012.0
+    assert directory.sync(now=1012.0)['version'] == 3
+
+    del hosts[host.host_id]
+    assert directory.sync(now=1013.0)['removed'] == [host.host_id]
+
+
+def test_http_snapshot_etag_follows_content():
+    hosts = {}
+    directory = HostDirectory(hosts)
+    add_host(hosts)
+    directory.sync(now=1000.0)
+
+    etag, body = directory.http_snapshot()
+    assert directory.http_snapshot() == (etag, body)
+    assert directory.http_snapshot()[1] is body  # serializado uma vez por versão
+
+    # Mesmo conteúdo em outra versão (outro worker): mesmo ETag
+    other = HostDirectory(hosts)
+    other.version = 7
+    other.sync(now=1000.0)
+    assert other.http_snapshot()[0] == etag
+
+    add_host(hosts)
+    directory.sync(now=1000.0)
+    assert directory.http_snapshot()[0] != etag
@@ -0,0 +1,135 @@
+import asyncio
+from collections import deque
+
+from egress import EgressScheduler, RoomQueue, TokenBucket
+
+
+class FakeChannel:
+    """Só o que o escalonador usa de um ClientChannel"""
+
+    def __init__(self, room_id, sizes=(), bucket=None):
+        self.room_id = room_id
+        self.frames = deque((0.0, bytes(size)) for size in sizes)
+        self.closed = False
+        self.scheduled = False
+        self.granted = None
+        self.bucket = bucket
+
+    def grant(self):
+        self.granted = self.frames.popleft()
+        return self.granted
+
+
+def test_token_bucket_delay_and_debt():
+    bucket = TokenBucket(rate=1000, burst=500)
+    bucket.updated = 0.0
+
+    assert bucket.delay(500, 0.0) == 0.0
+    bucket.consume(500, 0.0)
+    assert bucket.delay(100, 0.0) == 0.1
+    assert bucket.delay(100, 0.1) == 0.0
+
+    # Frame maior que a rajada passa com o balde cheio e deixa dívida
+    bucket.consume(100, 0.1)
+    assert bucket.delay(2000, 1.0) == 0.0
+    bucket.consume(2000, 1.0)
+    assert bucket.tokens == -1500
+    assert bucket.delay(500, 1.0) == 2.0
+
+
+def grant_order(scheduler, count):
+    order = []
+    for _ in range(count):
+        selected, wait = scheduler._select(0.0)
+        assert wait is None
+        room, channel, size = selected
+        order.append(room.room_id)
+        channel.grant()
+        channel.granted = None
+    return order
+
+
+def test_scfq_serves_rooms_by_weight():
+    scheduler = EgressScheduler()
+    for room_id, weight in (('a', 2.0), ('b', 1.0)):
+        room = scheduler.rooms[room_id] = RoomQueue(room_id, weight, None)
+        room.channels.append(FakeChannel(room_id, [1000] * 6))
+
+    assert grant_order(scheduler, 6) == ['a', 'a', 'b', 'a', 'a', 'b']
+
+
+def test_scfq_charges_rooms_by_frame_size():
+    scheduler = EgressScheduler()
+    big = scheduler.rooms['big'] = RoomQueue('big', 1.0, None)
+    big.channels.append(FakeChannel('big', [4000] * 3))
+    small = scheduler.rooms['small'] = RoomQueue('small', 1.0, None)
+    small.channels.append(FakeChannel('small', [1000] * 8))
+
+    # A sala com frames 4x maiores é servida uma vez a cada quatro, sem inanição
+    assert grant_order(scheduler, 5) == ['small', 'small', 'small', 'big', 'small']
+
+
+def test_room_rates_and_weights_from_configuration():
+    async def run():
+        scheduler = EgressScheduler(room_rate=1000, room_rates={'a': 5000}, weights={'a': 3.0})
+        channels = [FakeChannel('a', [10]), FakeChannel('b', [10])]
+        for channel in channels:
+            scheduler.notify(channel)
+        await asyncio.sleep(0.01)
+        scheduler._task.cancel()
+        return scheduler, channels
+
+    scheduler, channels = asyncio.run(run())
+    assert scheduler.rooms['a'].bucket.rate == 5000
+    assert scheduler.rooms['a'].weight == 3.0
+    assert scheduler.rooms['b'].bucket.rate == 1000
+    assert scheduler.rooms['b'].weight == 1.0
+    assert all(channel.granted is not None for channel in channels)
+
+
+def test_run_survives_errors_and_notify_restarts_dead_task():
+    async def run():
+        scheduler = EgressScheduler()
+        failures = []
+        step = scheduler._step
+
+        async def flaky():
+            if not failures:
+                failures.append(True)
+                raise RuntimeError("falha")
+            await step()
+
+        scheduler._step = flaky
+        channel = FakeChannel('a', [10, 10])
+        scheduler.notify(channel)
+        await asyncio.sleep(0.1)
+        first = channel.granted
+
+        # Tarefa morta (ex.: cancelada por engano) é recriada pelo próximo notify
+        scheduler._task.cancel()
+        await asyncio.sleep(0)
+        channel.granted = None
+        scheduler.notify(channel)
+        await asyncio.sleep(0.01)
+        scheduler._task.cancel()
+        return failures, first, channel.granted
+
+    failures, first, second = asyncio.run(run())
+    assert failures and first is not None and second is not None
+
+
+def test_round_robin_only_advances_when_served():
+    scheduler = EgressScheduler()
+    room = scheduler.rooms['a'] = RoomQueue('a', 1.0, None)
+    first, second = FakeChannel('a', [10] * 2), FakeChannel('a', [10] * 2)
+    room.channels.extend([first, second])
+
+    # Consultar a sala sem conceder (uplink esgotado) não muda a vez
+    scheduler.global_bucket = TokenBucket(rate=1000, burst=100)
+    scheduler.global_bucket.tokens = 0
+    assert scheduler._select(scheduler.global_bucket.updated)[0] is None
+    assert room.channels == [first, second]
+
+    scheduler.global_bucket = None
+    (_, channel, _), _ = scheduler._select(0.0)
+    assert channel is first and room.channels == [second, first]
@@ -0,0 +1,38 @@
+from encoders import JpegEncoder
+from shared.protocol import FLAG_KEYFRAME, MSG_SCREEN_FRAME, MSG_TILE_FRAME, unpack_tiles
+from tiles import TileEncoder
+
+SIZE = (256, 128)
+
+
+def screen(value=0):
+    return bytes([value]) * (SIZE[0] * SIZE[1] * 4)
+
+
+def test_tile_output_size_changes_on_next_encode():
+    encoder = TileEncoder(output_size=SIZE)
+    encoder.encode(screen(), SIZE, 50)
+
+    encoder.set_output_size((128, 64))
+    # Pedido só gravado: a grade do frame em andamento não muda
+    assert encoder.output_size == SIZE and encoder.frame_size == SIZE
+
+    msg_type, flags, _ = encoder.encode(screen(1), SIZE, 50)
+    assert (msg_type, flags) == (MSG_SCREEN_FRAME, FLAG_KEYFRAME)
+    assert encoder.frame_size == (128, 64)
+
+    # Deltas seguintes usam a grade nova
+    changed = bytearray(screen(1))
+    changed[:4] = b'\xff\xff\xff\xff'
+    msg_type, _, payload = encoder.encode(bytes(changed), SIZE, 50)
+    assert msg_type == MSG_TILE_FRAME
+    assert unpack_tiles(payload)[:2] == (128, 64)
+
+
+def test_jpeg_output_size_changes_on_next_encode():
+    encoder = JpegEncoder(output_size=SIZE)
+    encoder.set_output_size((64, 32))
+    assert encoder.output_size == SIZE
+
+    encoder.encode(screen(), SIZE, 50)
+    assert encoder.output_size == (64, 32)
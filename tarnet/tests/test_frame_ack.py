@@ -0,0 +1,52 @@
+import asyncio
+import json
+import uuid
+
+from fanout import ClientChannel
+from registry import ClientEntry, HostEntry
+from server import TARNetServer
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, payload):
+        self.sent.append(json.loads(payload))
+
+
+def server_with_client():
+    server = TARNetServer()
+    host = HostEntry(str(uuid.uuid4()), RecordingSocket())
+    host.last_sequence = 100
+    server.hosts[host.host_id] = host
+    websocket = RecordingSocket()
+    client = ClientEntry('cliente', websocket, ClientChannel(websocket), host.room)
+    server.clients[client.client_id] = client
+    host.room.add_client(client)
+    return server, host, client
+
+
+def ack(server, client, **fields):
+    asyncio.run(server.handle_frame_ack(client.websocket, {'client_id': client.client_id, **fields}))
+
+
+def test_malformed_acks_are_dropped_and_metrics_still_render():
+    server, host, client = server_with_client()
+    for fields in ({'sequence': 'abc'}, {'sequence': True}, {'sequence': -1}, {'sequence': 2 ** 32},
+                   {'sequence': 5, 'render_fps': float('nan')}, {'sequence': 5, 'render_fps': '9'},
+                   {'sequence': 5, 'backlog': -1}, {'sequence': 5, 'dropped': 1.5}):
+        ack(server, client, **fields)
+
+    assert client.last_rendered is None and client.render_fps is None
+    assert host.websocket.sent == []
+    server.metrics.render()
+
+
+def test_valid_ack_updates_client_and_reaches_host():
+    server, host, client = server_with_client()
+    ack(server, client, sequence=90, render_fps=9.5, backlog=1, dropped=2)
+
+    assert (client.last_rendered, client.render_fps, client.render_backlog, client.render_dropped) == (90, 9.5, 1, 2)
+    assert host.websocket.sent[-1]['last_rendered'] == 90
+    assert 'tarnet_client_lag_frames{' in server.metrics.render()
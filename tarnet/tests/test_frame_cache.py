@@ -0,0 +1,78 @@
+import uuid
+
+from frame_cache import FrameCache
+from shared.protocol import (
+    FLAG_KEYFRAME, LAYER_FULL, LAYER_THUMB, MSG_SCREEN_FRAME, host_id_to_bytes, pack_frame,
+    unpack_header
+)
+
+
+def frame(host_id, size, keyframe=False, layer=LAYER_FULL):
+    message = pack_frame(MSG_SCREEN_FRAME, host_id_to_bytes(host_id), 0, 0.0, bytes(size),
+                         FLAG_KEYFRAME if keyframe else 0, layer)
+    return unpack_header(message), message
+
+
+def store(cache, host_id, size, keyframe=False, layer=LAYER_FULL):
+    header, message = frame(host_id, size, keyframe, layer)
+    cache.store(host_id, header, message)
+    return message
+
+
+def test_keyframe_starts_a_new_chain():
+    cache = FrameCache()
+    host = str(uuid.uuid4())
+
+    store(cache, host, 10)  # delta sem keyframe: não há o que cachear
+    assert cache.get(host) == (None, False)
+    key = store(cache, host, 100, keyframe=True)
+    delta = store(cache, host, 10)
+    assert cache.get(host) == ([key, delta], True)
+
+    new_key = store(cache, host, 50, keyframe=True)
+    assert cache.get(host) == ([new_key], True)
+    assert cache.total_bytes == len(new_key)
+
+
+def test_long_delta_chain_is_truncated():
+    cache = FrameCache(max_stream_bytes=300)
+    host = str(uuid.uuid4())
+
+    key = store(cache, host, 100, keyframe=True)
+    store(cache, host, 100)
+    store(cache, host, 100)
+
+    assert cache.get(host) == ([key], False)
+    assert cache.total_bytes == len(key)
+    # Incompleta: deltas seguintes não entram até o próximo keyframe
+    store(cache, host, 10)
+    assert cache.get(host) == ([key], False)
+
+
+def test_least_recent_hosts_are_evicted():
+    cache = FrameCache(max_bytes=500)
+    first, second, third = (str(uuid.uuid4()) for _ in range(3))
+
+    store(cache, first, 150, keyframe=True)
+    store(cache, second, 150, keyframe=True)
+    store(cache, first, 10)  # first passa a ser o mais recente
+    store(cache, third, 150, keyframe=True)
+
+    assert cache.get(second) == (None, False)
+    assert cache.get(first)[0] is not None and cache.get(third)[0] is not None
+    assert cache.evictions == 1
+    assert cache.total_bytes <= cache.max_bytes
+
+
+def test_remove_drops_one_layer_or_all():
+    cache = FrameCache()
+    host = str(uuid.uuid4())
+    store(cache, host, 100, keyframe=True)
+    store(cache, host, 20, keyframe=True, layer=LAYER_THUMB)
+
+    cache.remove(host, LAYER_THUMB)
+    assert cache.get(host, LAYER_THUMB) == (None, False)
+    assert cache.get(host)[0] is not None
+
+    cache.remove(host)
+    assert cache.streams == {} and cache.total_bytes == 0
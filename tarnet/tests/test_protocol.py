@@ -0,0 +1,62 @@
+import uuid
+
+from shared.protocol import (
+    FLAG_KEYFRAME, HEADER_SIZE, LAYER_THUMB, MAGIC, MSG_SCREEN_FRAME, MSG_TILE_FRAME,
+    host_id_from_bytes, host_id_to_bytes, is_keyframe, pack_frame, parse_layer,
+    parse_monitors, unpack_header
+)
+
+HOST_ID = str(uuid.uuid4())
+
+
+def test_pack_unpack_roundtrip():
+    message = pack_frame(MSG_TILE_FRAME, host_id_to_bytes(HOST_ID), 42, 1234.5, b'payload',
+                         FLAG_KEYFRAME, LAYER_THUMB)
+
+    header = unpack_header(message)
+    assert header.msg_type == MSG_TILE_FRAME
+    assert header.flags == FLAG_KEYFRAME
+    assert header.layer == LAYER_THUMB
+    assert host_id_from_bytes(header.host_id) == HOST_ID
+    assert header.sequence == 42
+    assert header.timestamp == 1234.5
+    assert message[HEADER_SIZE:] == b'payload'
+
+
+def test_sequence_wraps_at_32_bits():
+    message = pack_frame(MSG_SCREEN_FRAME, host_id_to_bytes(HOST_ID), 2**32 + 7, 0.0, b'')
+    assert unpack_header(message).sequence == 7
+
+
+def test_unpack_rejects_short_and_foreign_messages():
+    message = pack_frame(MSG_SCREEN_FRAME, host_id_to_bytes(HOST_ID), 1, 0.0, b'x')
+
+    assert unpack_header(message[:HEADER_SIZE - 1]) is None
+    assert unpack_header(b'XX' + message[len(MAGIC):]) is None
+    # Versão desconhecida
+    assert unpack_header(message[:2] + b'\x09' + message[3:]) is None
+
+
+def test_is_keyframe_reads_flags():
+    host_id = host_id_to_bytes(HOST_ID)
+    assert is_keyframe(pack_frame(MSG_SCREEN_FRAME, host_id, 1, 0.0, b'', FLAG_KEYFRAME))
+    assert not is_keyframe(pack_frame(MSG_SCREEN_FRAME, host_id, 1, 0.0, b''))
+
+
+def test_parse_layer_accepts_names_and_indexes_only():
+    assert parse_layer('thumb') == LAYER_THUMB
+    assert parse_layer(LAYER_THUMB) == LAYER_THUMB
+    for bad in (True, False, -1, 99, 1.0, 'tela', None):
+        assert parse_layer(bad) is None
+
+
+def test_parse_monitors_requires_integer_rects():
+    screen = {'left': -1920, 'top': 0, 'width': 1920, 'height': 1080}
+    assert parse_monitors([screen, {'width': 800, 'height': 600}]) == [
+        screen, {'left': 0, 'top': 0, 'width': 800, 'height': 600}
+    ]
+    assert parse_monitors([]) == []
+    for bad in ({**screen, 'width': 'abc'}, {**screen, 'height': None}, {**screen, 'width': 0},
+                {**screen, 'height': -5}, {**screen, 'left': 1.5}, {**screen, 'top': True}, 'tela'):
+        assert parse_monitors([screen, bad]) is None
+    assert parse_monitors({'left': 0}) is None
@@ -0,0 +1,30 @@
+from ratecontrol import RateController
+
+
+def finish_period(controller):
+    """Força o fim do período atual e roda a decisão"""
+    controller._period_start -= controller.update_period
+    return controller.update()
+
+
+def test_viewer_lag_counts_only_in_its_period():
+    controller = RateController(fps=10, quality=50)
+
+    controller.record_viewer_feedback(last_rendered=0, last_sent=100)
+    assert finish_period(controller)
+    assert controller.quality == 40
+
+    # Sem feedback novo, o atraso antigo não mantém a congestão
+    for _ in range(controller.stable_periods_to_increase):
+        finish_period(controller)
+    assert controller.quality == 40
+    assert controller.fps == 12
+
+
+def test_viewer_lag_keeps_the_worst_feedback_of_the_period():
+    controller = RateController(fps=10, quality=50)
+
+    controller.record_viewer_feedback(last_rendered=0, last_sent=100)
+    controller.record_viewer_feedback(last_rendered=99, last_sent=100)
+    assert finish_period(controller)
+    assert controller.quality == 40
@@ -0,0 +1,53 @@
+import uuid
+
+from recorder import SessionReader, SessionRecorder
+from shared.protocol import (
+    FLAG_KEYFRAME, LAYER_FULL, LAYER_THUMB, MSG_SCREEN_FRAME, host_id_to_bytes, pack_frame,
+    unpack_header
+)
+
+HOST_ID = str(uuid.uuid4())
+
+
+def frame(sequence, layer, keyframe=False):
+    message = pack_frame(MSG_SCREEN_FRAME, host_id_to_bytes(HOST_ID), sequence, float(sequence),
+                         b'x', FLAG_KEYFRAME if keyframe else 0, layer)
+    return unpack_header(message), message
+
+
+def test_drop_gate_is_per_layer(tmp_path):
+    recorder = SessionRecorder(str(tmp_path), max_pending=0)
+    recorder.record(HOST_ID, *frame(1, LAYER_FULL), 1.0)          # fila cheia: descarta
+    recorder.record(HOST_ID, *frame(2, LAYER_THUMB), 2.0)
+    assert recorder.waiting_keyframe == {(HOST_ID, LAYER_FULL), (HOST_ID, LAYER_THUMB)}
+
+    recorder.max_pending = 100
+    # Keyframe da miniatura não libera os deltas da camada cheia
+    recorder.record(HOST_ID, *frame(3, LAYER_THUMB, keyframe=True), 3.0)
+    recorder.record(HOST_ID, *frame(4, LAYER_FULL), 4.0)
+    assert recorder.waiting_keyframe == {(HOST_ID, LAYER_FULL)}
+    assert recorder.recorded_frames == 1 and recorder.dropped_frames == 3
+
+    recorder.record(HOST_ID, *frame(5, LAYER_FULL, keyframe=True), 5.0)
+    assert recorder.waiting_keyframe == set()
+    recorder.close()
+
+
+def test_replay_reads_batches_of_one_layer(tmp_path):
+    recorder = SessionRecorder(str(tmp_path))
+    for sequence in range(6):
+        layer = LAYER_FULL if sequence % 2 == 0 else LAYER_THUMB
+        recorder.record(HOST_ID, *frame(sequence, layer, keyframe=sequence < 2),
+                        100.0 + sequence)
+    recorder.close()
+
+    [session] = recorder.sessions()
+    with SessionReader(recorder.session_path(session['session'])) as reader:
+        frames = reader.frames(LAYER_FULL)
+        batch = reader.read_batch(frames, max_bytes=1)
+        assert [offset for offset, _ in batch] == [0.0]
+        batch += reader.read_batch(frames)
+        assert [offset for offset, _ in batch] == [0.0, 2.0, 4.0]
+        assert all(isinstance(message, bytes) for _, message in batch)
+        assert [unpack_header(message).sequence for _, message in batch] == [0, 2, 4]
+        assert reader.read_batch(frames) == []
@@ -0,0 +1,36 @@
+import asyncio
+import json
+import uuid
+
+from server import TARNetServer
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, payload):
+        self.sent.append(json.loads(payload))
+
+
+def register(monitors):
+    server = TARNetServer()
+    websocket = RecordingSocket()
+    host_id = str(uuid.uuid4())
+    registered = asyncio.run(server.register_host(websocket, {
+        'type': 'register_host', 'host_id': host_id, 'monitors': monitors
+    }))
+    return registered, server.hosts.get(host_id), websocket.sent
+
+
+def test_host_with_invalid_monitor_is_refused():
+    registered, host, sent = register([{'left': 0, 'top': 0, 'width': 'abc', 'height': None}])
+    assert registered is False and host is None
+    assert sent[0]['type'] == 'error' and sent[0]['message'].startswith("Monitores inválidos")
+
+
+def test_host_monitors_are_kept():
+    monitors = [{'left': 0, 'top': 0, 'width': 1920, 'height': 1080}]
+    registered, host, sent = register(monitors)
+    assert registered is True and host.monitors == monitors
+    assert sent[0]['type'] == 'host_registered'
@@ -0,0 +1,78 @@
+import uuid
+
+import pytest
+
+from shared.protocol import HEADER_SIZE, LAYER_THUMB, MSG_SCREEN_FRAME, host_id_to_bytes, unpack_header
+from shared.ring import DOORBELL, FrameRing
+
+HOST = host_id_to_bytes(str(uuid.uuid4()))
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing.create(size=1024)
+    yield ring
+    ring.close()
+
+
+def write(ring, sequence, size):
+    return ring.write_frame(MSG_SCREEN_FRAME, HOST, sequence, 1.5, bytes([sequence]) * size)
+
+
+def test_frames_round_trip_in_order(ring):
+    assert ring.read() is None
+    assert ring.write_frame(MSG_SCREEN_FRAME, HOST, 7, 1.5, b'abc', flags=1, layer=LAYER_THUMB)
+    assert write(ring, 8, 10)
+
+    message = ring.read()
+    header = unpack_header(message)
+    assert header.sequence == 7 and header.layer == LAYER_THUMB
+    assert message[HEADER_SIZE:] == b'abc'
+    assert ring.read()[HEADER_SIZE:] == bytes([8]) * 10
+    assert ring.read() is None and ring.pending() == 0
+
+
+def test_read_stops_at_doorbell_position(ring):
+    write(ring, 1, 10)
+    (until,) = DOORBELL.unpack(ring.doorbell())
+    write(ring, 2, 10)
+
+    assert unpack_header(ring.read(until)).sequence == 1
+    assert ring.read(until) is None
+    assert unpack_header(ring.read()).sequence == 2
+
+
+def test_full_ring_and_oversize_messages(ring):
+    assert write(ring, 0, ring.max_message) is None  # vai pelo WebSocket
+
+    written = 0
+    while write(ring, written, 100):
+        written += 1
+    assert written > 0 and write(ring, written, 100) is False
+
+    # Ler um registro libera espaço para o próximo
+    ring.read()
+    assert write(ring, written, 100)
+
+
+def test_records_wrap_to_the_start(ring):
+    sequence = 0
+    for _ in range(5):
+        # Registros de tamanho que não divide a capacidade forçam WRAP
+        for _ in range(3):
+            assert write(ring, sequence, 150)
+            sequence += 1
+        for expected in range(sequence - 3, sequence):
+            message = ring.read()
+            assert unpack_header(message).sequence == expected
+            assert message[HEADER_SIZE:] == bytes([expected]) * 150
+    assert ring.pending() == 0
+
+
+def test_reset_discards_unread_frames(ring):
+    write(ring, 1, 10)
+    ring.reset()
+    assert ring.read() is None
+    write(ring, 2, 10)
+    assert unpack_header(ring.read()).sequence == 2
+